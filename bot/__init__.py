@@ -1 +1,3 @@
-from .cli import run_bot
\ No newline at end of file
+from .cli import run_bot
+from .client import run_client
+from .server import run_server
\ No newline at end of file
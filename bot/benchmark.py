@@ -0,0 +1,120 @@
+"""
+Storage benchmark.
+Compares file size and save/load time of every compression codec on the
+current data, or on generated data with --contacts/--notes. Notes are
+measured as they are stored: one compressed shard file per user.
+
+    python -m bot.benchmark
+    python -m bot.benchmark --contacts 100000 --notes 500000
+"""
+
+import argparse
+import random
+import string
+import tempfile
+import time
+from pathlib import Path
+
+from bot.constants import USERS_DATA
+from bot.storage import CODECS, NotesShardStore, load_from_json, load_notes, read_json, write_json
+
+
+def generate_data(contacts: int, notes: int):
+    """
+    Generate serialized contacts and notes shaped like the real files.
+    """
+    rng = random.Random(42)
+    names = set()
+    while len(names) < contacts:
+        names.add("".join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 10))).capitalize())
+    names = sorted(names)
+
+    users = {
+        name: {
+            "name": name,
+            "phones": [f"380{rng.randrange(10**9):09d}"],
+            "birthday": f"{rng.randint(1, 28):02d}.{rng.randint(1, 12):02d}.{rng.randint(1950, 2010)}",
+            "email": f"{name.lower()}@mail.com",
+            "address": None,
+            "version": 1,
+        }
+        for name in names
+    }
+
+    words = ["call", "buy", "meet", "report", "milk", "bank", "project", "review", "tomorrow"]
+    tags = ["work", "home", "urgent", None]
+    user_notes = {}
+    for _ in range(notes):
+        notes_of_user = user_notes.setdefault(rng.choice(names), {})
+        notes_of_user[str(len(notes_of_user) + 1)] = {
+            "text": " ".join(rng.choices(words, k=rng.randint(3, 12))),
+            "tag": rng.choice(tags),
+            "version": 1,
+        }
+    return users, user_notes
+
+
+def measure(files: dict, codec: str, directory: Path) -> tuple:
+    """
+    Save and load {file name: data} files with a codec.
+    Returns (total size in bytes, save seconds, load seconds).
+    """
+    directory = directory / (codec or "plain")
+    directory.mkdir(parents=True)
+    paths = [directory / name for name in files]
+
+    start = time.perf_counter()
+    for file_path, data in zip(paths, files.values()):
+        write_json(data, file_path, codec)
+    save_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for file_path in paths:
+        read_json(file_path)
+    load_time = time.perf_counter() - start
+
+    return sum(file_path.stat().st_size for file_path in paths), save_time, load_time
+
+
+def note_shards(notes: dict, directory: Path) -> dict:
+    """
+    Split notes into the per-user shard files the notes store writes.
+    """
+    store = NotesShardStore(directory)
+    return {store.path(user_name).name: user_notes for user_name, user_notes in notes.items()}
+
+
+def main():
+    """
+    Run the benchmark and print a table per data file.
+    """
+    parser = argparse.ArgumentParser(description="Compare storage codecs")
+    parser.add_argument("--contacts", type=int, help="number of generated contacts")
+    parser.add_argument("--notes", type=int, default=0, help="number of generated notes")
+    options = parser.parse_args()
+
+    if options.contacts:
+        users, notes = generate_data(options.contacts, options.notes)
+    else:
+        users = load_from_json('users.json', USERS_DATA).to_dict()
+        notes = load_notes().to_dict()
+
+    with tempfile.TemporaryDirectory() as directory:
+        directory = Path(directory)
+        layouts = (
+            ("users", f"{len(users)} contacts", {"users.json": users}),
+            ("notes", f"{len(notes)} users' shards", note_shards(notes, directory)),
+        )
+        for title, description, files in layouts:
+            print(f"\n{title}: {description}")
+            print(f"{'codec':<8}{'size, KB':>12}{'ratio':>8}{'save, ms':>12}{'load, ms':>12}")
+            plain_size = None
+            for codec in (None, *CODECS):
+                size, save_time, load_time = measure(files, codec, directory / title)
+                plain_size = plain_size or size
+                print(f"{codec or 'plain':<8}{size / 1024:>12.1f}{plain_size / size:>8.2f}"
+                      f"{save_time * 1000:>12.1f}{load_time * 1000:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
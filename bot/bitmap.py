@@ -0,0 +1,83 @@
+from bot.constants import BITMAP_CHUNK_BITS
+
+
+class Bitmap:
+    """
+    Set of non-negative integers stored as bits.
+    The bits are split into fixed-size chunks kept as Python ints, and only
+    non-empty chunks are stored, so sparse sets stay small, single updates
+    touch one chunk and set operations run chunk by chunk in C.
+    """
+    __slots__ = ("chunks",)
+
+    def __init__(self, values=()):
+        """
+        Create a bitmap holding the given values.
+        """
+        self.chunks = {}
+        for value in values:
+            self.add(value)
+
+    @classmethod
+    def _from_chunks(cls, chunks: dict):
+        """
+        Create a bitmap from chunks, dropping the empty ones.
+        """
+        bitmap = cls()
+        bitmap.chunks = {number: bits for number, bits in chunks.items() if bits}
+        return bitmap
+
+    def add(self, value: int):
+        """
+        Add a value to the set.
+        """
+        number, bit = divmod(value, BITMAP_CHUNK_BITS)
+        self.chunks[number] = self.chunks.get(number, 0) | (1 << bit)
+
+    def discard(self, value: int):
+        """
+        Remove a value from the set if present.
+        """
+        number, bit = divmod(value, BITMAP_CHUNK_BITS)
+        bits = self.chunks.get(number, 0) & ~(1 << bit)
+        if bits:
+            self.chunks[number] = bits
+        else:
+            self.chunks.pop(number, None)
+
+    def __contains__(self, value: int):
+        number, bit = divmod(value, BITMAP_CHUNK_BITS)
+        return bool(self.chunks.get(number, 0) >> bit & 1)
+
+    def __len__(self):
+        return sum(bits.bit_count() for bits in self.chunks.values())
+
+    def __bool__(self):
+        return bool(self.chunks)
+
+    def __iter__(self):
+        """
+        Iterate over the values in ascending order.
+        """
+        for number in sorted(self.chunks):
+            bits = self.chunks[number]
+            base = number * BITMAP_CHUNK_BITS
+            while bits:
+                lowest = bits & -bits
+                yield base + lowest.bit_length() - 1
+                bits ^= lowest
+
+    def __and__(self, other):
+        small, large = sorted((self.chunks, other.chunks), key=len)
+        return Bitmap._from_chunks({number: bits & large[number]
+                                    for number, bits in small.items() if number in large})
+
+    def __or__(self, other):
+        chunks = dict(self.chunks)
+        for number, bits in other.chunks.items():
+            chunks[number] = chunks.get(number, 0) | bits
+        return Bitmap._from_chunks(chunks)
+
+    def __sub__(self, other):
+        return Bitmap._from_chunks({number: bits & ~other.chunks.get(number, 0)
+                                    for number, bits in self.chunks.items()})
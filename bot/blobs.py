@@ -0,0 +1,135 @@
+from array import array
+import mmap
+import sys
+import tempfile
+import threading
+
+from bot.constants import BLOB_COMPACT_MIN_GARBAGE, BLOB_COMPACT_RATIO
+
+
+class BlobStore:
+    """
+    Texts kept in an append-only temporary file and read through mmap on
+    demand, so they take disk cache instead of process memory.
+    Every text gets a number; a table of offsets and lengths maps numbers to
+    the file, so compaction can move texts without touching their owners.
+    Numbers are reference counted (see retain/release) and a released
+    text's space is reclaimed by compacting the file in a background thread
+    once enough of it is garbage.
+    """
+    def __init__(self):
+        """
+        Create an empty store backed by an anonymous temporary file.
+        """
+        self.file = tempfile.TemporaryFile()
+        self.size = 0
+        self.map = None
+        self.mapped = 0
+        self.offsets = array("Q")
+        self.lengths = array("Q")
+        self.refs = array("L")
+        self.free = []
+        self.garbage = 0
+        self.compacting = False
+        # Reentrant: a note released by garbage collection inside a locked
+        # section releases its text from the same thread
+        self.lock = threading.RLock()
+
+    def put(self, text: str) -> int:
+        """
+        Append a text and return its number, referenced once.
+        """
+        data = text.encode("utf-8")
+        with self.lock:
+            self.file.seek(self.size)
+            self.file.write(data)
+            if self.free:
+                key = self.free.pop()
+                self.offsets[key], self.lengths[key], self.refs[key] = self.size, len(data), 1
+            else:
+                key = len(self.offsets)
+                self.offsets.append(self.size)
+                self.lengths.append(len(data))
+                self.refs.append(1)
+            self.size += len(data)
+        return key
+
+    def get(self, key: int) -> str:
+        """
+        Read a text back.
+        """
+        with self.lock:
+            offset, length = self.offsets[key], self.lengths[key]
+            if offset + length > self.mapped:
+                self._remap()
+            return self.map[offset:offset + length].decode("utf-8")
+
+    def retain(self, key: int):
+        """
+        Add a reference to a text, for another owner sharing it.
+        """
+        with self.lock:
+            self.refs[key] += 1
+
+    def release(self, key: int):
+        """
+        Drop a reference to a text; its space becomes garbage with the last one.
+        """
+        with self.lock:
+            self.refs[key] -= 1
+            if self.refs[key]:
+                return
+            self.garbage += self.lengths[key]
+            self.free.append(key)
+            # No compaction while the interpreter exits: the store is about to
+            # go away, and a thread started now would never run
+            if (not self.compacting and self.garbage >= BLOB_COMPACT_MIN_GARBAGE
+                    and self.garbage >= self.size * BLOB_COMPACT_RATIO and not sys.is_finalizing()):
+                self.compacting = True
+                threading.Thread(target=self.compact, name="blob-compaction", daemon=True).start()
+
+    def _remap(self):
+        """
+        Map the whole file, after it grew or was replaced.
+        """
+        self.file.flush()
+        if self.map is not None:
+            self.map.close()
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+        self.mapped = self.size
+
+    def compact(self):
+        """
+        Copy the referenced texts into a new file, dropping the garbage.
+        """
+        with self.lock:
+            try:
+                if self.mapped < self.size:
+                    self._remap()
+                compacted = tempfile.TemporaryFile()
+                size = 0
+                for key, refs in enumerate(self.refs):
+                    if not refs:
+                        continue
+                    offset, length = self.offsets[key], self.lengths[key]
+                    compacted.write(self.map[offset:offset + length])
+                    self.offsets[key] = size
+                    size += length
+                if self.map is not None:
+                    self.map.close()
+                    self.map = None
+                self.file.close()
+                self.file, self.size, self.garbage = compacted, size, 0
+                self._remap()
+            finally:
+                self.compacting = False
+
+    def close(self):
+        """
+        Unmap and remove the file.
+        """
+        with self.lock:
+            if self.map is not None:
+                self.map.close()
+                self.map = None
+            self.file.close()
@@ -1,38 +1,77 @@
+from prompt_toolkit.patch_stdout import patch_stdout
 from bot.commands import handle_command
 from bot.utils import Log, log_result, print_help
-from bot.completer import session
-from bot.constants import NOTES_DATA, USERS_DATA
-from bot.storage import load_from_json, save_to_json
+from bot.completer import create_session
+from bot.constants import DEFAULT_PROFILE
+from bot.profiles import ProfileCache
+from bot.scheduler import BirthdayScheduler
+from bot.storage import reload_changed
+from bot.watcher import DataWatcher
 from time import sleep
 
-def run_bot():
+def start_background(profile):
+    """
+    Start the birthday reminders and the reloading of files changed on disk
+    for a profile. Returns the scheduler and the watcher, to stop them later.
+    """
+    def reload(paths):
+        with profile.lock.write():
+            for message in reload_changed(profile.book, profile.notes, paths, profile.directory):
+                Log.info(message)
+
+    scheduler = BirthdayScheduler(profile.book, notify=Log.info)
+    scheduler.start()
+    watcher = DataWatcher([profile.directory, profile.notes.store.directory], on_change=reload)
+    watcher.start()
+    return scheduler, watcher
+
+def run_bot(json_output: bool = False, profile_name: str = DEFAULT_PROFILE):
     """
     Run the interactive Personal Assistant bot loop:
     loads data, processes user commands, and saves before exit.
+    With json_output, command results are printed as JSON lines.
     """
 
-    book = load_from_json('users.json', USERS_DATA)
-    notes = load_from_json('notes.json', NOTES_DATA)
+    profiles = ProfileCache()
+    profiles.use(profile_name)
+    profile = profiles.current
+    session = create_session(profile.book, profile.notes)
+    scheduler, watcher = start_background(profile)
 
     print("\n\033[32;1m=== Welcome to your Personal Assistant Bot! ===\033[0m\n")
     print_help(args=[])
     
     try:
         while True:
-            user_input = session.prompt(">>> ")
+            # Reminders printed while waiting for input appear above the prompt
+            with patch_stdout(raw=True):
+                user_input = session.prompt(">>> ")
             if not user_input:
                 continue
 
-            result = handle_command(user_input, book=book, notes=notes)
+            result = handle_command(user_input, book=profile.book, notes=profile.notes, profiles=profiles)
             if result == "exit":
                 break
             elif result is not None:
-                log_result(result)
+                log_result(result, json_output)
+            # A rendered result may hold a snapshot of the book; dropping it
+            # keeps the next change from copying the data for a dead reader
+            result = None
+
+            # 'use' switched to another profile
+            if profiles.current is not profile:
+                watcher.stop()
+                scheduler.stop()
+                profile = profiles.current
+                session.completer.book, session.completer.notes = profile.book, profile.notes
+                scheduler, watcher = start_background(profile)
     except KeyboardInterrupt:
         Log.warning("Oops! Looks like you want to quit. Saving your data...")
         # a little delay just for fun
         sleep(1)
     finally:
-        save_to_json(book, 'users.json')
-        save_to_json(notes, 'notes.json')
+        watcher.stop()
+        scheduler.stop()
+        for message in profiles.save_all():
+            Log.warning(message)
         Log.success("See you next time!")
\ No newline at end of file
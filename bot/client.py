@@ -0,0 +1,56 @@
+import json
+import socket
+
+from bot.constants import SERVER_HOST, SERVER_PORT
+from bot.result import Result
+from bot.utils import Log, log_result
+
+
+def connect(host: str = SERVER_HOST, port: int = SERVER_PORT, socket_path: str = None) -> socket.socket:
+    """
+    Open a connection to a running bot server.
+    Uses a Unix socket if a path is given, otherwise TCP.
+    """
+    if socket_path:
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            connection.connect(socket_path)
+        except OSError:
+            connection.close()
+            raise
+        return connection
+    return socket.create_connection((host, port))
+
+
+def send_command(command: str, host: str = SERVER_HOST, port: int = SERVER_PORT,
+                 socket_path: str = None) -> dict:
+    """
+    Send one command to a running bot server and return its JSON response.
+    """
+    connection = connect(host, port, socket_path)
+    with connection, connection.makefile("rwb") as stream:
+        stream.write(json.dumps({"command": command}).encode("utf-8") + b"\n")
+        stream.flush()
+        return json.loads(stream.readline())
+
+
+def run_client(command: str, host: str = SERVER_HOST, port: int = SERVER_PORT,
+               socket_path: str = None, json_output: bool = False):
+    """
+    Run a single command against the server and print the result,
+    as JSON lines of the result rows if json_output is set.
+    """
+    try:
+        response = send_command(command, host, port, socket_path)
+    except OSError as e:
+        Log.error(f"Cannot connect to the bot server: {e}")
+        return
+
+    if not response.get("ok"):
+        Log.error(response.get("error"))
+    elif json_output:
+        result = response["result"]
+        log_result(Result(result["message"], result["rows"], result["severity"],
+                          next_page=result.get("next")), json_output)
+    else:
+        log_result(Result.from_dict(response["result"]))
@@ -1,7 +1,14 @@
-from bot.utils import Log, parse_input, print_help
+from bot.utils import Log, help_result, parse_input
 import prompt_toolkit
+from pathlib import Path
 from bot.decorators import input_error, user_exists
 from bot.models import AddressBook, Notes, Record
+from bot.query import QueryPlan, parse_query
+from bot.dedupe import find_duplicates
+from bot.profiles import ProfileCache, profile_directory, profile_names
+from bot.result import Result
+from bot.stats import collect_stats, format_size
+from bot.sync import sync_with_directory, sync_with_server
 from bot.constants import (
     ERROR_INSUFFICIENT_ARGS,
     ERROR_CONTACT_NOT_FOUND,
@@ -25,7 +32,16 @@ from bot.constants import (
     SUCCESS_ADDRESS_UPDATED,
     SUCCESS_ADDRESS_REMOVED,
     INFO_NO_CONTACTS,
+    ERROR_ALL_USAGE,
+    ERROR_SYNC_USAGE,
+    SERVER_HOST,
+    SERVER_PORT,
     DATE_FORMAT,
+    FUZZY_PREFIX,
+    FUZZY_MAX_DISTANCE,
+    FUZZY_TOP_K,
+    STATS_TOP_USERS,
+    READ_COMMANDS,
 )
 
 @input_error
@@ -35,7 +51,7 @@ def add_contact(args, book: AddressBook):
     Supports: just name, name + phone, or name + field (phone, birthday, email, address) + value.
     """
     if len(args) < 1:
-        return ERROR_INSUFFICIENT_ARGS
+        return Result.error(ERROR_INSUFFICIENT_ARGS)
 
     name = args[0]
 
@@ -46,9 +62,9 @@ def add_contact(args, book: AddressBook):
             # Capitalize name for consistency
             record = Record(name.capitalize())
             book.add_record(record)
-            return SUCCESS_CONTACT_ADDED
+            return Result.success(SUCCESS_CONTACT_ADDED)
         else:
-            return "Contact already exists"
+            return Result.info("Contact already exists")
 
     # Case 2: add John 1231231231 - create contact + add phone
     # Check if second arg is a phone number (12 digits)
@@ -63,7 +79,7 @@ def add_contact(args, book: AddressBook):
             message = SUCCESS_CONTACT_UPDATED
 
         record.add_phone(args[1])
-        return message
+        return Result.success(message)
 
     # Case 3: add John phone 1231231231 - add field to existing contact
     if len(args) >= 3:
@@ -78,68 +94,92 @@ def add_contact(args, book: AddressBook):
         if field in ("phone", "phones"):
             phone = args[2]
             record.add_phone(phone)
-            return SUCCESS_PHONE_ADDED if hasattr(record, 'phones') and len(record.phones) > 0 else SUCCESS_CONTACT_UPDATED
+            return Result.success(SUCCESS_PHONE_ADDED if hasattr(record, 'phones') and len(record.phones) > 0 else SUCCESS_CONTACT_UPDATED)
 
         elif field == "birthday":
             birthday = args[2]
             record.add_birthday(birthday)
-            return SUCCESS_BIRTHDAY_ADDED
+            return Result.success(SUCCESS_BIRTHDAY_ADDED)
 
         elif field == "email":
             email = args[2]
             record.add_email(email)
-            return SUCCESS_EMAIL_ADDED
+            return Result.success(SUCCESS_EMAIL_ADDED)
 
         elif field == "address":
             address = " ".join(args[2:])
             record.add_address(address)
-            return SUCCESS_ADDRESS_ADDED
+            return Result.success(SUCCESS_ADDRESS_ADDED)
 
         else:
-            return f"Unknown field: {field}. Available: phone, birthday, email, address"
+            return Result.error(f"Unknown field: {field}. Available: phone, birthday, email, address")
 
-    return ERROR_INSUFFICIENT_ARGS
+    return Result.error(ERROR_INSUFFICIENT_ARGS)
 
 
 @input_error
 def get_upcoming_birthdays(args, book: AddressBook):
     """
-    Ask user for a days range and fetch upcoming birthdays from the book.
-    Returns a formatted multiline string with names and congratulation dates or a fallback message.
+    Take a days range from args (or ask the user) and fetch upcoming birthdays from the book.
+    Returns a result with a row per contact and congratulation date or a fallback message.
     """
-    while True:
-        user_input = input("How many days ahead should you search? ")
+    if args:
+        days_limit = int(args[0])
+    else:
+        while True:
+            user_input = input("How many days ahead should you search? ")
+
+            try:
+                days_limit = int(user_input)
+                break
+            except ValueError:
+                Log.warning("Please enter a valid integer.")
 
-        try:
-            days_limit = int(user_input)
-            break
-        except ValueError:
-            Log.warning("Please enter a valid integer.")
-    
     birthdays = book.get_upcoming_birthdays(days_limit)
     if not birthdays:
-        return "There are no birthdays in the selected period."
-    birthdays_message = []
-    for b in birthdays:
-        birthdays_message.append(
-            f"{b['name']}, birthday {b['birthday']} – need to wish {b['congratulation_date']}"
-        )
-    return "\n".join(birthdays_message)
+        return Result.info("There are no birthdays in the selected period.")
+    return Result.success(rows=birthdays, formatter=_format_birthday)
 
 
-def show_all(book: AddressBook):
+def _format_birthday(b: dict) -> str:
     """
-    Return a formatted list of all contacts stored in the address book.
-    If the book is empty, returns an informational message instead.
+    Format one upcoming birthday entry.
     """
-    if not book.data:
-        return INFO_NO_CONTACTS
+    return f"{b['name']}, birthday {b['birthday']} – need to wish {b['congratulation_date']}"
 
-    result = []
-    for record in book.data.values():
-        result.append(str(record))
 
-    return "\n".join(result)
+@input_error
+def show_all(args, book: AddressBook):
+    """
+    Return all contacts stored in the address book, one row per contact.
+    With --sort, --after and --limit, returns a page of contacts in a
+    maintained order plus the command for the next page, which JSON output
+    gets as data.
+    If the book is empty, returns an informational message instead.
+    """
+    if not book.data:
+        return Result.info(INFO_NO_CONTACTS)
+    if not args:
+        return Result.success(rows=book.snapshot().values())
+
+    options = {"--sort": "name", "--after": None, "--limit": None}
+    if len(args) % 2 or any(option not in options for option in args[::2]):
+        return Result.error(ERROR_ALL_USAGE)
+    options.update(zip(args[::2], args[1::2]))
+    order = options["--sort"].lower()
+    limit = options["--limit"]
+    if limit is not None:
+        if not limit.isdigit() or int(limit) < 1:
+            raise ValueError("The limit must be a positive number")
+        limit = int(limit)
+
+    records, cursor = book.page(order, options["--after"], limit)
+    if not records:
+        return Result.info("No more contacts.")
+    if not cursor:
+        return Result.success(rows=records)
+    return Result.success(f"Next page: all --sort {order} --after {cursor} --limit {limit}", rows=records,
+                          next_page={"sort": order, "after": cursor, "limit": limit})
 
 
 @input_error
@@ -147,17 +187,17 @@ def show_all(book: AddressBook):
 def show_contact(args, book: AddressBook, notes: Notes):
     """
     Show full info about a contact or a specific field for a given name.
-    Supports fields: phone, birthday, email, address; returns formatted text.
+    Supports fields: phone, birthday, email, address; returns a result.
     """
     name = args[0]
     record = book.find(name)
 
     if record is None:
-        return ERROR_CONTACT_NOT_FOUND
+        return Result.warning(ERROR_CONTACT_NOT_FOUND)
 
     # If only name provided, show all information
     if len(args) == 1:
-        return str(record)
+        return Result.success(rows=[record])
 
     # If field specified, show only that field
     stored_name = record.name.value
@@ -165,110 +205,127 @@ def show_contact(args, book: AddressBook, notes: Notes):
 
     if field in ("phone", "phones"):
         if not record.phones:
-            return f"{stored_name}: no phone numbers"
+            return Result.info(f"{stored_name}: no phone numbers")
         phones = ", ".join(p.value for p in record.phones)
-        return f"{stored_name} (phones): {phones}"
+        return Result.success(f"{stored_name} (phones): {phones}")
 
     elif field == "birthday":
         if not record.birthday:
-            return f"{stored_name}: no birthday"
-        return f"{stored_name} (birthday): {record.birthday.value.strftime(DATE_FORMAT)}"
+            return Result.info(f"{stored_name}: no birthday")
+        return Result.success(f"{stored_name} (birthday): {record.birthday.value.strftime(DATE_FORMAT)}")
 
     elif field == "email":
         if not record.email:
-            return f"{stored_name}: no email"
-        return f"{stored_name} (email): {record.email.value}"
+            return Result.info(f"{stored_name}: no email")
+        return Result.success(f"{stored_name} (email): {record.email.value}")
 
     elif field == "address":
         if not record.address:
-            return f"{stored_name}: no address"
-        return f"{stored_name} (address): {record.address.value}"
+            return Result.info(f"{stored_name}: no address")
+        return Result.success(f"{stored_name} (address): {record.address.value}")
 
     else:
-        return f"Unknown field: {field}. Available: phone, birthday, email, address"
+        return Result.error(f"Unknown field: {field}. Available: phone, birthday, email, address")
 
 
+def _take_limit(args) -> tuple:
+    """
+    Split a '--limit N' option off the arguments.
+    Returns the other arguments and N, or None without the option.
+    """
+    args = list(args)
+    if "--limit" not in args:
+        return args, None
+    i = args.index("--limit")
+    limit = args[i + 1] if i + 1 < len(args) else ""
+    if not limit.isdigit() or int(limit) < 1:
+        raise ValueError("The limit must be a positive number")
+    del args[i:i + 2]
+    return args, int(limit)
+
 @input_error
 def find_contacts(args, book: AddressBook):
     """
     Search contacts in the address book by substring in all fields or a specific field.
-    Returns formatted matches or a message if nothing is found.
+    Matches in all fields are ranked by relevance; --limit N keeps the best N.
+    Returns the matching records as rows or a message if nothing is found.
     """
+    args, limit = _take_limit(args)
     if len(args) < 1:
-        return ERROR_INSUFFICIENT_ARGS
+        return Result.error(ERROR_INSUFFICIENT_ARGS)
+
+    # Field query: find name:jo email:@gmail.com bday:05 [--explain]
+    query_args = [arg for arg in args if arg != "--explain"]
+    predicates = parse_query(query_args)
+    if predicates:
+        plan = QueryPlan(book, predicates)
+        results = plan.execute()[:limit]
+        explain = plan.explain() if len(query_args) < len(args) else None
+        if not results:
+            not_found = f"No contacts found matching '{' '.join(query_args)}'"
+            return Result.warning("\n".join(filter(None, (explain, not_found))))
+        return Result.success(explain, rows=results)
 
     search_string = args[0].lower()
 
-    # Case 1: find search_string - search all fields
-    if len(args) == 1:
-        results = []
-        for record in book.data.values():
-            # Search in name
-            if search_string in record.name.value.lower():
-                results.append(record)
-                continue
-
-            # Search in phones
-            if any(search_string in phone.value for phone in record.phones):
-                results.append(record)
-                continue
-
-            # Search in birthday
-            if record.birthday and search_string in record.birthday.value.strftime(DATE_FORMAT):
-                results.append(record)
-                continue
-
-            # Search in email
-            if record.email and search_string in record.email.value.lower():
-                results.append(record)
-                continue
-
-            # Search in address
-            if record.address and search_string in record.address.value.lower():
-                results.append(record)
-                continue
+    # Fuzzy search: find ~jhon [distance]
+    if search_string.startswith(FUZZY_PREFIX):
+        name = search_string[len(FUZZY_PREFIX):]
+        if not name:
+            return Result.error(ERROR_INSUFFICIENT_ARGS)
+        max_distance = int(args[1]) if len(args) > 1 else FUZZY_MAX_DISTANCE
+        results = book.fuzzy_find(name, max_distance, limit or FUZZY_TOP_K)
+        if not results:
+            return Result.warning(f"No contacts found similar to '{name}'")
+        return Result.success(rows=results)
 
+    # Case 1: find search_string - search all fields, the best matches first
+    if len(args) == 1:
+        results = book.search(search_string, limit)
         if not results:
-            return f"No contacts found matching '{args[0]}'"
+            return Result.warning(f"No contacts found matching '{args[0]}'")
+
+        return Result.success(rows=results)
 
-        return "\n".join(str(record) for record in results)
+    # Read from a frozen view so concurrent changes cannot tear the results
+    records = book.snapshot().values()
 
     # Case 2: find search_string field - search specific field
     field = args[1].lower()
     results = []
 
     if field in ("phone", "phones"):
-        for record in book.data.values():
+        for record in records:
             if any(search_string in phone.value for phone in record.phones):
                 results.append(record)
 
     elif field == "birthday":
-        for record in book.data.values():
+        for record in records:
             if record.birthday and search_string in record.birthday.value.strftime(DATE_FORMAT):
                 results.append(record)
 
     elif field == "email":
-        for record in book.data.values():
+        for record in records:
             if record.email and search_string in record.email.value.lower():
                 results.append(record)
 
     elif field == "address":
-        for record in book.data.values():
+        for record in records:
             if record.address and search_string in record.address.value.lower():
                 results.append(record)
 
     elif field == "name":
-        for record in book.data.values():
+        for record in records:
             if search_string in record.name.value.lower():
                 results.append(record)
 
     else:
-        return f"Unknown field: {field}. Available: name, phone, birthday, email, address"
+        return Result.error(f"Unknown field: {field}. Available: name, phone, birthday, email, address")
 
     if not results:
-        return f"No contacts found with '{args[0]}' in {field}"
+        return Result.warning(f"No contacts found with '{args[0]}' in {field}")
 
-    return "\n".join(str(record) for record in results)
+    return Result.success(rows=results[:limit])
 
 @input_error
 @user_exists
@@ -280,10 +337,35 @@ def delete_contact(args, book: AddressBook, notes: Notes):
     name = args[0]
     record = book.find(name)
     if record is None:
-        return ERROR_CONTACT_NOT_FOUND
+        return Result.warning(ERROR_CONTACT_NOT_FOUND)
 
     book.delete(name)
-    return SUCCESS_CONTACT_DELETED
+    return Result.success(SUCCESS_CONTACT_DELETED)
+
+@input_error
+def dedupe_contacts(args, book: AddressBook, notes: Notes):
+    """
+    Show likely duplicate contacts, or merge two of them with 'merge <keep> <remove>'.
+    Merging moves the removed contact's phones, missing fields and notes.
+    """
+    if args and args[0].lower() == "merge":
+        if len(args) < 3:
+            return Result.error(ERROR_INSUFFICIENT_ARGS)
+        keep, remove = args[1], args[2]
+        record = book.merge_contacts(keep, remove)
+        moved = notes.move_notes(remove, record.name.value)
+        return Result.success(f"'{remove}' merged into '{record.name.value}', {moved} note(s) moved.")
+
+    duplicates = find_duplicates(book)
+    if not duplicates:
+        return Result.info("No duplicates found.")
+
+    rows = [{"first": first, "second": second, "reasons": reasons} for first, second, reasons in duplicates]
+    return Result.success(
+        "Possible duplicates, use 'dedupe merge <keep> <remove>' to merge a pair:",
+        rows=rows,
+        formatter=lambda row: f"{'':<4}{row['first']} + {row['second']}: {', '.join(row['reasons'])}",
+    )
 
 @input_error
 @user_exists
@@ -293,7 +375,7 @@ def update_contact(args, book: AddressBook, notes=Notes):
     Expects: name, field name, and new value; returns a status message.
     """
     if len(args) < 3:
-        return ERROR_INSUFFICIENT_ARGS
+        return Result.error(ERROR_INSUFFICIENT_ARGS)
 
     name = args[0]
     field = args[1].lower()
@@ -301,38 +383,36 @@ def update_contact(args, book: AddressBook, notes=Notes):
     record = book.find(name)
 
     if record is None:
-        return ERROR_CONTACT_NOT_FOUND
+        return Result.warning(ERROR_CONTACT_NOT_FOUND)
 
     if field in ("phone", "phones"):
         try:
             old_phone = args[2]
             new_phone = args[3]
         except IndexError:
-            return "Please enter command arguments"
+            return Result.error("Please enter command arguments")
         
-        for i, phone_obj in enumerate(record.phones):
-            if phone_obj.value == old_phone:
-                record.phones[i] = phone_obj.__class__(new_phone)
-                return SUCCESS_PHONE_UPDATED
-        return ERROR_PHONE_NOT_FOUND
+        if record.edit_phone(old_phone, new_phone):
+            return Result.success(SUCCESS_PHONE_UPDATED)
+        return Result.warning(ERROR_PHONE_NOT_FOUND)
 
     elif field == "birthday":
         new_birthday = args[2]
         record.add_birthday(new_birthday)
-        return SUCCESS_BIRTHDAY_UPDATED
+        return Result.success(SUCCESS_BIRTHDAY_UPDATED)
 
     elif field == "email":
         new_email = args[2]
         record.add_email(new_email)
-        return SUCCESS_EMAIL_UPDATED
+        return Result.success(SUCCESS_EMAIL_UPDATED)
 
     elif field == "address":
         new_address = " ".join(args[2:])
         record.add_address(new_address)
-        return SUCCESS_ADDRESS_UPDATED
+        return Result.success(SUCCESS_ADDRESS_UPDATED)
 
     else:
-        return f"Unknown field: {field}. Available: phone, birthday, email, address"
+        return Result.error(f"Unknown field: {field}. Available: phone, birthday, email, address")
 
 @input_error
 @user_exists
@@ -342,16 +422,16 @@ def remove_field(args, book: AddressBook, notes: Notes):
     Supports removing phone, birthday, email, or address, based on args.
     """
     if len(args) < 1:
-        return ERROR_INSUFFICIENT_ARGS
+        return Result.error(ERROR_INSUFFICIENT_ARGS)
 
     name = args[0]
 
     # Case 1: remove John - delete entire contact
     if len(args) == 1:
         if book.delete(name):
-            return SUCCESS_CONTACT_DELETED
+            return Result.success(SUCCESS_CONTACT_DELETED)
         else:
-            return ERROR_CONTACT_NOT_FOUND
+            return Result.warning(ERROR_CONTACT_NOT_FOUND)
 
     # Case 2: remove John field [value] - remove specific field
     field = args[1].lower()
@@ -359,141 +439,117 @@ def remove_field(args, book: AddressBook, notes: Notes):
     record = book.find(name)
 
     if record is None:
-        return ERROR_CONTACT_NOT_FOUND
+        return Result.warning(ERROR_CONTACT_NOT_FOUND)
 
     if field in ("phone", "phones"):
         if len(args) < 3:
-            return ERROR_INSUFFICIENT_ARGS
+            return Result.error(ERROR_INSUFFICIENT_ARGS)
         phone = args[2]
         if record.remove_phone(phone):
-            return SUCCESS_PHONE_REMOVED
+            return Result.success(SUCCESS_PHONE_REMOVED)
         else:
-            return ERROR_PHONE_NOT_FOUND
+            return Result.warning(ERROR_PHONE_NOT_FOUND)
 
     elif field == "birthday":
         if record.remove_birthday():
-            return SUCCESS_BIRTHDAY_REMOVED
+            return Result.success(SUCCESS_BIRTHDAY_REMOVED)
         else:
-            return ERROR_BIRTHDAY_NOT_FOUND
+            return Result.warning(ERROR_BIRTHDAY_NOT_FOUND)
 
     elif field == "email":
         if record.remove_email():
-            return SUCCESS_EMAIL_REMOVED
+            return Result.success(SUCCESS_EMAIL_REMOVED)
         else:
-            return ERROR_EMAIL_NOT_FOUND
+            return Result.warning(ERROR_EMAIL_NOT_FOUND)
 
     elif field == "address":
         if record.remove_address():
-            return SUCCESS_ADDRESS_REMOVED
+            return Result.success(SUCCESS_ADDRESS_REMOVED)
         else:
-            return ERROR_ADDRESS_NOT_FOUND
+            return Result.warning(ERROR_ADDRESS_NOT_FOUND)
 
     else:
-        return f"Unknown field: {field}. Available: phone, birthday, email, address"
+        return Result.error(f"Unknown field: {field}. Available: phone, birthday, email, address")
 
 @input_error
 @user_exists
-def add_note(args, book: AddressBook, notes: Notes) -> str:
+def add_note(args, book: AddressBook, notes: Notes) -> Result:
     """
-    Create a new note for a user, optionally with a 'tag=...' prefix.
+    Create a new note for a user, optionally with 'tag=...' prefixes.
+    Several tags can be given as repeated or comma-separated 'tag=' prefixes.
     Returns a message with the newly created note ID.
     """
     user_name, *text_parts = args
     
-    tag = None
-    note_text_parts = []
-    
-    if text_parts:
-        parts = text_parts[0].split("=", 1) 
-        
-        if len(parts) == 2 and parts[0] == "tag":
-            tag = parts[1]
-            note_text_parts = text_parts[1:]
-        else:
-            note_text_parts = text_parts
-    else:
-        note_text_parts = text_parts
+    tags = []
+    while text_parts and text_parts[0].startswith("tag="):
+        tags.extend(text_parts.pop(0)[len("tag="):].split(","))
 
-    note_text = " ".join(note_text_parts)
-    note_id = notes.add_note(user_name, note_text, tag) 
+    note_text = " ".join(text_parts)
+    note_id = notes.add_note(user_name, note_text, tags)
 
-    return f"A new note with ID {note_id} for '{user_name}' has been added."
+    return Result.success(f"A new note with ID {note_id} for '{user_name}' has been added.")
 
 @input_error
 @user_exists
 def edit_note(args, book: AddressBook, notes: Notes):
     """
     Edit text of an existing note for a given user and note ID.
-    Prompts user with the current text as default and saves the updated version.
+    Uses the text from args if given, otherwise prompts with the current text as default.
     """
-    user_name, note_id  = args
-    all_user_notes = notes.get_all_user_notes(user_name)
-    editing_note = all_user_notes.get(note_id, {})
-    text_for_edit = editing_note.get("text", "")
-    new_text = prompt_toolkit.prompt("Enter the new note text: ", default=text_for_edit)
+    user_name, note_id, *text_parts = args
+    if text_parts:
+        new_text = " ".join(text_parts)
+    else:
+        editing_note = notes.get_note(user_name, note_id)
+        text_for_edit = editing_note.text if editing_note else ""
+        new_text = prompt_toolkit.prompt("Enter the new note text: ", default=text_for_edit)
     
     note_id = notes.edit_note(user_name, note_id, new_text)
     if not note_id:
-        return "The note was not edited, check the username and note ID."
-    return f"The note #{note_id} for '{user_name}' has been updated."
+        return Result.warning("The note was not edited, check the username and note ID.")
+    return Result.success(f"The note #{note_id} for '{user_name}' has been updated.")
 
 @input_error
-def find_notes(args, notes: Notes) -> str:
+def find_notes(args, notes: Notes) -> Result:
     """
-    Search notes by a text fragment across all users.
-    Returns a grouped, formatted list of matches or a not-found message.
+    Search notes by a text fragment, or with --regex by a regular expression,
+    across all users. With --limit N, stops after N matches.
+    Returns the matching notes as rows or a not-found message.
     """
-    note_part = " ".join(args)
+    args, limit = _take_limit(args)
+    regex = bool(args) and args[0] == "--regex"
+    note_part = " ".join(args[1:] if regex else args)
 
-    search_result = notes.find_notes(note_part)
+    if regex:
+        search_result = notes.search_notes(note_part, limit)
+    else:
+        search_result = notes.find_notes(note_part, limit)
     if not len(search_result):
-        return f"'{note_part}' not found in any notes."
+        return Result.warning(f"'{note_part}' not found in any notes.")
 
-    search_message = "Here are the search matches:\n"
-    for user_name, notes_list in search_result.items():
-        search_message += f"{'':<4}{user_name}: \n"
-        
-        for note in notes_list:
-            text = note.get("text", "")
-            tag = note.get("tag")
-            
-            note_display = ""
-            if tag:
-                note_display += f"[Tag: {tag}] "
-            
-            note_display += f"#{note['id']}: {text}"
-            
-            search_message += f"{'':<8}{note_display}\n"
-
-    return search_message
+    rows = [{"user": user_name, **note} for user_name, notes_list in search_result.items() for note in notes_list]
+    return Result.success("Here are the search matches:", rows=rows,
+                          formatter=lambda note: f"{'':<4}{note['user']}: {_format_user_note(note).lstrip()}")
 
 @input_error
 @user_exists
-def all_user_notes(args, book: AddressBook, notes: Notes) -> str:
+def all_user_notes(args, book: AddressBook, notes: Notes) -> Result:
     """
-    Return all notes for a specific user in a readable list.
-    Each note line includes optional tag, ID and text.
+    Return all notes for a specific user, one row per note.
+    Each note line includes optional tags, ID and text.
     """
     user_name = args[0]
     user_notes = notes.get_all_user_notes(user_name)
 
-    notes_message = f"Here are all the notes from user '{user_name}':\n"
-    for note_id, note_data in user_notes.items():
-        text = note_data.get("text", "")
-        tag = note_data.get("tag")
-
-        note_display = ""
-        if tag:
-            note_display += f"[Tag: {tag}] "
-            
-        note_display += f"#{note_id}: {text}"
-        notes_message += f"{'':<4}{note_display}\n"
-
-    return notes_message
+    rows = [{"user": user_name, "id": note_id, "text": note.text, "tags": note.tags}
+            for note_id, note in user_notes.items()]
+    return Result.success(f"Here are all the notes from user '{user_name}':", rows=rows,
+                          formatter=_format_user_note)
 
 @input_error
 @user_exists
-def delete_note(args, book: AddressBook, notes: Notes) -> str:
+def delete_note(args, book: AddressBook, notes: Notes) -> Result:
     """
     Delete a specific note for a user by note ID.
     Returns a success message or an error if the note/user is invalid.
@@ -501,9 +557,18 @@ def delete_note(args, book: AddressBook, notes: Notes) -> str:
     user_name, note_id = args
     is_note_deleted = notes.delete_note(user_name, note_id)
     if not is_note_deleted:
-        return "The note was not deleted, check the username and note ID."
+        return Result.warning("The note was not deleted, check the username and note ID.")
+
+    return Result.success(f"The note for '{user_name}' has been deleted.")
 
-    return f"The note for '{user_name}' has been deleted."
+
+def _format_user_note(note_info: dict) -> str:
+    """
+    Format a note of a known user: optional tags, note ID and text.
+    """
+    tags = note_info.get('tags')
+    tag_display = f"[Tag: {', '.join(tags)}] " if tags else ""
+    return f"{'':<4}{tag_display}#{note_info.get('id', '?')}: {note_info.get('text', '')}"
 
 
 def _format_note_output(note_info: dict) -> str:
@@ -515,70 +580,181 @@ def _format_note_output(note_info: dict) -> str:
     note_id = note_info.get('id', '?')
     text = note_info.get('text', '')
     
-    return f"{'':<4}User: {user}, #{note_id}: {text}\n"
+    return f"{'':<4}User: {user}, #{note_id}: {text}"
 
 
 @input_error
-def find_notes_by_tag(args, notes: Notes) -> str:
+def find_notes_by_tag(args, notes: Notes) -> Result:
     """
-    Find notes grouped by tag and return those matching the given tag.
-    Shows all notes under that tag or a message if none exist.
+    Find notes matching a tag or a boolean tag expression (AND, OR, NOT).
+    Shows all matching notes or a message if none exist.
     """
-    tag_to_find = args[0]
+    tag_to_find = " ".join(args)
     
-    all_notes_by_tag = notes.group_notes_by_tag()
+    found_notes = notes.find_by_tags(tag_to_find)
 
-    if tag_to_find not in all_notes_by_tag:
-        return f"Notes with tag '{tag_to_find}' not found."
+    if not found_notes:
+        return Result.warning(f"Notes with tag '{tag_to_find}' not found.")
 
-    search_message = f"Found notes with tag '{tag_to_find}':\n"
-    
-    for note_info in all_notes_by_tag[tag_to_find]:
-        search_message += _format_note_output(note_info)
-    
-    return search_message
+    return Result.success(f"Found notes with tag '{tag_to_find}':", rows=found_notes,
+                          formatter=_format_note_output)
 
-def sort_notes_by_tag(notes: Notes) -> str:
+def show_tag_stats(notes: Notes) -> Result:
+    """
+    Show every tag with the number of notes that carry it.
+    """
+    stats = notes.tag_stats()
+    if not stats:
+        return Result.info("No tags found.")
+
+    width = max(len(tag) for tag, _ in stats)
+    rows = [{"tag": tag, "count": count} for tag, count in stats]
+    return Result.success("Notes per tag:", rows=rows,
+                          formatter=lambda row: f"{'':<4}{row['tag']:<{width}}  {row['count']}")
+
+def sort_notes_by_tag(notes: Notes) -> Result:
     """
     Group all notes by their tags and show them in sorted tag order.
-    Returns a multiline string with sections per tag and formatted notes.
+    Returns a result with one row per tag holding its notes.
     """
     all_notes_by_tag = notes.group_notes_by_tag()
 
     if not all_notes_by_tag:
-        return "No notes found."
+        return Result.info("No notes found.")
 
-    sorted_tags = sorted(all_notes_by_tag.keys())
+    rows = [{"tag": tag, "notes": all_notes_by_tag[tag]} for tag in sorted(all_notes_by_tag)]
+    return Result.success("All notes, sorted by tag:", rows=rows, formatter=_format_tag_group)
 
-    search_message = "All notes, sorted by tag:\n"
+def _format_tag_group(row: dict) -> str:
+    """
+    Format a tag heading followed by the notes with that tag.
+    """
+    lines = [f"\n  [Tag: {row['tag']}]"]
+    lines.extend(_format_note_output(note_info) for note_info in row["notes"])
+    return "\n".join(lines)
 
-    for tag in sorted_tags:
-        search_message += f"\n  [Tag: {tag}]\n"
-        
-        for note_info in all_notes_by_tag[tag]:
-            search_message += _format_note_output(note_info)
-    
-    return search_message
+@input_error
+def use_profile(args, profiles: ProfileCache) -> Result:
+    """
+    Switch to another profile (address book), loading it if needed,
+    or list the profiles when none is given.
+    """
+    if profiles is None:
+        return Result.warning("Profiles can only be switched in the interactive mode.")
+    if not args:
+        rows = [{"profile": name, "current": name == profiles.current.name, "loaded": name in profiles.loaded}
+                for name in profile_names()]
+        return Result.success("Profiles (* in use):", rows=rows, formatter=_format_profile)
+
+    name = args[0].lower()
+    conflicts = profiles.use(name)
+    message = f"Using profile '{name}' with {len(profiles.current.book)} contact(s)."
+    if conflicts:
+        return Result.warning("\n".join([message, *conflicts]))
+    return Result.success(message)
 
-def handle_command(user_input: str, book: AddressBook, notes: Notes):
+def _format_profile(row: dict) -> str:
+    """
+    Format a profile name, marking the current and the loaded ones.
+    """
+    marker = "*" if row["current"] else " "
+    loaded = " (loaded)" if row["loaded"] else ""
+    return f"{'':<4}{marker} {row['profile']}{loaded}"
+
+@input_error
+def sync_data(args, book: AddressBook, notes: Notes) -> Result:
+    """
+    Sync the contacts and notes with another profile or data directory, or
+    with a running bot server (--socket, or --host and --port).
+    Only differing contacts and notes are exchanged, in both directions.
+    """
+    if not args:
+        return Result.error(ERROR_SYNC_USAGE)
+
+    if args[0].startswith("--"):
+        options = {"--socket": None, "--host": SERVER_HOST, "--port": str(SERVER_PORT)}
+        if len(args) % 2 or any(option not in options for option in args[::2]):
+            return Result.error(ERROR_SYNC_USAGE)
+        options.update(zip(args[::2], args[1::2]))
+        if not options["--port"].isdigit():
+            raise ValueError("The port must be a number")
+        try:
+            messages, conflicts = sync_with_server(book, notes, options["--host"], int(options["--port"]),
+                                                   options["--socket"])
+        except OSError as e:
+            return Result.error(f"Cannot sync with the bot server: {e}")
+    else:
+        target = " ".join(args)
+        directory = Path(target).expanduser()
+        if not directory.is_dir():
+            if target.lower() not in profile_names():
+                raise ValueError(f"No profile or data directory '{target}'")
+            directory = profile_directory(target.lower())
+        if notes.store is not None and directory.resolve() == notes.store.directory.parent.resolve():
+            raise ValueError("This is the data being synced, choose another profile or directory")
+        messages, conflicts = sync_with_directory(book, notes, directory)
+
+    if not messages:
+        messages = ["Already in sync."]
+    if conflicts:
+        return Result.warning("\n".join(messages + conflicts))
+    return Result.success("\n".join(messages))
+
+def show_stats(book: AddressBook, notes: Notes) -> Result:
+    """
+    Show what the bot holds: counts, memory of data and indexes,
+    data file sizes and the time of the last load and save.
+    """
+    return Result.success(rows=[collect_stats(book, notes)], formatter=_format_stats)
+
+def _format_stats(stats: dict) -> str:
+    """
+    Format the collected statistics as indented sections.
+    """
+    lines = [f"Contacts: {stats['contacts']}", f"Notes: {stats['notes']}"]
+    per_user = sorted(stats["notes per user"].items(), key=lambda item: (-item[1], item[0]))
+    for user_name, count in per_user[:STATS_TOP_USERS]:
+        lines.append(f"{'':<4}{user_name}: {count}")
+    if len(per_user) > STATS_TOP_USERS:
+        lines.append(f"{'':<4}... and {len(per_user) - STATS_TOP_USERS} more users")
+    if stats["users with notes not loaded"]:
+        lines.append(f"{'':<4}not loaded yet: notes of {stats['users with notes not loaded']} users")
+
+    lines.append("Memory:")
+    for name, size in stats["memory"].items():
+        lines.append(f"{'':<4}{name:<20}{format_size(size):>12}")
+    lines.append("Files:")
+    for name, size in stats["files"].items():
+        lines.append(f"{'':<4}{name:<20}{format_size(size):>12}")
+    lines.append("Last load/save:")
+    for operation, seconds in stats["timings"].items():
+        lines.append(f"{'':<4}{operation:<20}{seconds * 1000:>9.1f} ms")
+    return "\n".join(lines)
+
+def handle_command(user_input: str, book: AddressBook, notes: Notes, profiles: ProfileCache = None):
     """
     Parse raw user input into a command and its args, then dispatch it.
     Uses a mapping of command names to handler functions for contacts and notes.
+    Profiles can only be switched if the loaded profiles are given.
     """
     command, *args = parse_input(user_input)
 
     commands = {
-        "hello": lambda: "How can I help you?",
-        "help": lambda: print_help(args),
+        "hello": lambda: Result.success("How can I help you?"),
+        "help": lambda: help_result(args),
         # book commands
         "add": lambda: add_contact(args, book),
-        "all": lambda: show_all(book),
+        "all": lambda: show_all(args, book),
         "birthdays": lambda: get_upcoming_birthdays(args, book),
         "show": lambda: show_contact(args, book=book, notes=notes),
         "find": lambda: find_contacts(args, book),
         "delete": lambda: delete_contact(args, book, notes=notes),
         "update": lambda: update_contact(args, book=book, notes=notes),
         "remove": lambda: remove_field(args, book=book, notes=notes),
+        "dedupe": lambda: dedupe_contacts(args, book, notes=notes),
+        "stats": lambda: show_stats(book, notes),
+        "use": lambda: use_profile(args, profiles),
+        "sync": lambda: sync_data(args, book, notes=notes),
         # note commands
         "add-note": lambda: add_note(args, book=book, notes=notes),
         "edit-note": lambda: edit_note(args, book=book, notes=notes),
@@ -587,6 +763,7 @@ def handle_command(user_input: str, book: AddressBook, notes: Notes):
         "delete-note": lambda: delete_note(args, book=book, notes=notes),
         "find-tag": lambda: find_notes_by_tag(args, notes=notes),
         "sort-notes": lambda: sort_notes_by_tag(notes),
+        "tag-stats": lambda: show_tag_stats(notes),
     }
 
     if command in ("close", "exit"):
@@ -594,6 +771,9 @@ def handle_command(user_input: str, book: AddressBook, notes: Notes):
 
     func = commands.get(command)
     if func:
-        return func()
+        # A whole command runs under the data lock (a no-op unless the data is
+        # thread-safe), so e.g. creating a contact and adding its phone is atomic
+        with book.lock.read() if command in READ_COMMANDS else book.lock.write():
+            return func()
     else:
-        return f"Invalid command: {command}"
\ No newline at end of file
+        return Result.error(f"Invalid command: {command}")
\ No newline at end of file
@@ -1,34 +1,132 @@
 from prompt_toolkit import PromptSession
-from prompt_toolkit.auto_suggest import AutoSuggestFromHistory
-from prompt_toolkit.history import InMemoryHistory
-from prompt_toolkit.completion import WordCompleter
+from prompt_toolkit.completion import Completer, Completion
 from prompt_toolkit.key_binding import KeyBindings
 
+from bot.constants import COMPLETION_LIMIT
+from bot.history import CommandHistory, IndexedAutoSuggest
+from bot.models import AddressBook, Notes
+from bot.ordering import ContactOrders
+from bot.profiles import profile_names
+
+
+# Possible commands.
+COMMANDS = [
+    "hello",
+    "stats",
+    "use",
+    "sync",
+    "add",
+    "all",
+    "show",
+    "find",
+    "delete",
+    "update",
+    "remove",
+    "dedupe",
+    "birthdays",
+    "add-note",
+    "edit-note",
+    "find-notes",
+    "all-notes",
+    "delete-note",
+    "help",
+    "find-tag",
+    "sort-notes",
+    "tag-stats",
+    "close",
+    "exit"
+]
+
+CONTACT_FIELDS = ["phone", "birthday", "email", "address"]
+
+# Commands whose first argument is a contact name
+NAME_COMMANDS = {
+    "add", "show", "delete", "update", "remove",
+    "add-note", "edit-note", "all-notes", "delete-note",
+}
+
+# Commands whose second argument is a contact field
+FIELD_COMMANDS = {"add", "show", "update", "remove"}
+
+# Commands whose second argument is a note ID
+NOTE_ID_COMMANDS = {"edit-note", "delete-note"}
+
+
+class BotCompleter(Completer):
+    """
+    Context-aware completer for the bot prompt.
+    Completes commands, contact names, field names, note IDs and tags
+    depending on the position of the word being typed.
+    """
+    def __init__(self, book: AddressBook, notes: Notes):
+        """
+        Bind the completer to the live AddressBook and Notes.
+        Both keep their tries up to date on every change, so completion
+        only walks the part of a trie below the typed prefix.
+        """
+        self.book = book
+        self.notes = notes
+
+    def candidates(self, command: str, position: int, words: list, prefix: str) -> list:
+        """
+        Return completion candidates for the word at the given position.
+        Position 0 is the command itself, 1 its first argument, and so on.
+        """
+        if position == 0:
+            return [c for c in COMMANDS if c.startswith(prefix.lower())]
+
+        if position == 1:
+            if command in NAME_COMMANDS:
+                names = self.book.name_index.trie.starts_with(prefix.lower(), COMPLETION_LIMIT)
+                return [name.capitalize() for name in names]
+            if command == "help":
+                return [c for c in COMMANDS if c.startswith(prefix.lower())]
+            if command in ("use", "sync"):
+                return [name for name in profile_names() if name.startswith(prefix.lower())]
+
+        if position == 2:
+            if command in FIELD_COMMANDS:
+                return [f for f in CONTACT_FIELDS if f.startswith(prefix.lower())]
+            if command == "find":
+                return [f for f in ["name"] + CONTACT_FIELDS if f.startswith(prefix.lower())]
+            if command in NOTE_ID_COMMANDS:
+                user_notes = self.notes.get_all_user_notes(words[1])
+                return [str(i) for i in user_notes if str(i).startswith(prefix)][:COMPLETION_LIMIT]
+
+        if command == "all" and position >= 1:
+            if words[-2] == "--sort":
+                return [order for order in ContactOrders.ORDERS if order.startswith(prefix.lower())]
+            if position % 2:
+                return [option for option in ("--sort", "--after", "--limit") if option.startswith(prefix)]
+        if command == "find-notes" and prefix.startswith("--"):
+            return [option for option in ("--regex", "--limit") if option.startswith(prefix)]
+        if command == "find-tag":
+            return self.notes.tag_index.starts_with(prefix, COMPLETION_LIMIT)
+        if command == "add-note" and position >= 2 and prefix.startswith("tag="):
+            # Complete the last of comma-separated tags
+            last = prefix[len("tag="):].split(",")[-1]
+            head = prefix[:len(prefix) - len(last)]
+            tags = self.notes.tag_index.starts_with(last, COMPLETION_LIMIT)
+            return [head + tag for tag in tags]
+
+        return []
+
+    def get_completions(self, document, complete_event):
+        """
+        Yield completions for the word before the cursor.
+        """
+        text = document.text_before_cursor
+        words = text.split()
+        if not words or text[-1].isspace():
+            prefix = ""
+            words.append(prefix)
+        else:
+            prefix = words[-1]
+
+        command = words[0].lower()
+        for candidate in self.candidates(command, len(words) - 1, words, prefix):
+            yield Completion(candidate, start_position=-len(prefix))
 
-# Define the completer with possible commands.
-completer = WordCompleter(
-    [
-        "hello",
-        "add",
-        "all",
-        "show",
-        "find",
-        "delete",
-        "update",
-        "remove",
-        "birthdays",
-        "add-note",
-        "edit-note",
-        "find-notes",
-        "all-notes",
-        "delete-note",
-        "help",
-        "find-tag",
-        "sort-notes",
-        "close",
-        "exit"
-    ],
-)
 
 # Key bindings
 bindings = KeyBindings()
@@ -42,10 +140,15 @@ def _(event):
     else:
         buffer.validate_and_handle()
 
-session = PromptSession(
-    history=InMemoryHistory(),
-    auto_suggest=AutoSuggestFromHistory(),
-    enable_history_search=True,
-    completer=completer,
-    key_bindings=bindings
-)
\ No newline at end of file
+def create_session(book: AddressBook, notes: Notes) -> PromptSession:
+    """
+    Create the prompt session with completion bound to the loaded data
+    and suggestions from the persistent command history.
+    """
+    return PromptSession(
+        history=CommandHistory(),
+        auto_suggest=IndexedAutoSuggest(),
+        enable_history_search=True,
+        completer=BotCompleter(book, notes),
+        key_bindings=bindings
+    )
@@ -18,6 +18,8 @@ ERROR_EMPTY_NAME = "Sorry, name cannot be empty"
 ERROR_NAME_TOO_SHORT = "Error: Name must be at least 2 characters long."
 ERROR_INVALID_NAME_LETTERS = "Name must be a single word containing only letters"
 ERROR_EMPTY_ADDRESS = "Sorry, address cannot be empty"
+ERROR_ALL_USAGE = "Usage: all [--sort name|birthday|modified] [--after <cursor>] [--limit <N>]"
+ERROR_SYNC_USAGE = "Usage: sync <profile|directory> or sync --socket <path> or sync --host <host> [--port <port>]"
 
 # Success messages
 SUCCESS_CONTACT_ADDED = "Contact added."
@@ -45,6 +47,95 @@ DATE_FORMAT = "%d.%m.%Y"
 # Number format
 UKRAINE_CODE = "380"
 
+# Fuzzy search
+FUZZY_PREFIX = "~"
+FUZZY_MAX_DISTANCE = 2
+FUZZY_TOP_K = 5
+
+# Compression of data files: None (plain JSON), "gzip" or "lzma".
+# The codec is detected on load, so it can be changed at any time.
+DATA_CODECS = {
+    "users.json": None,
+    "notes": None,
+}
+
+# Birthday reminders: hour of the day to fire them, longest sleep in seconds
+REMINDER_HOUR = 9
+REMINDER_MAX_SLEEP = 3600
+
+# Reloading data files changed by other processes: polling interval when
+# inotify is not available and how long to collect changes, in seconds
+WATCH_POLL_INTERVAL = 1.0
+WATCH_DEBOUNCE = 0.2
+
+# Server mode
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8765
+# Commands that never change data and may run concurrently
+READ_COMMANDS = {
+    "hello", "help", "all", "show", "find", "birthdays",
+    "find-notes", "all-notes", "find-tag", "sort-notes", "tag-stats",
+    "stats",
+}
+
+# Query planning for find field:value queries
+# Index lookups matching more keys than this are evaluated as filters instead
+QUERY_INDEX_LIMIT = 10000
+# Share of contacts a condition without an index is assumed to match
+QUERY_SCAN_SELECTIVITY = 0.1
+
+# Autocompletion
+COMPLETION_LIMIT = 20
+
+# Command history: file in the data directory, commands per file before it
+# is rotated, half-life of a use in commands for ranking suggestions,
+# prefix lengths with a precomputed best suggestion, longest prefix scan
+HISTORY_FILE = 'history.txt'
+HISTORY_MAX_ENTRIES = 100000
+HISTORY_HALF_LIFE = 1000
+HISTORY_INDEX_DEPTH = 8
+HISTORY_SCAN_LIMIT = 1000
+
+# Tag index: bits per chunk of a tag bitmap
+BITMAP_CHUNK_BITS = 4096
+
+# Note texts of at least this many characters are kept in a memory-mapped
+# blob file; it is compacted once this many bytes, and this share of it,
+# belong to deleted or edited notes
+NOTE_BLOB_MIN_SIZE = 256
+BLOB_COMPACT_MIN_GARBAGE = 1024 * 1024
+BLOB_COMPACT_RATIO = 0.5
+
+# stats: how many users with the most notes to list
+STATS_TOP_USERS = 10
+
+# Duplicate detection
+# Contacts sharing a phone or e-mail with more contacts than this are not paired
+DEDUPE_MAX_BLOCK = 50
+# How many following names in sorted order each name is compared with
+DEDUPE_WINDOW = 5
+
+# Profiles: the one using the data directory itself, how many profiles
+# stay loaded before the least recently used one is saved and dropped
+DEFAULT_PROFILE = "default"
+PROFILE_CACHE_SIZE = 4
+
+# find-notes --regex: compiled patterns to keep, notes from which the scan
+# runs in a process pool, and chunks per worker process (for balancing)
+REGEX_CACHE_SIZE = 128
+SCAN_PARALLEL_MIN_NOTES = 50000
+SCAN_CHUNKS_PER_WORKER = 4
+
+# sync: shape of the hash tree both copies keep over contacts and notes
+# (children per node, levels below the root); both sides must use the same
+SYNC_TREE_FANOUT = 16
+SYNC_TREE_DEPTH = 3
+
+# Sorted contact orders (all --sort)
+# From this many contacts added at once the orders are sorted again
+# instead of inserting each contact
+ORDERS_RESORT_MIN = 100
+
 # Help messages
 MAIN_HELP_TEXT = """
 \033[36;1m** Available Commands **\033[0m
@@ -54,24 +145,37 @@ MAIN_HELP_TEXT = """
 
 \033[94m[Contact Management]\033[0m
 - hello                              Display a greeting
+- stats                              Show memory use, data file sizes and load/save times
+- use [profile]                      Switch to another address book, or list them
+- sync <profile|directory>           Exchange changed contacts and notes with another copy
+  - sync --socket <path>             Sync with a running bot server
 - add <name>                         Add a new contact
   - add <name> <phone>               Add contact with phone
   - add <name> <field> <value>       Add field to contact (phone, email, address, birthday)
 - all                                Show all contacts
-- birthdays                          Show upcoming birthdays
+  - all --sort <order> [--limit <N>] Show contacts by name, birthday or modified, in pages
+- birthdays [days]                   Show upcoming birthdays
 - show <name>                        Show contact details
 - update <name> <field> <value>      Update contact field
 - delete <name>                      Delete a contact
 - remove <name> <field>              Remove field from contact
-- find <query>                       Search contacts (case insensitive)
+- dedupe                             Find contacts that look like duplicates
+  - dedupe merge <keep> <remove>     Merge two contacts into one
+- find <query>                       Search contacts (case insensitive), best matches first
+  - find <query> --limit <N>         Show only the N best matches
   - find <query> [field]             Search in specified field (phone, email, address, birthday)
+  - find ~<name> [distance]          Typo-tolerant search by name
+  - find <field>:<value> ...         Search by several conditions at once
 
 \033[93m[Note Management]\033[0m
 - add-note <user_name> tag=<tag> <text>   Add a new note for a user
-- edit-note <user_name> <id>              Edit existing note
+- edit-note <user_name> <id> [text]       Edit existing note
 - find-notes <keyword>                    Search notes by keyword
+  - find-notes --regex <pattern>          Search notes by regular expression
 - find-tag <tag>                          Find notes by tag
+  - find-tag <tag> AND|OR|NOT <tag>       Find notes by a tag expression
 - sort-notes                              Show notes sorted/grouped by tag
+- tag-stats                               Show how many notes have each tag
 - all-notes <user_name>                   Show all notes for a user
 - delete-note <user_name> <note_id>       Delete a note
 
@@ -100,9 +204,22 @@ Examples:
 Command: all
 Usage:
   all
+  all --sort <order> [--after <cursor>] [--limit <N>]
 
 Description:
   Shows a list of all contacts stored in your address book.
+  With --sort, contacts are listed in one of these orders, kept up to date
+  as contacts change, so even large books page quickly:
+    name       alphabetically
+    birthday   by the next birthday, starting today (contacts with a birthday)
+    modified   most recently added or changed first
+  With --limit, one page is shown together with the command for the next
+  page, which continues after the last shown contact (--after <cursor>).
+
+Examples:
+  all --sort name --limit 20
+  all --sort birthday --after 15.03:Anna --limit 20
+  all --sort modified --limit 10
 """,
     
     "show": """
@@ -119,13 +236,31 @@ Command: find
 Usage:
   find <query>           Search in all fields
   find <query> [field]   Search only in specified field (phone, email, address, birthday)
+  find ... --limit <N>   Show at most N contacts (the N best for a search in all fields)
+  find ~<name> [distance] Typo-tolerant search by name
+  find <field>:<value> [<field>:<value> ...] [--explain]
+                         Search contacts matching all given conditions
 
 Description:
   Searches contacts by any text or specific fields.
+  A search in all fields lists the most relevant contacts first: exact name,
+  then names starting with the query, names containing it, and last matches
+  in other fields. With --limit only the best N are looked for, so a short
+  query on a big book answers quickly.
+  With the ~ prefix, shows the closest names within <distance> typos
+  (2 by default, two swapped letters count as one); names that sound alike
+  come first among equally close ones.
+  Field conditions: name:<prefix>, phone:<prefix>, email:<text> (or
+  email:@<domain>), address:<text>, bday:<MM> / bday:<DD.MM>.
+  Conditions with an index are evaluated first, then the rest, each the
+  most selective first; --explain shows the chosen plan.
   
 Examples:
   find 0987654321
   find 0987654321 phone
+  find an --limit 10
+  find ~jhon
+  find ~jhon 1
         """,
     
     "delete": """
@@ -167,11 +302,86 @@ Examples:
   remove john phone 0987654321
         """,
     
+    "stats": """
+Command: stats
+Usage:
+  stats
+
+Description:
+  Shows the number of contacts and notes (per user), the memory used by
+  contacts, notes and each of their indexes, the size of every data file
+  and the time spent in the last load and save.
+  Measuring memory walks all data, so it can take a moment on large books.
+        """,
+
+    "use": """
+Command: use
+Usage:
+  use
+  use <profile>
+
+Description:
+  Switches to another address book (profile) with its own contacts and notes,
+  creating it if it does not exist. Without a profile, lists the profiles.
+  The 'default' profile keeps its data in the data directory itself, other
+  profiles in 'data/profiles/<profile>/'. Recently used profiles stay loaded,
+  so switching back is instant; beyond PROFILE_CACHE_SIZE the least recently
+  used one is saved and unloaded. Start the bot in a profile with --profile.
+
+Examples:
+  use clients
+  use default
+        """,
+
+    "sync": """
+Command: sync
+Usage:
+  sync <profile|directory>
+  sync --socket <path>
+  sync --host <host> [--port <port>]
+
+Description:
+  Brings the contacts and notes in use and another copy of them up to date
+  with each other: another profile, another data directory (e.g. a copy
+  from another machine), or a bot server started with 'serve'.
+  Both copies keep a hash tree of their contacts and notes, and only the
+  parts of the trees that differ are compared, so a sync costs about as
+  much as the differences, not the size of the book.
+  An item missing in one copy is copied there, otherwise the copy with the
+  newer version wins. Items changed in both copies are reported as
+  conflicts and each copy keeps its own; change one of them and sync again.
+  Deletions are not synced: delete an item in both copies.
+
+Examples:
+  sync work
+  sync /mnt/laptop/bot/data
+  sync --socket /tmp/bot.sock
+        """,
+
+    "dedupe": """
+Command: dedupe
+Usage:
+  dedupe
+  dedupe merge <keep> <remove>
+
+Description:
+  Lists pairs of contacts that probably describe the same person: contacts
+  sharing a phone, the same e-mail (ignoring case, +suffixes and dots in
+  Gmail addresses) or names that differ by one letter.
+  With merge, moves the phones and missing fields of <remove> into <keep>,
+  moves its notes and deletes it.
+
+Examples:
+  dedupe
+  dedupe merge John Jhon
+        """,
+
     "birthdays": """
 Command: birthdays
 Usage:
   birthdays
-Then enter the number of days you want to see upcoming birthdays for.
+  birthdays <days>
+Without <days>, enter the number of days you want to see upcoming birthdays for.
 
 Description:
   Shows contacts with upcoming birthdays within <days>.
@@ -181,41 +391,54 @@ Description:
 Command: add-note
 Usage:
   add-note <user_name> <text>
-  add-note <user_name> tag=<tag> <text>
+  add-note <user_name> tag=<tag> [tag=<tag> ...] <text>
 
 Description:
   Creates a new note for the specified user. 
-  You can optionally add a tag using the prefix tag=<value>.
+  You can optionally add tags using the prefix tag=<value>, repeated or
+  with comma-separated tags (tag=work,urgent).
   The command returns the ID of the newly created note.
 
 Examples:
   add-note John Buy milk
   add-note Anna tag=work Finish the report
+  add-note Anna tag=work,urgent Send the invoice
         """,
     
     "edit-note": """
 Command: edit-note
 Usage:
   edit-note <user_name> <note_id>
+  edit-note <user_name> <note_id> <text>
 
 Description:
   Edits the text of an existing note for the specified user. 
   When executed, the current text of the note is shown as default, allowing you 
   to modify it interactively. After editing, the updated note is saved.
+  If <text> is given, it replaces the note text without prompting.
 
 Examples:
   edit-note John 1
-  edit-note Anna 3
+  edit-note Anna 3 Call the bank
         """,
     
     "find-notes": """
 Command: find-notes
 Usage:
-  find-notes <keyword>
+  find-notes <keyword> [--limit <N>]
+  find-notes --regex <pattern> [--limit <N>]
 
 Description:
   Searches notes that contain given keyword.
   If you do not enter a <keyword>, all notes will be displayed.
+  With --regex, searches notes matching a regular expression (use (?i) to
+  ignore case); many notes are searched in parallel worker processes.
+  With --limit, at most N notes are shown and the search stops there.
+
+Examples:
+  find-notes meeting --limit 5
+  find-notes --regex \\bcall(ed)? (Anna|Bob)\\b
+  find-notes --regex (?i)^todo --limit 10
         """,
     
     "all-notes": """
@@ -256,9 +479,26 @@ Description:
 Command: find-tag
 Usage:
   find-tag <tag>
+  find-tag <expression>
 
 Description:
   Searches notes by a specific tag. Shows all notes that contain the given tag.
+  Tags can be combined with AND, OR, NOT and parentheses; tags written next
+  to each other must all be present.
   If no notes with this tag exist, displays a message indicating that none were found.
+
+Examples:
+  find-tag work
+  find-tag work AND urgent NOT done
+  find-tag (home OR family) NOT done
+        """,
+
+    "tag-stats": """
+Command: tag-stats
+Usage:
+  tag-stats
+
+Description:
+  Shows every tag with the number of notes that carry it, the most used first.
         """
 }
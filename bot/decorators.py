@@ -1,43 +1,44 @@
 from bot.constants import ERROR_CONTACT_NOT_FOUND, ERROR_INSUFFICIENT_ARGS, ERROR_NO_COMMAND
 from bot.models import AddressBook, Notes
+from bot.result import Result
 
 # Decorator to handle input errors
 def input_error(func):
     """
     Decorator for command handlers that normalizes common input errors.
     Wraps a function, checks arguments count and catches typical exceptions,
-    returning user-friendly error messages instead of tracebacks.
+    returning user-friendly error results instead of tracebacks.
     """
     def inner(*args, **kwargs):
         """
         Wrapper that validates arguments for the wrapped command
         and handles ValueError/KeyError/other exceptions, mapping them
-        to readable error strings for the CLI user.
+        to readable error results for the CLI user.
         """
         # No command entered
         if args is None:
-            return ERROR_NO_COMMAND
+            return Result.error(ERROR_NO_COMMAND)
 
         # Check for specific command errors
         if func.__name__ in ("add_birthday", "add_email",
                              "add_address", "update_phone", "update_birthday",
                              "update_email", "update_address", "remove_phone"):
             if len(args) < 2:
-                return ERROR_INSUFFICIENT_ARGS
+                return Result.error(ERROR_INSUFFICIENT_ARGS)
 
         elif func.__name__ in ("delete_contact", "show_contact", "all_user_notes",                  "find_notes_by_tag"):
             if len(args) < 1:
-                return ERROR_INSUFFICIENT_ARGS
+                return Result.error(ERROR_INSUFFICIENT_ARGS)
 
         # Handle exceptions from the command functions
         try:
             return func(*args, **kwargs)
         except ValueError as e:
-            return f"Error: {e}"
+            return Result.error(f"Error: {e}")
         except KeyError:
-            return ERROR_CONTACT_NOT_FOUND
+            return Result.warning(ERROR_CONTACT_NOT_FOUND)
         except Exception as e:
-            return f"Unexpected error: {e}"
+            return Result.error(f"Unexpected error: {e}")
 
     return inner
 
@@ -51,16 +52,16 @@ def user_exists(func):
     def inner(args, book: AddressBook, notes: Notes):
         """
         Wrapper that verifies the user from args[0] exists in the AddressBook.
-        If the user is missing, returns an error string; otherwise calls the
+        If the user is missing, returns a warning result; otherwise calls the
         wrapped function with the same arguments.
         """
         try:
             user_name = args[0]
             user = book.find(user_name)
             if not user:
-                return f"User '{user_name}' does not exist."
+                return Result.warning(f"User '{user_name}' does not exist.")
             return func(args, book=book, notes=notes)
         except Exception as e:
-            return f"Unexpected error: {e}"
+            return Result.error(f"Unexpected error: {e}")
     
     return inner
\ No newline at end of file
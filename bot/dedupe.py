@@ -0,0 +1,66 @@
+from collections import defaultdict
+
+from bot.constants import DEDUPE_MAX_BLOCK, DEDUPE_WINDOW
+from bot.search import edit_distance
+
+
+def normalize_email(email: str) -> str:
+    """
+    Normalize an e-mail for comparison: lowercase, drop '+suffix' from the
+    local part and dots for Gmail addresses.
+    """
+    local, _, domain = email.lower().partition("@")
+    local = local.split("+", 1)[0]
+    if domain in ("gmail.com", "googlemail.com"):
+        local = local.replace(".", "")
+        domain = "gmail.com"
+    return f"{local}@{domain}"
+
+
+def find_duplicates(book) -> list:
+    """
+    Find pairs of contacts that probably describe the same person.
+    Contacts are only compared within blocks sharing a phone or normalized
+    e-mail, and names within a sliding window over the sorted names (and
+    sorted reversed names, to catch typos in the first letters), so the work
+    stays near-linear instead of comparing all pairs.
+    Returns a list of (name, name, reasons) with the strongest matches first.
+    """
+    snapshot = book.snapshot()
+    reasons = defaultdict(list)
+
+    def add_block(keys, reason):
+        # Huge blocks (e.g. a shared office phone) say little and cost quadratic time
+        if len(keys) > DEDUPE_MAX_BLOCK:
+            return
+        keys = sorted(keys)
+        for i, first in enumerate(keys):
+            for second in keys[i + 1:]:
+                reasons[(first, second)].append(reason)
+
+    emails = defaultdict(set)
+    for key, record in snapshot.items():
+        if record.email:
+            emails[normalize_email(record.email.value)].add(key)
+
+    for phone, keys in book.contact_index.phone_owners.items():
+        if len(keys) > 1:
+            add_block(keys, f"same phone {phone}")
+    for email, keys in emails.items():
+        if len(keys) > 1:
+            add_block(keys, f"same email {email}")
+
+    # Sorted neighbourhood over names
+    names = [key.lower() for key in snapshot]
+    for ordered in (sorted(names), sorted(names, key=lambda name: name[::-1])):
+        for i, name in enumerate(ordered):
+            for other in ordered[i + 1:i + 1 + DEDUPE_WINDOW]:
+                if edit_distance(name, other, 1) <= 1:
+                    pair = tuple(sorted((name.capitalize(), other.capitalize())))
+                    if "similar name" not in reasons[pair]:
+                        reasons[pair].append("similar name")
+
+    return sorted(
+        ((first, second, pair_reasons) for (first, second), pair_reasons in reasons.items()),
+        key=lambda item: (-len(item[2]), item[2] == ["similar name"], item[0], item[1]),
+    )
@@ -0,0 +1,111 @@
+"""
+Fuzzy name search benchmark.
+Indexes generated names the way the address book does and measures the
+latency of find ~name queries: exact names, names with one typo and names
+with two. A few queries per kind are checked against a full scan.
+
+    python -m bot.fuzzy_benchmark
+    python -m bot.fuzzy_benchmark --names 100000 --queries 500
+"""
+
+import argparse
+import random
+import statistics
+import string
+import sys
+import time
+
+from bot.constants import FUZZY_MAX_DISTANCE, FUZZY_TOP_K
+from bot.search import NameIndex, edit_distance
+
+
+def generate_names(count: int, rng: random.Random) -> list:
+    """
+    Generate distinct names shaped like those of bot.benchmark.
+    """
+    names = set()
+    while len(names) < count:
+        names.add("".join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 10))).capitalize())
+    return sorted(names)
+
+
+def typo(name: str, rng: random.Random) -> str:
+    """
+    Return the name with one character replaced, deleted, inserted or
+    swapped with the next one.
+    """
+    i = rng.randrange(len(name))
+    kind = rng.choice(["replace", "delete", "insert", "swap"])
+    if kind == "replace":
+        return name[:i] + rng.choice(string.ascii_lowercase) + name[i + 1:]
+    if kind == "delete":
+        return name[:i] + name[i + 1:]
+    if kind == "insert":
+        return name[:i] + rng.choice(string.ascii_lowercase) + name[i:]
+    if i < len(name) - 1:
+        return name[:i] + name[i + 1] + name[i] + name[i + 2:]
+    return name
+
+
+def scan(names: list, query: str, max_distance: int, limit: int) -> list:
+    """
+    Find the limit nearest names by comparing the query with every name.
+    """
+    query = query.lower()
+    matches = ((edit_distance(query, name.lower(), max_distance), name.lower()) for name in names)
+    return sorted(match for match in matches if match[0] <= max_distance)[:limit]
+
+
+def main():
+    """
+    Run the benchmark and exit with status 1 if a median latency is over
+    the target or a checked query differs from the full scan.
+    """
+    parser = argparse.ArgumentParser(description="Measure fuzzy name search latency")
+    parser.add_argument("--names", type=int, default=1_000_000, help="number of generated names")
+    parser.add_argument("--queries", type=int, default=1000, help="queries of each kind")
+    parser.add_argument("--check", type=int, default=3, help="queries of each kind compared with a full scan")
+    parser.add_argument("--target", type=float, default=1.0, help="highest acceptable median latency, ms")
+    parser.add_argument("--seed", type=int, default=42, help="seed of the generated names and queries")
+    options = parser.parse_args()
+
+    rng = random.Random(options.seed)
+    names = generate_names(options.names, rng)
+    index = NameIndex()
+    start = time.perf_counter()
+    for name in names:
+        index.add(name)
+    print(f"{len(names)} names indexed in {time.perf_counter() - start:.1f} s")
+
+    kinds = {
+        "exact": lambda name: name,
+        "1 typo": lambda name: typo(name, rng),
+        "2 typos": lambda name: typo(typo(name, rng), rng),
+    }
+    problems = []
+    print(f"{'query':<10}{'median, ms':>12}{'p95, ms':>10}{'max, ms':>10}")
+    for kind, make_query in kinds.items():
+        queries = [make_query(rng.choice(names)) for _ in range(options.queries)]
+        times = []
+        for query in queries:
+            start = time.perf_counter()
+            index.search(query, FUZZY_MAX_DISTANCE, FUZZY_TOP_K)
+            times.append((time.perf_counter() - start) * 1000)
+        times.sort()
+        median = statistics.median(times)
+        print(f"{kind:<10}{median:>12.3f}{times[int(len(times) * 0.95)]:>10.3f}{times[-1]:>10.3f}")
+        if median > options.target:
+            problems.append(f"{kind}: the median latency is over {options.target} ms")
+
+        for query in queries[:options.check]:
+            if index.search(query, FUZZY_MAX_DISTANCE, FUZZY_TOP_K) != scan(names, query, FUZZY_MAX_DISTANCE, FUZZY_TOP_K):
+                problems.append(f"{kind}: '{query}' finds other names than a full scan")
+
+    for problem in problems:
+        print(problem)
+    if problems:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
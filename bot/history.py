@@ -0,0 +1,156 @@
+from bisect import bisect_left
+import math
+import os
+from pathlib import Path
+
+from prompt_toolkit.auto_suggest import AutoSuggest, Suggestion
+from prompt_toolkit.history import History
+
+from bot.constants import (
+    HISTORY_FILE,
+    HISTORY_HALF_LIFE,
+    HISTORY_INDEX_DEPTH,
+    HISTORY_MAX_ENTRIES,
+    HISTORY_SCAN_LIMIT,
+)
+from bot.storage import DATA_DIR
+
+
+class HistoryIndex:
+    """
+    Prefix index over distinct commands, ranked by frecency.
+    Each use of a command adds 2^(n / HISTORY_HALF_LIFE) to its score, where n
+    counts all commands, so a use loses half its weight after HISTORY_HALF_LIFE
+    newer commands. Scores are kept as log2 and only grow, which lets the best
+    command for every short prefix be kept up to date on insert; longer
+    prefixes are answered from a sorted array of the commands.
+    """
+    def __init__(self):
+        self.count = 0
+        self.scores = {}
+        self.commands = []
+        # New commands not yet merged into the sorted array
+        self.new_commands = []
+        self.best = {}
+
+    def add(self, command: str):
+        """
+        Record one use of a command.
+        """
+        weight = self.count / HISTORY_HALF_LIFE
+        self.count += 1
+        score = self.scores.get(command)
+        if score is None:
+            self.new_commands.append(command)
+            score = weight
+        else:
+            # log2(2^score + 2^weight), without overflowing
+            high, low = max(score, weight), min(score, weight)
+            score = high + math.log2(1 + 2 ** (low - high))
+        self.scores[command] = score
+
+        for length in range(1, min(len(command), HISTORY_INDEX_DEPTH) + 1):
+            prefix = command[:length]
+            best = self.best.get(prefix)
+            if best is None or best == command or self.scores[best] < score:
+                self.best[prefix] = command
+
+    def merge_new_commands(self):
+        """
+        Merge commands added since the last call into the sorted array.
+        """
+        if self.new_commands:
+            # Sorting a sorted array with a short unsorted tail is close to linear
+            self.commands.extend(self.new_commands)
+            self.commands.sort()
+            self.new_commands = []
+
+    def suggest(self, prefix: str):
+        """
+        Return the best ranked command that starts with the prefix and is
+        longer than it, or None.
+        """
+        if len(prefix) <= HISTORY_INDEX_DEPTH:
+            best = self.best.get(prefix)
+            if best is not None and best != prefix:
+                return best
+            if best is None:
+                return None
+
+        self.merge_new_commands()
+        best, best_score = None, None
+        start = bisect_left(self.commands, prefix)
+        for command in self.commands[start:start + HISTORY_SCAN_LIMIT]:
+            if not command.startswith(prefix):
+                break
+            if command != prefix and (best is None or self.scores[command] > best_score):
+                best, best_score = command, self.scores[command]
+        return best
+
+
+class CommandHistory(History):
+    """
+    Command history kept in a file in DATA_DIR, one command per line.
+    When the file reaches HISTORY_MAX_ENTRIES it is rotated to '<file>.1'
+    (replacing the previous one), so at most twice that many commands are
+    kept. Every command also goes into a HistoryIndex for suggestions.
+    """
+    def __init__(self, path: Path = DATA_DIR / HISTORY_FILE):
+        """
+        Read the rotated and current history files and index them.
+        """
+        self.path = path
+        self.rotated_path = path.with_name(path.name + ".1")
+        self.index = HistoryIndex()
+        current = self._read(self.path)
+        self.file_entries = len(current)
+        self.initial = self._read(self.rotated_path) + current
+        for command in self.initial:
+            self.index.add(command)
+        self.index.merge_new_commands()
+        super().__init__()
+
+    @staticmethod
+    def _read(file_path: Path) -> list:
+        """
+        Return the commands stored in a history file, oldest first.
+        """
+        if not file_path.exists():
+            return []
+        with open(file_path, encoding="utf-8", errors="replace") as f:
+            return [line.rstrip("\n") for line in f if line.strip()]
+
+    def load_history_strings(self):
+        """
+        Yield the stored commands, newest first.
+        """
+        initial, self.initial = self.initial, []
+        return reversed(initial)
+
+    def store_string(self, string: str):
+        """
+        Append a command to the history file, rotating it when full.
+        """
+        command = " ".join(string.split())
+        if not command:
+            return
+        self.index.add(command)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(command + "\n")
+        self.file_entries += 1
+        if self.file_entries >= HISTORY_MAX_ENTRIES:
+            os.replace(self.path, self.rotated_path)
+            self.file_entries = 0
+
+
+class IndexedAutoSuggest(AutoSuggest):
+    """
+    Suggest the rest of the best ranked earlier command starting with the typed text.
+    """
+    def get_suggestion(self, buffer, document):
+        history = buffer.history
+        text = document.text
+        if not text.strip() or not isinstance(history, CommandHistory):
+            return None
+        command = history.index.suggest(text)
+        return Suggestion(command[len(text):]) if command else None
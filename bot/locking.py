@@ -0,0 +1,131 @@
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+import threading
+
+
+class ThreadReadWriteLock:
+    """
+    Thread lock that lets many readers in at once but writers only alone.
+    Waiting writers block new readers, so writes are not starved. A thread
+    holding the lock may take it again: a writer may also read or write,
+    a reader may read, but a reader can never upgrade to writing.
+    """
+    def __init__(self):
+        """
+        Create an unlocked lock.
+        """
+        self._condition = threading.Condition()
+        # Thread id -> how many times it holds the read lock
+        self._readers = {}
+        self._writer = None
+        self._writes = 0
+        self._waiting_writers = 0
+
+    def acquire_read(self):
+        me = threading.get_ident()
+        with self._condition:
+            # Re-entering must not wait, or a waiting writer would deadlock us
+            if me not in self._readers and self._writer != me:
+                self._condition.wait_for(
+                    lambda: self._writer is None and not self._waiting_writers
+                )
+            self._readers[me] = self._readers.get(me, 0) + 1
+
+    def release_read(self):
+        me = threading.get_ident()
+        with self._condition:
+            self._readers[me] -= 1
+            if not self._readers[me]:
+                del self._readers[me]
+                self._condition.notify_all()
+
+    def acquire_write(self):
+        me = threading.get_ident()
+        with self._condition:
+            if self._writer == me:
+                self._writes += 1
+                return
+            if me in self._readers:
+                raise RuntimeError("A read lock cannot be upgraded to a write lock")
+            self._waiting_writers += 1
+            self._condition.wait_for(lambda: self._writer is None and not self._readers)
+            self._waiting_writers -= 1
+            self._writer = me
+            self._writes = 1
+
+    def release_write(self):
+        with self._condition:
+            self._writes -= 1
+            if not self._writes:
+                self._writer = None
+                self._condition.notify_all()
+
+    @contextmanager
+    def read(self):
+        """
+        Hold the lock shared for the duration of a with block.
+        """
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write(self):
+        """
+        Hold the lock exclusively for the duration of a with block.
+        """
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+class NoLock:
+    """
+    Stand-in for ThreadReadWriteLock when the data is used from one thread only.
+    """
+    def read(self):
+        return nullcontext()
+
+    def write(self):
+        return nullcontext()
+
+
+NO_LOCK = NoLock()
+
+
+def reading(method):
+    """
+    Run a method of AddressBook or Notes holding its lock shared.
+    """
+    @wraps(method)
+    def inner(self, *args, **kwargs):
+        with self.lock.read():
+            return method(self, *args, **kwargs)
+    return inner
+
+
+def writing(method):
+    """
+    Run a method of AddressBook or Notes holding its lock exclusively.
+    """
+    @wraps(method)
+    def inner(self, *args, **kwargs):
+        with self.lock.write():
+            return method(self, *args, **kwargs)
+    return inner
+
+
+def make_thread_safe(book, notes) -> ThreadReadWriteLock:
+    """
+    Guard an AddressBook and its Notes with one shared reader-writer lock.
+    Sharing it keeps commands that touch both (e.g. deleting a contact
+    with its notes) atomic without any risk of lock-order deadlocks.
+    """
+    lock = ThreadReadWriteLock()
+    book.lock = lock
+    notes.lock = lock
+    return lock
@@ -0,0 +1,104 @@
+from array import array
+from hashlib import blake2b
+import json
+
+from bot.constants import SYNC_TREE_DEPTH, SYNC_TREE_FANOUT
+
+
+def _hash(data: bytes) -> int:
+    """
+    Return a 64-bit hash of data that is the same in every process.
+    """
+    return int.from_bytes(blake2b(data, digest_size=8).digest(), "big")
+
+
+class MerkleTree:
+    """
+    Content digests of contacts or notes in a hash tree of fixed shape.
+    A key's leaf is chosen by hashing the key, so two copies of the data
+    put it in the same leaf, and every node holds the XOR of the digests of
+    the (key, content) entries below it. Copies with equal root digests hold
+    the same data; descending only into nodes that differ finds the
+    differing keys in O(differences * depth). With XOR, a change updates
+    just its leaf-to-root path, so the tree is kept up to date as an index.
+    """
+    def __init__(self, fanout: int = SYNC_TREE_FANOUT, depth: int = SYNC_TREE_DEPTH):
+        """
+        Create an empty tree with fanout children per node and depth levels below the root.
+        """
+        self.fanout = fanout
+        self.depth = depth
+        # Node digests per level, the root level first
+        self.levels = [array("Q", bytes(8 * fanout ** level)) for level in range(depth + 1)]
+        # Leaf position -> {key: entry digest}
+        self.leaves = {}
+
+    def leaf_of(self, key) -> int:
+        """
+        Return the position of the leaf holding a key.
+        """
+        return _hash(json.dumps(key).encode("utf-8")) % len(self.levels[-1])
+
+    @staticmethod
+    def digest(key, value) -> int:
+        """
+        Return the digest of a key and the content of its contact or note.
+        The version is left out: it counts saves, not content.
+        """
+        content = value.to_dict()
+        content.pop("version", None)
+        return _hash(json.dumps([key, content], sort_keys=True).encode("utf-8"))
+
+    def _toggle(self, leaf: int, digest: int):
+        """
+        XOR a digest into a leaf and all nodes above it, adding or removing it.
+        """
+        position = leaf
+        for level in reversed(self.levels):
+            level[position] ^= digest
+            position //= self.fanout
+
+    def add(self, key, value):
+        """
+        Add the entry of a contact or note, replacing its previous one.
+        """
+        self.remove(key, value)
+        leaf = self.leaf_of(key)
+        digest = self.digest(key, value)
+        self.leaves.setdefault(leaf, {})[key] = digest
+        self._toggle(leaf, digest)
+
+    def remove(self, key, value):
+        """
+        Remove the entry of a contact or note if present.
+        """
+        leaf = self.leaf_of(key)
+        entries = self.leaves.get(leaf)
+        digest = entries.pop(key, None) if entries else None
+        if digest is None:
+            return
+        if not entries:
+            del self.leaves[leaf]
+        self._toggle(leaf, digest)
+
+    def get(self, key):
+        """
+        Return the entry digest of a key, or None if it is not in the tree.
+        """
+        return self.leaves.get(self.leaf_of(key), {}).get(key)
+
+    def digests(self, level: int, positions) -> list:
+        """
+        Return the digests of the nodes at the given positions of a level.
+        """
+        nodes = self.levels[level]
+        return [nodes[position] for position in positions]
+
+    def entries(self, positions) -> dict:
+        """
+        Return {key: entry digest} of the given leaves.
+        """
+        found = {}
+        for position in positions:
+            found.update(self.leaves.get(position, {}))
+        return found
@@ -1,6 +1,20 @@
+from bisect import bisect_left
 from datetime import datetime, date, timedelta
 from collections import UserDict, defaultdict
+from contextlib import contextmanager
+import copy
+import heapq
 import re
+import sys
+import threading
+from bot.bitmap import Bitmap
+from bot.locking import NO_LOCK, reading, writing
+from bot.merkle import MerkleTree
+from bot.ordering import ContactOrders
+from bot.query import evaluate_tag_expression, parse_tag_expression
+from bot.scan import scan_notes
+from bot.search import ContactIndex, NameIndex, Trie
+from bot.snapshot import BookSnapshot, GenerationClock, NotesSnapshot
 from bot.constants import (
     ERROR_INVALID_PHONE,
     ERROR_INVALID_EMAIL,
@@ -11,7 +25,10 @@ from bot.constants import (
     ERROR_NAME_TOO_SHORT,
     ERROR_PHONE_EXISTS,
     DATE_FORMAT,
-    UKRAINE_CODE
+    UKRAINE_CODE,
+    FUZZY_MAX_DISTANCE,
+    FUZZY_TOP_K,
+    NOTE_BLOB_MIN_SIZE,
 )
 
 class Field:
@@ -135,6 +152,60 @@ class Record:
         self.birthday = None
         self.email = None
         self.address = None
+        # Version stored on disk (0 = never saved) and unsaved-changes flag
+        self.version = 0
+        self.dirty = True
+        # Owning AddressBook, generation of this state, older state for snapshots
+        self._owner = None
+        self._generation = 0
+        self._previous = None
+        # Serialized form, see encoded()
+        self._encoded = None
+
+    @contextmanager
+    def _changing(self):
+        """
+        Wrap a change of the record, holding the owner's lock exclusively.
+        """
+        lock = self._owner.lock if self._owner else NO_LOCK
+        with lock.write(), self._track_change():
+            yield
+
+    @contextmanager
+    def _track_change(self):
+        """
+        Wrap a change of the record and mark it unsaved.
+        Before the change, if a live snapshot may still see the current state,
+        that state is kept as the previous version and the record leaves the
+        owner's indexes; after the change it is indexed again.
+        """
+        self.dirty = True
+        owner = self._owner
+        clock = owner.clock if owner else None
+        if clock is None or not clock.snapshots:
+            self._previous = None
+        elif self._generation < clock.value:
+            previous = copy.copy(self)
+            previous.phones = list(self.phones)
+            self._previous = previous
+            # Drop versions older than the one the oldest snapshot sees
+            oldest = clock.oldest()
+            while previous is not None:
+                if previous._generation <= oldest:
+                    previous._previous = None
+                    break
+                previous = previous._previous
+        self._encoded = None
+        if clock is None:
+            yield
+            return
+
+        self._generation = clock.value
+        owner._unindex(self)
+        try:
+            yield
+        finally:
+            owner._index(self)
 
     def add_phone(self, phone):
         """
@@ -145,7 +216,22 @@ class Record:
             if existing_phone.value == phone:
                 raise ValueError(ERROR_PHONE_EXISTS)
 
-        self.phones.append(Phone(phone))
+        phone = Phone(phone)
+        with self._changing():
+            self.phones.append(phone)
+
+    def edit_phone(self, old_phone, new_phone):
+        """
+        Replace an existing phone number with a new, validated one.
+        Returns True if the old number was found and replaced, otherwise False.
+        """
+        for i, existing_phone in enumerate(self.phones):
+            if existing_phone.value == old_phone:
+                new_phone = Phone(new_phone)
+                with self._changing():
+                    self.phones[i] = new_phone
+                return True
+        return False
 
     def remove_phone(self, phone):
         """
@@ -154,7 +240,8 @@ class Record:
         """
         for existing_phone in self.phones:
             if existing_phone.value == phone:
-                self.phones.remove(existing_phone)
+                with self._changing():
+                    self.phones.remove(existing_phone)
                 return True
         return False
 
@@ -163,7 +250,9 @@ class Record:
         Set or replace the birthday field for this contact.
         Accepts a date string and converts it into a Birthday object.
         """
-        self.birthday = Birthday(birthday)
+        birthday = Birthday(birthday)
+        with self._changing():
+            self.birthday = birthday
 
     def remove_birthday(self):
         """
@@ -171,7 +260,8 @@ class Record:
         Returns True if birthday was removed, otherwise False.
         """
         if self.birthday:
-            self.birthday = None
+            with self._changing():
+                self.birthday = None
             return True
         return False
 
@@ -180,7 +270,9 @@ class Record:
         Set or replace the email field for this contact.
         Validates the email string before storing it.
         """
-        self.email = Email(email)
+        email = Email(email)
+        with self._changing():
+            self.email = email
 
     def remove_email(self):
         """
@@ -188,7 +280,8 @@ class Record:
         Returns True if email was removed, otherwise False.
         """
         if self.email:
-            self.email = None
+            with self._changing():
+                self.email = None
             return True
         return False
 
@@ -197,7 +290,9 @@ class Record:
         Set or replace the address field for this contact.
         Stores the address as an Address object.
         """
-        self.address = Address(address)
+        address = Address(address)
+        with self._changing():
+            self.address = address
 
     def remove_address(self):
         """
@@ -205,7 +300,8 @@ class Record:
         Returns True if address was removed, otherwise False.
         """
         if self.address:
-            self.address = None
+            with self._changing():
+                self.address = None
             return True
         return False
 
@@ -238,8 +334,19 @@ class Record:
             "birthday": self.birthday.value.strftime(DATE_FORMAT) if self.birthday else None,
             "email": self.email.value if self.email else None,
             "address": self.address.value if self.address else None,
+            "version": self.version,
         }
 
+    def encoded(self, encode) -> str:
+        """
+        Return encode(self.to_dict()), reusing the last result until the
+        record or its version changes, so unchanged contacts are not
+        serialized again on every save.
+        """
+        if self._encoded is None or self._encoded[0] != (encode, self.version):
+            self._encoded = ((encode, self.version), encode(self.to_dict()))
+        return self._encoded[1]
+
     @classmethod
     def from_dict(cls, data: dict):
         """
@@ -257,22 +364,140 @@ class Record:
         if data.get("address"):
             record.add_address(data["address"])
 
+        # Files written before versioning count as version 1
+        record.version = data.get("version", 1)
+        record.dirty = False
         return record
 
 
+def next_congratulation_date(birthday_date: date, today: date) -> tuple:
+    """
+    Return the next birthday on or after today and the day to congratulate.
+    February 29 falls back to February 28 in common years, and
+    congratulations move from weekends to the following Monday.
+    """
+    if birthday_date.month == 2 and birthday_date.day == 29:
+        try:
+            birthday_this_year = birthday_date.replace(year=today.year)
+        except ValueError:
+            birthday_this_year = date(today.year, 2, 28)
+    else:
+        birthday_this_year = birthday_date.replace(year=today.year)
+
+    if birthday_this_year < today:
+        try:
+            birthday_this_year = birthday_date.replace(year=today.year + 1)
+        except ValueError:
+            birthday_this_year = date(today.year + 1, 2, 28)
+
+    congratulation_date = birthday_this_year
+    if congratulation_date.weekday() == 5:
+        congratulation_date += timedelta(days=2)
+    elif congratulation_date.weekday() == 6:
+        congratulation_date += timedelta(days=1)
+
+    return birthday_this_year, congratulation_date
+
+
+def synced_floor(synced_versions: dict, key, item) -> int:
+    """
+    Return the lowest version a synced contact or note may be saved or
+    offered with: the version the other copy holds (synced_versions keeps
+    it with the content digest at that sync), or the next one if the item
+    was changed here since, so the change counts as newer there.
+    """
+    if key not in synced_versions:
+        return 0
+    version, digest = synced_versions[key]
+    return version if MerkleTree.digest(key, item) == digest else version + 1
+
+
 class AddressBook(UserDict):
     """
     Container for multiple contact records, keyed by name.
     Extends UserDict to provide find, delete and birthday utilities.
     """
+    def __init__(self, *args, **kwargs):
+        """
+        Create the address book together with its fuzzy name index,
+        field indexes and sorted orders.
+        Deleted contacts remember their stored version until the next save,
+        contacts synced with another copy the version and content digest
+        they have there.
+        """
+        self.name_index = NameIndex()
+        self.contact_index = ContactIndex()
+        self.orders = ContactOrders()
+        # Built on the first sync, see merkle_tree()
+        self.merkle = None
+        # Replaced by a shared lock in thread-safe mode, see make_thread_safe()
+        self.lock = NO_LOCK
+        # Structures kept in sync with every record change, see _index()
+        self.indexes = [self.contact_index, self.orders]
+        self.deleted = {}
+        self.synced_versions = {}
+        self.clock = GenerationClock()
+        super().__init__(*args, **kwargs)
+
+    def snapshot(self) -> BookSnapshot:
+        """
+        Return a frozen, read-only view of the book in O(1).
+        Later changes to the book are not visible through it.
+        """
+        return BookSnapshot(self.data, self.clock)
+
+    def _writable_data(self) -> dict:
+        """
+        Return the contacts dict, copied first if a live snapshot still uses it.
+        """
+        if self.clock.is_shared(self.data):
+            self.data = dict(self.data)
+        return self.data
+
+    def _attach(self, record: Record):
+        """
+        Bind a record to this book, so its changes keep snapshots and indexes right.
+        """
+        record._owner = self
+        record._generation = self.clock.value
+        record._previous = None
+
+    def _index(self, record: Record):
+        """
+        Add a record to the field indexes and other registered structures.
+        """
+        key = record.name.value.capitalize()
+        for index in self.indexes:
+            index.add(key, record)
+
+    def _unindex(self, record: Record):
+        """
+        Remove a record from the field indexes and other registered structures.
+        """
+        key = record.name.value.capitalize()
+        for index in self.indexes:
+            index.remove(key, record)
+
+    @writing
     def add_record(self, record: Record):
         """
         Add a new Record to the address book.
         Uses the capitalized name as the dictionary key.
         """
         key = record.name.value.capitalize()
-        self.data[key] = record
+        # A replaced or re-added contact keeps the stored version it is based on
+        if key in self.data:
+            record.version = self.data[key].version
+            self._unindex(self.data[key])
+        elif key in self.deleted:
+            record.version = self.deleted.pop(key)
+        record.dirty = True
+        self._attach(record)
+        self._writable_data()[key] = record
+        self.name_index.add(key)
+        self._index(record)
 
+    @reading
     def find(self, name) -> Record:
         """
         Find a contact record by name in a case-insensitive way.
@@ -281,13 +506,95 @@ class AddressBook(UserDict):
         # Search case-insensitively
         key = name.capitalize()
         return self.data.get(key)
+
+    @staticmethod
+    def _matches_other_field(record: Record, query: str) -> bool:
+        """
+        Check whether a lowercase query is in a phone, the birthday, e-mail or address.
+        """
+        return (any(query in phone.value for phone in record.phones)
+                or (record.birthday is not None and query in record.birthday.value.strftime(DATE_FORMAT))
+                or (record.email is not None and query in record.email.value.lower())
+                or (record.address is not None and query in record.address.value.lower()))
+
+    @reading
+    def search(self, query: str, limit: int = None) -> list:
+        """
+        Find contacts with the query in any field, case-insensitively, the most
+        relevant first: exact name, name prefix, name substring, then a match in
+        another field; equally relevant contacts by name. Returns Records.
+        Exact and prefix matches are one run of the sorted names, found by
+        bisect. The rest come from a scan in name order that keeps the best
+        limit matches in a bounded heap; since later names lose ties, the scan
+        stops once only name prefixes could still improve on the heap.
+        """
+        query = query.lower()
+        names = self.orders.names()
+        # (rank, position in name order, key); ranks 0-3 as in the docstring
+        found = []
+        start = end = bisect_left(names, query.capitalize())
+        while end < len(names) and names[end].lower().startswith(query):
+            if len(found) == limit:
+                return [self.data[key] for _, _, key in found]
+            found.append((0 if len(names[end]) == len(query) else 1, end, names[end]))
+            end += 1
+        if len(found) == limit:
+            return [self.data[key] for _, _, key in found]
+
+        room = None if limit is None else limit - len(found)
+        # Least relevant match on top: highest rank, then latest name
+        heap = []
+        for position, key in enumerate(names):
+            if start <= position < end:
+                continue
+            if query in key.lower():
+                rank = 2
+            elif room is not None and len(heap) == room:
+                # Full of matches at least as good as a later other-field match
+                continue
+            elif self._matches_other_field(self.data[key], query):
+                rank = 3
+            else:
+                continue
+
+            if room is None:
+                found.append((rank, position, key))
+            elif len(heap) < room:
+                heapq.heappush(heap, (-rank, -position, key))
+            elif rank < -heap[0][0]:
+                heapq.heapreplace(heap, (-rank, -position, key))
+            if room is not None and len(heap) == room and heap[0][0] == -2:
+                break
+
+        found += [(-rank, -position, key) for rank, position, key in heap]
+        found.sort()
+        return [self.data[key] for _, _, key in found]
+
+    @reading
+    def fuzzy_find(self, name, max_distance: int = FUZZY_MAX_DISTANCE,
+                   limit: int = FUZZY_TOP_K) -> list:
+        """
+        Find contacts whose names are close to the given (possibly misspelled) name.
+        Returns up to limit Record instances, nearest first; among names at
+        the same distance, those that sound like the given name come first.
+        """
+        matches = self.name_index.search(name, max_distance, limit, phonetic=True)
+        return [self.data[word.capitalize()] for _, word in matches]
     
     def to_dict(self):
         """
         Serialize the entire address book to a dictionary.
         Each contact is stored using its own to_dict() result.
         """
-        return {name: record.to_dict() for name, record in self.data.items()}
+        return self.snapshot().to_dict()
+
+    def encoded_items(self, encode):
+        """
+        Yield (name, serialized contact) pairs of a consistent snapshot,
+        using each record's cached serialized form.
+        """
+        for name, record in self.snapshot().items():
+            yield name, record.encoded(encode)
     
     @classmethod
     def from_dict(cls, data: dict):
@@ -296,11 +603,123 @@ class AddressBook(UserDict):
         Creates Record objects for all stored contact entries.
         """
         obj = cls()
-        from bot.models import Record
         for name, record_data in data.items():
-            obj.data[name] = Record.from_dict(record_data)
+            obj._load_record(name, record_data)
         return obj
 
+    @writing
+    def merge(self, stored: dict) -> list:
+        """
+        Merge the contacts currently stored on disk into this book before saving.
+        Contacts changed only in another session are taken from disk; contacts
+        changed here get the next version. If both sides changed the same
+        contact, this session's version is kept and a warning is returned.
+        Returns a list of conflict messages.
+        """
+        conflicts = []
+        for key in set(stored) | set(self.data) | set(self.deleted):
+            stored_data = stored.get(key)
+            stored_version = stored_data.get("version", 1) if stored_data else 0
+            record = self.data.get(key)
+
+            if key in self.deleted:
+                if stored_version not in (0, self.deleted[key]):
+                    conflicts.append(f"Contact '{key}' was changed in another session, it was not deleted.")
+                    self._load_record(key, stored_data)
+                continue
+
+            if record is None or not record.dirty:
+                self._take_stored(key, stored_data)
+                continue
+
+            if stored_version != record.version:
+                conflicts.append(f"Contact '{key}' was also changed in another session, your version was kept.")
+            # A synced contact is saved with at least the version it has in the other copy
+            record.version = max(max(stored_version, record.version) + 1,
+                                 synced_floor(self.synced_versions, key, record))
+            record.dirty = False
+
+        self.deleted.clear()
+        self.synced_versions.clear()
+        return conflicts
+
+    @writing
+    def reload(self, stored: dict) -> list:
+        """
+        Apply the contacts stored on disk after another process changed them.
+        Only contacts without unsaved changes here are updated, so the work is
+        proportional to what changed; changed contacts are reconciled by merge()
+        on the next save. Returns the names of the updated contacts.
+        """
+        changed = []
+        for key in set(stored) | set(self.data):
+            record = self.data.get(key)
+            if key in self.deleted or (record is not None and record.dirty):
+                continue
+            if self._take_stored(key, stored.get(key)):
+                changed.append(key)
+        return sorted(changed)
+
+    @writing
+    def merkle_tree(self) -> MerkleTree:
+        """
+        Return the hash tree of the contacts used by sync, building it on
+        first use; from then on it is updated with every change.
+        """
+        if self.merkle is None:
+            tree = MerkleTree()
+            for key, record in self.data.items():
+                tree.add(key, record)
+            self.indexes.append(tree)
+            self.merkle = tree
+        return self.merkle
+
+    @writing
+    def take_synced(self, key, record_data: dict):
+        """
+        Put a contact from another copy of the book (see bot.sync) in as a
+        change made here. It keeps the stored version it replaces, and is
+        saved with the version it has there, so both copies agree on it.
+        """
+        record = self.data.get(key)
+        version = record.version if record is not None else self.deleted.pop(key, 0)
+        self._load_record(key, {**record_data, "version": version})
+        self.data[key].dirty = True
+        self.synced_versions[key] = (record_data.get("version", 1), MerkleTree.digest(key, self.data[key]))
+
+    def _take_stored(self, key, stored_data) -> bool:
+        """
+        Bring a contact without local changes to its stored state: add,
+        replace or remove it. Returns True if anything changed.
+        """
+        record = self.data.get(key)
+        if record is None:
+            if stored_data is None:
+                return False
+            self._load_record(key, stored_data)
+            return True
+        if stored_data is None:
+            self._unindex(self._writable_data().pop(key))
+            self.name_index.remove(key)
+            return True
+        if stored_data.get("version", 1) != record.version:
+            self._load_record(key, stored_data)
+            return True
+        return False
+
+    def _load_record(self, key, record_data: dict):
+        """
+        Put a stored contact into the book as-is, without marking it changed.
+        """
+        record = Record.from_dict(record_data)
+        if key in self.data:
+            self._unindex(self.data[key])
+        self._attach(record)
+        self._writable_data()[key] = record
+        self.name_index.add(key)
+        self._index(record)
+
+    @writing
     def delete(self, name):
         """
         Delete a contact by name (case-insensitive).
@@ -308,10 +727,53 @@ class AddressBook(UserDict):
         """
         key = name.capitalize()
         if key in self.data:
-            del self.data[key]
+            record = self._writable_data().pop(key)
+            self.name_index.remove(key)
+            self._unindex(record)
+            record._owner = None
+            if record.version:
+                self.deleted[key] = record.version
             return True
         return False
 
+    @writing
+    def merge_contacts(self, target_name, source_name) -> Record:
+        """
+        Merge the source contact into the target one and delete the source.
+        Phones are combined; birthday, email and address are taken from the
+        source only where the target has none. Everything is checked before
+        anything changes, so the merge either fully happens or not at all.
+        Returns the merged Record.
+        """
+        target = self.find(target_name)
+        source = self.find(source_name)
+        if target is None or source is None:
+            raise KeyError(target_name if target is None else source_name)
+        if target is source:
+            raise ValueError("Cannot merge a contact with itself")
+
+        known_phones = {phone.value for phone in target.phones}
+        new_phones = [phone for phone in source.phones if phone.value not in known_phones]
+
+        with target._changing():
+            target.phones.extend(new_phones)
+            target.birthday = target.birthday or source.birthday
+            target.email = target.email or source.email
+            target.address = target.address or source.address
+        self.delete(source_name)
+        return target
+
+    @reading
+    def page(self, order: str, after: str = None, limit: int = None) -> tuple:
+        """
+        Return up to limit records sorted by name, next birthday or last
+        change (newest first), starting after the cursor, and the cursor
+        of the next page or None. See ContactOrders.
+        """
+        keys, cursor = self.orders.page(order, after, limit)
+        return [self.data[key] for key in keys], cursor
+
+    @reading
     def get_upcoming_birthdays(self, days_limit: int = 7):
         """
         Return a list of upcoming birthdays within the given number of days.
@@ -320,33 +782,18 @@ class AddressBook(UserDict):
         today = date.today()
         upcoming_birthdays = []
 
-        for record in self.data.values():
+        for record in self.snapshot().values():
             if not record.birthday:
                 continue
 
             birthday_date = record.birthday.value.date()
-            if birthday_date.month == 2 and birthday_date.day == 29:
-                try:
-                    birthday_this_year = birthday_date.replace(year=today.year)
-                except ValueError:
-                    birthday_this_year = date(today.year, 2, 28)
-            else:
-                birthday_this_year = birthday_date.replace(year=today.year)
-
-            if birthday_this_year < today:
-                birthday_this_year = birthday_this_year.replace(year=today.year + 1)
+            birthday_this_year, congratulation_date = next_congratulation_date(birthday_date, today)
 
             days_until_birthday = (birthday_this_year - today).days
 
             if not (0 <= days_until_birthday <= days_limit):
                 continue
 
-            congratulation_date = birthday_this_year
-            if congratulation_date.weekday() == 5:
-                congratulation_date += timedelta(days=2)
-            elif congratulation_date.weekday() == 6:
-                congratulation_date += timedelta(days=1)
-
             upcoming_birthdays.append({
                 "name": record.name.value,
                 "birthday": birthday_date.strftime(DATE_FORMAT),
@@ -356,107 +803,612 @@ class AddressBook(UserDict):
         return upcoming_birthdays
 
 
+class Note:
+    """
+    A single note: text, tags and the version stored on disk.
+    Slotted to keep millions of notes small; tags are interned so notes with
+    the same tag share one string. Notes are never changed in place (live
+    snapshots may still see them), replace() returns a changed copy.
+    Given a BlobStore, long texts are kept there and read when needed.
+    """
+    __slots__ = ("_text", "_blob", "tags", "version", "_encoded")
+
+    def __init__(self, text: str, tags=(), version: int = 0, blobs=None):
+        # (BlobStore, text number) of a text kept in a blob store
+        self._blob = None
+        if blobs is not None and len(text) >= NOTE_BLOB_MIN_SIZE:
+            self._text = None
+            self._blob = (blobs, blobs.put(text))
+        else:
+            self._text = text
+        # Unique tags in the order given
+        self.tags = tuple(dict.fromkeys(sys.intern(tag) for tag in tags if tag))
+        self.version = version
+        self._encoded = None
+
+    def __del__(self):
+        # The last note (or copy) using a stored text frees it
+        if self._blob is not None:
+            blobs, key = self._blob
+            blobs.release(key)
+
+    @property
+    def text(self) -> str:
+        """
+        The note text, read from the blob store if it is kept there.
+        """
+        if self._blob is None:
+            return self._text
+        blobs, key = self._blob
+        return blobs.get(key)
+
+    def __repr__(self):
+        return f"Note(text={self.text!r}, tags={self.tags!r}, version={self.version})"
+
+    def replace(self, blobs=None, **changes):
+        """
+        Return a copy of the note with the given attributes changed.
+        A new long text is kept in blobs; an unchanged stored text is shared.
+        """
+        if self._blob is not None and "text" not in changes:
+            note = Note("", changes.get("tags", self.tags), changes.get("version", self.version))
+            stored_in, key = self._blob
+            stored_in.retain(key)
+            note._text, note._blob = None, self._blob
+            return note
+        fields = {"text": self._text, "tags": self.tags, "version": self.version}
+        fields.update(changes)
+        return Note(**fields, blobs=blobs)
+
+    def to_dict(self) -> dict:
+        """
+        Serialize the note in the stored JSON format.
+        """
+        return {"text": self.text, "tags": list(self.tags), "version": self.version}
+
+    def encoded(self, encode) -> str:
+        """
+        Return encode(self.to_dict()), computed once per encoder since
+        notes never change in place. Notes with a stored text are encoded
+        every time, keeping the text out of memory.
+        """
+        if self._blob is not None:
+            return encode(self.to_dict())
+        if self._encoded is None or self._encoded[0] is not encode:
+            self._encoded = (encode, encode(self.to_dict()))
+        return self._encoded[1]
+
+    @classmethod
+    def from_dict(cls, data: dict, blobs=None):
+        """
+        Create a note from its stored JSON form, keeping a long text in blobs.
+        Notes saved before multiple tags have a single "tag" instead of "tags".
+        """
+        tags = data.get("tags")
+        if tags is None:
+            tags = [data["tag"]] if data.get("tag") else []
+        return cls(data.get("text", ""), tags, data.get("version", 1), blobs)
+
+
 class Notes(UserDict):
     """
     Container for text notes grouped by user name.
-    Stores note IDs, text content and optional tags per user.
+    Each user has a dict of integer note ID to Note, kept in ascending ID
+    order so notes list in order and the next ID is the last one plus one.
+    Tags are indexed as one bitmap of note numbers per tag, so tag queries
+    are answered with bitmap operations instead of scanning notes.
+    With a shard store, each user's notes are loaded on first access.
+    With a BlobStore, long note texts are kept there instead of in memory.
     """
-    def add_note(self, user_name: str, note_text: str, tag: str = None):
+    def __init__(self, *args, store=None, blobs=None, **kwargs):
+        """
+        Create the notes container together with its tag index.
+        The tag trie serves completion. Every loaded note gets a small number
+        (reused after deletion) that the tag bitmaps refer to.
+        Changed and deleted notes are remembered until the next save, notes
+        synced with another copy with the version and content digest they
+        have there.
+        The optional store provides users() and load(user_name) for lazy loading.
+        """
+        self.tag_index = Trie()
+        self.tag_bitmaps = {}
+        self.all_notes = Bitmap()
+        self.note_refs = {}
+        self.ref_keys = []
+        self.free_refs = []
+        self.dirty = set()
+        self.deleted = {}
+        self.synced_versions = {}
+        # Built on the first sync, see merkle_tree()
+        self.merkle = None
+        # Structures kept in sync with every note change, see _index_note()
+        self.indexes = []
+        self.clock = GenerationClock()
+        self.store = store
+        self.loaded_users = set()
+        self.all_loaded = store is None
+        self.blobs = blobs
+        # Readers may load users at the same time in thread-safe mode
+        self.load_lock = threading.Lock()
+        # Replaced by a shared lock in thread-safe mode, see make_thread_safe()
+        self.lock = NO_LOCK
+        super().__init__(*args, **kwargs)
+
+    def _load_user(self, user_name: str):
+        """
+        Load a user's notes from the store the first time they are needed.
+        """
+        if self.all_loaded or user_name in self.loaded_users:
+            return
+        with self.load_lock:
+            if user_name in self.loaded_users:
+                return
+            for note_id, note_data in self.store.load(user_name).items():
+                self._load_note(user_name, int(note_id), note_data)
+            self.loaded_users.add(user_name)
+
+    def _load_all(self):
         """
-        Add a new note for the given user with optional tag.
-        Generates a sequential string ID and returns it.
+        Load every user's notes, for operations that scan all of them.
         """
-        user_notes = self.data.setdefault(user_name, {})
-        if user_notes:
-            max_id = max(int(k) for k in user_notes.keys())
-            note_id = str(max_id + 1)
-        else:
-            note_id = "1"
+        if self.all_loaded:
+            return
+        for user_name in self.store.users():
+            self._load_user(user_name)
+        self.all_loaded = True
 
-        user_notes[note_id] = {"text": note_text, "tag": tag}
+    def changed_users(self) -> set:
+        """
+        Return the users whose notes changed since the last save.
+        """
+        return {user_name for user_name, _ in self.dirty} | {user_name for user_name, _ in self.deleted}
+
+    def snapshot(self) -> NotesSnapshot:
+        """
+        Return a frozen, read-only view of all notes in O(1).
+        Later changes to the notes are not visible through it.
+        """
+        return NotesSnapshot(self.data, self.clock)
+
+    def _writable_notes(self, user_name: str) -> dict:
+        """
+        Return a user's notes dict for changing, creating it if missing.
+        The outer dict and the user's dict are copied first if a live
+        snapshot still uses them; note dicts are never changed in place.
+        """
+        if self.clock.is_shared(self.data):
+            self.data = dict(self.data)
+        user_notes = self.data.get(user_name)
+        if user_notes is None:
+            user_notes = self.data[user_name] = {}
+        elif any(s.data.get(user_name) is user_notes for s in self.clock.snapshots):
+            user_notes = self.data[user_name] = dict(user_notes)
+        return user_notes
+
+    @staticmethod
+    def _note_id(note_id):
+        """
+        Convert a note ID given as text to int, or None if it is not a number.
+        """
+        try:
+            return int(note_id)
+        except (TypeError, ValueError):
+            return None
+
+    def _index_note(self, user_name: str, note_id: int, note: Note):
+        """
+        Number the note if it is new, add it to the bitmaps of its tags
+        and to the other registered structures.
+        """
+        key = (user_name, note_id)
+        for index in self.indexes:
+            index.add(key, note)
+        ref = self.note_refs.get(key)
+        if ref is None:
+            if self.free_refs:
+                ref = self.free_refs.pop()
+                self.ref_keys[ref] = key
+            else:
+                ref = len(self.ref_keys)
+                self.ref_keys.append(key)
+            self.note_refs[key] = ref
+            self.all_notes.add(ref)
+        for tag in note.tags:
+            bitmap = self.tag_bitmaps.get(tag)
+            if bitmap is None:
+                bitmap = self.tag_bitmaps[tag] = Bitmap()
+                self.tag_index.add(tag)
+            bitmap.add(ref)
+
+    def _unindex_note(self, user_name: str, note_id: int, note: Note):
+        """
+        Remove the note from the tag bitmaps and the other registered
+        structures, forget unused tags and free its number.
+        """
+        for index in self.indexes:
+            index.remove((user_name, note_id), note)
+        ref = self.note_refs.pop((user_name, note_id), None)
+        if ref is None:
+            return
+        self.all_notes.discard(ref)
+        self.ref_keys[ref] = None
+        self.free_refs.append(ref)
+        for tag in note.tags:
+            bitmap = self.tag_bitmaps.get(tag)
+            if bitmap is None:
+                continue
+            bitmap.discard(ref)
+            if not bitmap:
+                del self.tag_bitmaps[tag]
+                self.tag_index.remove(tag)
+
+    def _note_infos(self, refs) -> list:
+        """
+        Describe the notes with the given numbers, ordered by user and ID.
+        """
+        infos = []
+        for user_name, note_id in sorted(self.ref_keys[ref] for ref in refs):
+            note = self.data[user_name][note_id]
+            infos.append({"user": user_name, "id": note_id, "text": note.text, "tags": note.tags})
+        return infos
+
+    @writing
+    def add_note(self, user_name: str, note_text: str, tags=()):
+        """
+        Add a new note for the given user with optional tags.
+        Generates a sequential integer ID and returns it.
+        """
+        self._load_user(user_name)
+        user_notes = self._writable_notes(user_name)
+        note_id = next(reversed(user_notes), 0) + 1
+
+        # Version stored on disk, 0 = never saved
+        version = self.deleted.pop((user_name, note_id), 0)
+        note = user_notes[note_id] = Note(note_text, tags, version, self.blobs)
+        self.dirty.add((user_name, note_id))
+        self._index_note(user_name, note_id, note)
         return note_id
 
+    @writing
     def edit_note(self, user_name: str, note_id: str, new_text: str):
         """
         Update the text of an existing note for a user.
         Returns the note ID on success or False if not found.
         """
+        self._load_user(user_name)
+        note_id = self._note_id(note_id)
         if user_name in self.data and note_id in self.data[user_name]:
-            self.data[user_name][note_id]["text"] = new_text
+            user_notes = self._writable_notes(user_name)
+            # Tags stay the same, so only the registered structures see the new text
+            old_note = user_notes[note_id]
+            note = user_notes[note_id] = old_note.replace(self.blobs, text=new_text)
+            for index in self.indexes:
+                index.remove((user_name, note_id), old_note)
+                index.add((user_name, note_id), note)
+            self.dirty.add((user_name, note_id))
             return note_id
         return False
 
+    @reading
     def get_all_user_notes(self, user_name: str) -> dict:
         """
         Get all notes for the specified user.
-        Returns a dict of note_id to note data, or empty dict if none.
+        Returns a dict of note ID to Note, or empty dict if none.
         """
+        self._load_user(user_name)
         return self.data.get(user_name, {})
 
-    def find_notes(self, note_text: str) -> dict:
+    @reading
+    def get_note(self, user_name: str, note_id):
+        """
+        Get one note of a user by its ID (int or text).
+        Returns the Note, or None if not found.
+        """
+        return self.get_all_user_notes(user_name).get(self._note_id(note_id))
+
+    @reading
+    def find_notes(self, note_text: str, limit: int = None) -> dict:
         """
-        Search all users' notes for a substring in the text.
+        Search all users' notes for a substring in the text, stopping after limit matches.
         Returns a dict mapping usernames to lists of matching note info.
         """
+        self._load_all()
         result = defaultdict(list)
+        found = 0
 
-        for user_name, notes in self.data.items():
-            for note_id, note_data in notes.items():
-                text = note_data.get("text", "") 
-                if note_text in text:
+        for user_name, notes in self.snapshot().items():
+            for note_id, note in notes.items():
+                if note_text in note.text:
                     result[user_name].append({
-                        "id": note_id, 
-                        "text": text,
-                        "tag": note_data.get("tag")
+                        "id": note_id,
+                        "text": note.text,
+                        "tags": note.tags
                     })
+                    found += 1
+                    if found == limit:
+                        return dict(result)
+
+        return dict(result)
+
+    @reading
+    def search_notes(self, pattern: str, limit: int = None) -> dict:
+        """
+        Search all users' notes for a regular expression, stopping after limit matches.
+        Returns matches like find_notes, in the same order; large corpora are
+        scanned in worker processes (see bot.scan).
+        Raises ValueError for an invalid pattern.
+        """
+        self._load_all()
+        snapshot = self.snapshot()
+        result = defaultdict(list)
+
+        for user_name, note_id in scan_notes(list(snapshot.items()), pattern, limit):
+            note = snapshot[user_name][note_id]
+            result[user_name].append({
+                "id": note_id,
+                "text": note.text,
+                "tags": note.tags
+            })
 
         return dict(result)
 
+    @writing
     def delete_note(self, user_name: str, note_id: str):
         """
         Delete a specific note for a user by its ID.
         Returns True on success or False if user/note not found.
         """
+        self._load_user(user_name)
+        note_id = self._note_id(note_id)
         if user_name in self.data and note_id in self.data[user_name]:
-            del self.data[user_name][note_id]
+            note = self._writable_notes(user_name).pop(note_id)
+            self._unindex_note(user_name, note_id, note)
+            self.dirty.discard((user_name, note_id))
+            if note.version:
+                self.deleted[(user_name, note_id)] = note.version
             return True
 
         return False
     
+    @writing
+    def move_notes(self, source_user: str, target_user: str) -> int:
+        """
+        Move all notes of one user to another, e.g. after merging contacts.
+        Notes are stored under the user name as typed, so every spelling of
+        the source name is moved. Moved notes get new IDs after the target
+        user's notes. Returns the number of moved notes.
+        """
+        self._load_all()
+        moved = 0
+        for user_name in [name for name in self.data if name.lower() == source_user.lower()]:
+            for note_id, note in list(self.data[user_name].items()):
+                self.add_note(target_user, note.text, note.tags)
+                self.delete_note(user_name, note_id)
+                moved += 1
+        return moved
+
+    @reading
     def group_notes_by_tag(self) -> dict:
         """
-        Group all notes from all users by their tag value.
-        Notes without a tag are grouped under 'No tag'.
+        Group all notes from all users by tag, a note appears under each of its tags.
+        Notes without tags are grouped under 'No tag'.
         """
-        notes_by_tag = defaultdict(list)
+        self._load_all()
+        notes_by_tag = {}
+        tagged = Bitmap()
+        for tag, bitmap in self.tag_bitmaps.items():
+            notes_by_tag[tag] = self._note_infos(bitmap)
+            tagged |= bitmap
+
+        untagged = self.all_notes - tagged
+        if untagged:
+            notes_by_tag["No tag"] = self._note_infos(untagged)
+        return notes_by_tag
+
+    @reading
+    def find_by_tags(self, expression: str) -> list:
+        """
+        Find notes matching a boolean tag expression, e.g. 'work AND urgent NOT done'.
+        Returns note info dicts ordered by user and ID.
+        Raises ValueError for a malformed expression.
+        """
+        node = parse_tag_expression(expression)
+        self._load_all()
+        refs = evaluate_tag_expression(node, lambda tag: self.tag_bitmaps.get(tag, Bitmap()), self.all_notes)
+        return self._note_infos(refs)
+
+    @reading
+    def tag_stats(self) -> list:
+        """
+        Return (tag, number of notes) pairs, the most used tags first.
+        """
+        self._load_all()
+        return sorted(((tag, len(bitmap)) for tag, bitmap in self.tag_bitmaps.items()),
+                      key=lambda item: (-item[1], item[0]))
 
-        for user_name, notes in self.data.items():
-            for note_id, note_data in notes.items():
-                tag = note_data.get("tag")
-                if tag is None or tag == "":
-                    tag = "No tag"
-                
-                notes_by_tag[tag].append({
-                    "user": user_name,
-                    "id": note_id,
-                    "text": note_data.get("text", "")
-                })
-
-        return dict(notes_by_tag)
-    
     def to_dict(self):
         """
         Serialize all notes data to a plain dictionary.
         Useful for saving notes to JSON or other storage.
         """
-        return dict(self.data)
+        self._load_all()
+        return self.snapshot().to_dict()
+
+    def encoded_user_items(self, user_name: str, encode):
+        """
+        Yield (note ID, serialized note) pairs of one user's notes,
+        using each note's cached serialized form.
+        """
+        for note_id, note in self.get_all_user_notes(user_name).items():
+            yield str(note_id), note.encoded(encode)
 
     @classmethod
     def from_dict(cls, data):
         """
         Rebuild a Notes instance from a stored dictionary.
-        Directly assigns the inner data structure and returns the object.
+        Converts every stored note into a Note and returns the object.
         """
         obj = cls()
-        obj.data = data
+        for user_name, notes in data.items():
+            obj.data[user_name] = {}
+            for note_id, note_data in notes.items():
+                obj._load_note(user_name, int(note_id), note_data)
         return obj
+
+    @writing
+    def merge(self, stored: dict, users=None) -> list:
+        """
+        Merge the notes currently stored on disk into this container before saving.
+        Works like AddressBook.merge, note by note. A note added here whose ID
+        was taken by another session meanwhile is moved to the next free ID.
+        If users is given, only those users' notes are merged.
+        Returns a list of conflict and renumbering messages.
+        """
+        conflicts = []
+        stored = {user_name: {int(note_id): note_data for note_id, note_data in user_notes.items()}
+                  for user_name, user_notes in stored.items()}
+        keys = {key for key in self.deleted if users is None or key[0] in users}
+        for notes in (stored, self.data):
+            keys.update((user_name, note_id) for user_name, user_notes in notes.items()
+                        if users is None or user_name in users
+                        for note_id in user_notes)
+
+        renumbered = []
+        for key in keys:
+            user_name, note_id = key
+            stored_note = stored.get(user_name, {}).get(note_id)
+            stored_version = stored_note.get("version", 1) if stored_note else 0
+            note = self.data.get(user_name, {}).get(note_id)
+
+            if key in self.deleted:
+                if stored_version not in (0, self.deleted[key]):
+                    conflicts.append(f"Note #{note_id} for '{user_name}' was changed in another session, it was not deleted.")
+                    self._load_note(user_name, note_id, stored_note)
+                continue
+
+            if note is None or key not in self.dirty:
+                self._take_stored_note(user_name, note_id, stored_note)
+                continue
+
+            version = note.version
+            if not version and stored_note is not None:
+                renumbered.append(key)
+                continue
+
+            if stored_version != version:
+                conflicts.append(f"Note #{note_id} for '{user_name}' was also changed in another session, your version was kept.")
+            # A synced note is saved with at least the version it has in the other copy
+            version = max(max(stored_version, version) + 1, synced_floor(self.synced_versions, key, note))
+            self._writable_notes(user_name)[note_id] = note.replace(version=version)
+
+        # Renumber only after all stored notes are in, so new IDs are really free
+        for user_name, note_id in renumbered:
+            user_notes = self._writable_notes(user_name)
+            note = user_notes.pop(note_id)
+            self._unindex_note(user_name, note_id, note)
+            self._load_note(user_name, note_id, stored[user_name][note_id])
+            new_id = next(reversed(user_notes)) + 1
+            note = user_notes[new_id] = note.replace(version=1)
+            self._index_note(user_name, new_id, note)
+            conflicts.append(f"Note #{note_id} for '{user_name}' was added in another session, yours is now #{new_id}.")
+
+        if users is None:
+            self.dirty.clear()
+            self.deleted.clear()
+            self.synced_versions.clear()
+        else:
+            self.dirty = {key for key in self.dirty if key[0] not in users}
+            self.deleted = {key: v for key, v in self.deleted.items() if key[0] not in users}
+            self.synced_versions = {key: v for key, v in self.synced_versions.items() if key[0] not in users}
+        return conflicts
+
+    @writing
+    def reload(self, stored: dict) -> list:
+        """
+        Apply the notes stored on disk after another process changed them.
+        stored maps user names to their stored notes; users whose notes were
+        never loaded are skipped, they are read from disk when first needed.
+        Only notes without unsaved changes here are updated.
+        Returns (user name, note ID) of the updated notes.
+        """
+        changed = []
+        for user_name, stored_notes in stored.items():
+            if not (self.all_loaded or user_name in self.loaded_users):
+                continue
+            stored_notes = {int(note_id): note_data for note_id, note_data in stored_notes.items()}
+            for note_id in set(stored_notes) | set(self.data.get(user_name, {})):
+                key = (user_name, note_id)
+                if key in self.deleted or key in self.dirty:
+                    continue
+                if self._take_stored_note(user_name, note_id, stored_notes.get(note_id)):
+                    changed.append(key)
+        return sorted(changed)
+
+    @writing
+    def merkle_tree(self) -> MerkleTree:
+        """
+        Return the hash tree of all users' notes used by sync, building it
+        (and loading every user) on first use; from then on it is updated
+        with every change.
+        """
+        if self.merkle is None:
+            self._load_all()
+            tree = MerkleTree()
+            for user_name, user_notes in self.data.items():
+                for note_id, note in user_notes.items():
+                    tree.add((user_name, note_id), note)
+            self.indexes.append(tree)
+            self.merkle = tree
+        return self.merkle
+
+    @writing
+    def take_synced(self, user_name: str, note_id: int, note_data: dict):
+        """
+        Put a note from another copy of the notes (see bot.sync) in as a
+        change made here, like AddressBook.take_synced.
+        """
+        self._load_user(user_name)
+        key = (user_name, note_id)
+        note = self.data.get(user_name, {}).get(note_id)
+        version = note.version if note is not None else self.deleted.pop(key, 0)
+        self._load_note(user_name, note_id, {**note_data, "version": version})
+        self.dirty.add(key)
+        self.synced_versions[key] = (note_data.get("version", 1), MerkleTree.digest(key, self.data[user_name][note_id]))
+
+    def _take_stored_note(self, user_name: str, note_id: int, stored_note) -> bool:
+        """
+        Bring a note without local changes to its stored state: add,
+        replace or remove it. Returns True if anything changed.
+        """
+        note = self.data.get(user_name, {}).get(note_id)
+        if note is None:
+            if stored_note is None:
+                return False
+            self._load_note(user_name, note_id, stored_note)
+            return True
+        if stored_note is None:
+            self._unindex_note(user_name, note_id, self._writable_notes(user_name).pop(note_id))
+            return True
+        if stored_note.get("version", 1) != note.version:
+            self._load_note(user_name, note_id, stored_note)
+            return True
+        return False
+
+    def _load_note(self, user_name: str, note_id: int, note_data: dict):
+        """
+        Put a stored note into the container as-is, without marking it changed.
+        Keeps the user's notes in ascending ID order.
+        """
+        user_notes = self._writable_notes(user_name)
+        note = Note.from_dict(note_data, self.blobs)
+        if note_id in user_notes:
+            self._unindex_note(user_name, note_id, user_notes[note_id])
+            user_notes[note_id] = note
+        elif user_notes and note_id < next(reversed(user_notes)):
+            user_notes[note_id] = note
+            ordered = sorted(user_notes.items())
+            user_notes.clear()
+            user_notes.update(ordered)
+        else:
+            user_notes[note_id] = note
+        self._index_note(user_name, note_id, note)
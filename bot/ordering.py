@@ -0,0 +1,181 @@
+from bisect import bisect_left, bisect_right, insort
+from datetime import date
+import threading
+
+from bot.constants import ORDERS_RESORT_MIN
+
+
+def _remove(entries: list, entry):
+    """
+    Remove an entry from a sorted list if present.
+    """
+    i = bisect_left(entries, entry)
+    if i < len(entries) and entries[i] == entry:
+        del entries[i]
+
+
+class ContactOrders:
+    """
+    Contact keys kept sorted by name, by birthday and by last change.
+    Registered in AddressBook.indexes, so a changed contact is moved with
+    bisect instead of sorting the book again, and a page starts at a
+    position found by bisect: reading one costs O(log N + page).
+    Pages continue after a cursor naming the position of the last contact
+    of the previous page, so changes between pages shift nothing.
+    Added contacts wait in a list until the orders are next used, so loading
+    a whole book sorts once instead of inserting every contact.
+    """
+    ORDERS = ("name", "birthday", "modified")
+
+    def __init__(self):
+        """
+        Create empty orders.
+        """
+        self.by_name = []
+        # (month, day, key) of contacts with a birthday
+        self.by_birthday = []
+        # (change number, key), the most recently changed contact last
+        self.by_change = []
+        self.change_of = {}
+        self.changes = 0
+        # (key, birthday entry or None) added since the last _merge()
+        self.pending = []
+        # Readers sharing the server's read lock may merge at the same time
+        self.merge_lock = threading.Lock()
+
+    def _merge(self):
+        """
+        Move the pending contacts into the name and birthday orders.
+        """
+        with self.merge_lock:
+            if not self.pending:
+                return
+            birthdays = [entry for _, entry in self.pending if entry is not None]
+            if len(self.pending) < ORDERS_RESORT_MIN:
+                for key, _ in self.pending:
+                    insort(self.by_name, key)
+                for entry in birthdays:
+                    insort(self.by_birthday, entry)
+            else:
+                self.by_name.extend(key for key, _ in self.pending)
+                self.by_name.sort()
+                self.by_birthday.extend(birthdays)
+                self.by_birthday.sort()
+            self.pending = []
+
+    def add(self, key: str, record):
+        """
+        Put a contact into every order; it becomes the most recently changed.
+        """
+        entry = None
+        if record.birthday:
+            birthday = record.birthday.value
+            entry = (birthday.month, birthday.day, key)
+        self.pending.append((key, entry))
+        # Change numbers only grow, so this order stays sorted by appending
+        self.changes += 1
+        self.change_of[key] = self.changes
+        self.by_change.append((self.changes, key))
+
+    def remove(self, key: str, record):
+        """
+        Take a contact out of every order.
+        """
+        self._merge()
+        _remove(self.by_name, key)
+        if record.birthday:
+            birthday = record.birthday.value
+            _remove(self.by_birthday, (birthday.month, birthday.day, key))
+        number = self.change_of.pop(key, None)
+        if number is not None:
+            _remove(self.by_change, (number, key))
+
+    def names(self) -> list:
+        """
+        Return the contact keys sorted by name. The list is the order itself,
+        so it must not be changed and is only valid until the next change.
+        """
+        self._merge()
+        return self.by_name
+
+    @staticmethod
+    def _cursor(order: str, entry) -> str:
+        """
+        Return the cursor text for an entry of an order.
+        """
+        if order == "name":
+            return entry
+        if order == "birthday":
+            month, day, key = entry
+            return f"{day:02}.{month:02}:{key}"
+        number, key = entry
+        return str(number)
+
+    @staticmethod
+    def _parse_cursor(order: str, cursor: str):
+        """
+        Return the order entry a cursor points at.
+        """
+        try:
+            if order == "name":
+                return cursor.capitalize()
+            if order == "birthday":
+                day_month, key = cursor.split(":", 1)
+                day, month = (int(part) for part in day_month.split("."))
+                return (month, day, key.capitalize())
+            return (int(cursor),)
+        except ValueError:
+            raise ValueError(f"Invalid cursor '{cursor}' for sorting by {order}")
+
+    def _positions(self, order: str, after, today: date):
+        """
+        Yield the positions of the entries that follow the cursor entry
+        (or all entries), in display order.
+        """
+        if order == "name":
+            start = 0 if after is None else bisect_right(self.by_name, after)
+            yield from range(start, len(self.by_name))
+        elif order == "modified":
+            # Newest first, so walk the change list backwards
+            end = len(self.by_change) if after is None else bisect_left(self.by_change, after)
+            yield from range(end - 1, -1, -1)
+        else:
+            # The year starts today and wraps around to yesterday
+            today_start = bisect_left(self.by_birthday, (today.month, today.day))
+            if after is None:
+                yield from range(today_start, len(self.by_birthday))
+                yield from range(0, today_start)
+                return
+            start = bisect_right(self.by_birthday, after)
+            if after >= (today.month, today.day):
+                yield from range(start, len(self.by_birthday))
+                yield from range(0, today_start)
+            else:
+                yield from range(start, today_start)
+
+    def page(self, order: str, after: str = None, limit: int = None, today: date = None):
+        """
+        Return the keys of up to limit contacts in the given order, starting
+        after the cursor, and the cursor of the next page (None on the last one).
+        Sorting by birthday lists contacts with a birthday, the next first.
+        """
+        if order not in self.ORDERS:
+            raise ValueError(f"Unknown sort order '{order}', use one of: {', '.join(self.ORDERS)}")
+        self._merge()
+        entries = {"name": self.by_name, "birthday": self.by_birthday,
+                   "modified": self.by_change}[order]
+        after_entry = None if after is None else self._parse_cursor(order, after)
+
+        selected = []
+        for position in self._positions(order, after_entry, today or date.today()):
+            if limit is not None and len(selected) == limit:
+                return [self._key(order, entry) for entry in selected], self._cursor(order, selected[-1])
+            selected.append(entries[position])
+        return [self._key(order, entry) for entry in selected], None
+
+    @staticmethod
+    def _key(order: str, entry) -> str:
+        """
+        Return the contact key of an order entry.
+        """
+        return entry if order == "name" else entry[-1]
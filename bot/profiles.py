@@ -0,0 +1,96 @@
+from collections import OrderedDict
+from pathlib import Path
+import re
+
+from bot.constants import DEFAULT_PROFILE, PROFILE_CACHE_SIZE, USERS_DATA
+from bot.locking import make_thread_safe
+from bot.storage import DATA_DIR, load_from_json, load_notes, save_notes, save_to_json
+
+PROFILES_DIR = DATA_DIR / 'profiles'
+PROFILE_NAME = re.compile(r"^[\w-]+$")
+
+
+def profile_directory(name: str) -> Path:
+    """
+    Return the data directory of a profile; the default profile uses DATA_DIR.
+    Raises ValueError for names that are not usable as a directory name.
+    """
+    if name == DEFAULT_PROFILE:
+        return DATA_DIR
+    if not PROFILE_NAME.match(name):
+        raise ValueError(f"Invalid profile name '{name}', use letters, digits, '-' and '_'")
+    return PROFILES_DIR / name
+
+
+def profile_names() -> list:
+    """
+    Return the names of all profiles, the default one first.
+    """
+    names = sorted(path.name for path in PROFILES_DIR.glob("*") if path.is_dir())
+    return [DEFAULT_PROFILE] + [name for name in names if name != DEFAULT_PROFILE]
+
+
+class Profile:
+    """
+    One address book: contacts and notes loaded from the profile's own
+    data directory, guarded by a shared lock.
+    """
+    def __init__(self, name: str):
+        """
+        Load the profile, creating its data directory if it is new.
+        """
+        self.name = name
+        self.directory = profile_directory(name)
+        self.directory.mkdir(exist_ok=True, parents=True)
+        self.book = load_from_json('users.json', USERS_DATA, self.directory)
+        self.notes = load_notes(self.directory)
+        self.lock = make_thread_safe(self.book, self.notes)
+
+    def save(self) -> list:
+        """
+        Save the contacts and changed notes. Returns the list of merge conflicts.
+        """
+        with self.lock.write():
+            return save_to_json(self.book, 'users.json', self.directory) + save_notes(self.notes)
+
+
+class ProfileCache:
+    """
+    Loaded profiles, least recently used first. Using a profile that is not
+    loaded loads it; when more than size profiles are loaded, the least
+    recently used one is saved and dropped, so memory stays bounded while
+    switching between recently used profiles needs no loading.
+    """
+    def __init__(self, size: int = PROFILE_CACHE_SIZE):
+        """
+        Create an empty cache keeping at most size profiles loaded.
+        """
+        self.size = max(size, 1)
+        self.loaded = OrderedDict()
+        self.current = None
+
+    def use(self, name: str) -> list:
+        """
+        Make a profile the current one, loading it if needed.
+        Returns the merge conflicts of the profiles saved on eviction.
+        """
+        profile = self.loaded.get(name)
+        if profile is None:
+            profile = self.loaded[name] = Profile(name)
+        self.loaded.move_to_end(name)
+        self.current = profile
+
+        conflicts = []
+        while len(self.loaded) > self.size:
+            _, evicted = self.loaded.popitem(last=False)
+            conflicts += evicted.save()
+        return conflicts
+
+    def save_all(self) -> list:
+        """
+        Save every loaded profile. Returns the list of merge conflicts.
+        """
+        conflicts = []
+        for profile in self.loaded.values():
+            conflicts += profile.save()
+        return conflicts
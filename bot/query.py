@@ -0,0 +1,257 @@
+import re
+
+from bot.constants import (
+    DATE_FORMAT,
+    QUERY_INDEX_LIMIT,
+    QUERY_SCAN_SELECTIVITY,
+)
+
+# field:value, e.g. name:jo, email:@gmail.com, bday:05
+PREDICATE_PATTERN = re.compile(r"^(name|phone|email|address|bday|birthday):(.+)$", re.IGNORECASE)
+
+
+class Predicate:
+    """
+    One field condition of a contact query.
+    name and phone match by prefix, email and address by substring,
+    and bday by month (MM), day and month (DD.MM) or full date.
+    """
+    def __init__(self, field: str, value: str):
+        """
+        Store the normalized field and value of the condition.
+        """
+        self.field = "bday" if field.lower() == "birthday" else field.lower()
+        self.value = value.lower()
+
+    def __str__(self):
+        return f"{self.field}:{self.value}"
+
+    def matches(self, record) -> bool:
+        """
+        Check the condition against a single record.
+        """
+        if self.field == "name":
+            return record.name.value.lower().startswith(self.value)
+        if self.field == "phone":
+            return any(phone.value.startswith(self.value) for phone in record.phones)
+        if self.field == "email":
+            return bool(record.email) and self.value in record.email.value.lower()
+        if self.field == "address":
+            return bool(record.address) and self.value in record.address.value.lower()
+        if not record.birthday:
+            return False
+        birthday = record.birthday.value.strftime(DATE_FORMAT)
+        if len(self.value) <= 2:
+            return birthday[3:5] == self.value.zfill(2)
+        return birthday.startswith(self.value)
+
+    def lookup(self, book):
+        """
+        Find the matching contact keys through an index, if one applies.
+        Returns (keys, index description, exact); keys is None when the
+        condition has to be checked record by record, and exact is False when
+        keys is a superset that still has to be checked record by record.
+        """
+        index = book.contact_index
+        if self.field == "name":
+            names = book.name_index.trie.starts_with(self.value, QUERY_INDEX_LIMIT + 1)
+            if len(names) <= QUERY_INDEX_LIMIT:
+                return {name.capitalize() for name in names}, "name trie", True
+        elif self.field == "phone":
+            keys = index.phone_prefix(self.value, QUERY_INDEX_LIMIT)
+            if keys is not None:
+                return keys, "phone trie", True
+        elif self.field == "email" and self.value.startswith("@"):
+            # An address holds one '@', so containing '@text' means a domain starting with text
+            return index.domain_prefix(self.value[1:]), "e-mail domain index", True
+        elif self.field == "bday":
+            month = self.value.zfill(2) if len(self.value) <= 2 else self.value[3:5]
+            if month.isdigit():
+                # Only a month alone is answered exactly; a day or year is checked afterwards
+                return index.birth_months.get(int(month), set()), "birth month index", len(self.value) <= 2
+        return None, None, False
+
+
+class QueryStep:
+    """
+    A predicate together with how it is evaluated and its estimated cardinality.
+    """
+    def __init__(self, predicate: Predicate, keys, index: str, exact: bool, estimate: int):
+        self.predicate = predicate
+        self.keys = keys
+        self.index = index
+        self.exact = exact
+        self.estimate = estimate
+        self.action = None
+        self.rows = None
+
+
+class QueryPlan:
+    """
+    Evaluation order for a multi-predicate contact query.
+    Indexed steps run first, from the most selective one, then the record
+    checks, also most selective first. The first step produces the
+    candidate set (from an index or a full scan), indexed steps intersect it
+    and the remaining steps filter it record by record. An index that only
+    narrows the candidates down is followed by a check of its predicate.
+    """
+    def __init__(self, book, predicates: list):
+        """
+        Estimate every predicate and order the steps: indexed ones first,
+        each group by estimated cardinality.
+        """
+        self.book = book
+        self.total = len(book)
+        self.steps = []
+        for predicate in predicates:
+            keys, index, exact = predicate.lookup(book)
+            if keys is not None:
+                estimate = len(keys)
+            else:
+                estimate = int(self.total * QUERY_SCAN_SELECTIVITY)
+            self.steps.append(QueryStep(predicate, keys, index, exact, estimate))
+        # A scan reads every contact whatever its estimate (which rounds down to
+        # 0 on a small book), so indexed steps always run first, smallest first
+        self.steps.sort(key=lambda step: (step.keys is None, step.estimate))
+
+    def execute(self) -> list:
+        """
+        Run the plan and return matching records sorted by name.
+        """
+        snapshot = self.book.snapshot()
+        candidates = None
+        for step in self.steps:
+            if step.keys is None:
+                if candidates is None:
+                    step.action = "full scan"
+                    candidates = set(snapshot)
+                else:
+                    step.action = "filter"
+                check = True
+            else:
+                if candidates is None:
+                    step.action = "index"
+                    candidates = set(step.keys)
+                else:
+                    step.action = "intersect"
+                    candidates &= step.keys
+                check = not step.exact
+                if check:
+                    step.action += "+check"
+            if check:
+                candidates = {key for key in candidates
+                              if key in snapshot and step.predicate.matches(snapshot[key])}
+            step.rows = len(candidates)
+            if not candidates:
+                break
+
+        return [snapshot[key] for key in sorted(candidates or ()) if key in snapshot]
+
+    def explain(self) -> str:
+        """
+        Describe the chosen plan with estimated and, once executed, actual rows.
+        """
+        lines = [f"Query plan over {self.total} contacts:"]
+        for number, step in enumerate(self.steps, 1):
+            action = step.action or "skipped"
+            source = step.index or "record check"
+            actual = f"{step.rows} rows" if step.action else "-"
+            lines.append(f"  {number}. {action:<15} {str(step.predicate):<24} {source:<20}"
+                         f" est. {step.estimate} -> {actual}")
+        return "\n".join(lines)
+
+
+def parse_query(args: list):
+    """
+    Parse find arguments into predicates if they form a field query.
+    Returns a list of Predicate objects, or None for a plain search.
+    """
+    predicates = []
+    for arg in args:
+        match = PREDICATE_PATTERN.match(arg)
+        if not match:
+            return None
+        predicates.append(Predicate(*match.groups()))
+    return predicates or None
+
+
+# Tag expressions: tags combined with AND, OR, NOT and parentheses
+TAG_TOKEN_PATTERN = re.compile(r"[()]|[^\s()]+")
+TAG_OPERATORS = {"AND", "OR", "NOT"}
+
+
+def parse_tag_expression(text: str):
+    """
+    Parse a boolean tag expression into a tree of tuples:
+    ("tag", name), ("not", node), ("and", left, right), ("or", left, right).
+    NOT binds tightest, then AND, then OR; tags next to each other are
+    joined with AND, so 'work urgent NOT done' = 'work AND urgent AND NOT done'.
+    Raises ValueError for a malformed expression.
+    """
+    tokens = TAG_TOKEN_PATTERN.findall(text)
+    position = 0
+
+    def peek():
+        return tokens[position] if position < len(tokens) else None
+
+    def take():
+        nonlocal position
+        token = peek()
+        if token is None:
+            raise ValueError("Unexpected end of tag expression")
+        position += 1
+        return token
+
+    def parse_or():
+        node = parse_and()
+        while peek() == "OR":
+            take()
+            node = ("or", node, parse_and())
+        return node
+
+    def parse_and():
+        node = parse_not()
+        while peek() is not None and peek() not in ("OR", ")"):
+            if peek() == "AND":
+                take()
+            node = ("and", node, parse_not())
+        return node
+
+    def parse_not():
+        token = take()
+        if token == "NOT":
+            return ("not", parse_not())
+        if token == "(":
+            node = parse_or()
+            if take() != ")":
+                raise ValueError("Missing ')' in tag expression")
+            return node
+        if token in TAG_OPERATORS or token == ")":
+            raise ValueError(f"Unexpected '{token}' in tag expression")
+        return ("tag", token)
+
+    node = parse_or()
+    if peek() is not None:
+        raise ValueError(f"Unexpected '{peek()}' in tag expression")
+    return node
+
+
+def evaluate_tag_expression(node, lookup, universe):
+    """
+    Evaluate a parsed tag expression over bitmaps.
+    lookup(tag) returns the Bitmap of notes with a tag, universe the Bitmap
+    of all notes. 'a AND NOT b' is a difference, without complementing b.
+    """
+    kind = node[0]
+    if kind == "tag":
+        return lookup(node[1])
+    if kind == "not":
+        return universe - evaluate_tag_expression(node[1], lookup, universe)
+    left = evaluate_tag_expression(node[1], lookup, universe)
+    if kind == "or":
+        return left | evaluate_tag_expression(node[2], lookup, universe)
+    if node[2][0] == "not":
+        return left - evaluate_tag_expression(node[2][1], lookup, universe)
+    if not left:
+        return left
+    return left & evaluate_tag_expression(node[2], lookup, universe)
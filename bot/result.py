@@ -0,0 +1,109 @@
+import json
+
+# Compact encoder for one JSON object per line
+encode_line = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+
+
+class Result:
+    """
+    Outcome of a command: a severity, an optional message and result rows.
+    Rows are model objects or plain dicts; they are turned into text only
+    when the result is displayed, and into data for JSON consumers.
+    next_page holds the arguments of the following page of a paged listing.
+    """
+    SUCCESS = "success"
+    INFO = "info"
+    WARNING = "warning"
+    ERROR = "error"
+
+    __slots__ = ("severity", "message", "rows", "formatter", "next_page")
+
+    def __init__(self, message: str = None, rows=(), severity: str = SUCCESS, formatter=str,
+                 next_page: dict = None):
+        """
+        Create a result; formatter turns one row into its display text, or is
+        None when the message already shows the rows in a layout of its own.
+        """
+        self.severity = severity
+        self.message = message
+        self.rows = rows
+        self.formatter = formatter
+        self.next_page = next_page
+
+    @classmethod
+    def success(cls, message: str = None, rows=(), formatter=str, next_page: dict = None):
+        return cls(message, rows, cls.SUCCESS, formatter, next_page)
+
+    @classmethod
+    def info(cls, message: str = None, rows=(), formatter=str):
+        return cls(message, rows, cls.INFO, formatter)
+
+    @classmethod
+    def warning(cls, message: str = None, rows=(), formatter=str):
+        return cls(message, rows, cls.WARNING, formatter)
+
+    @classmethod
+    def error(cls, message: str = None, rows=(), formatter=str):
+        return cls(message, rows, cls.ERROR, formatter)
+
+    @property
+    def ok(self) -> bool:
+        return self.severity != self.ERROR
+
+    def lines(self):
+        """
+        Yield the display text of the message and of every row.
+        """
+        if self.message:
+            yield self.message
+        if self.formatter is not None:
+            for row in self.rows:
+                yield self.formatter(row)
+
+    def __str__(self):
+        return "\n".join(self.lines())
+
+    def ndjson_lines(self):
+        """
+        Yield one JSON line per row, built from the row data without the
+        display text; a result without rows yields its severity and message.
+        A paged listing ends with a {"next": {...}} line for the next page.
+        """
+        empty = True
+        for row in self.rows:
+            empty = False
+            yield encode_line(row_to_dict(row)) + "\n"
+        if empty:
+            yield encode_line({"severity": self.severity, "message": self.message}) + "\n"
+        if self.next_page:
+            yield encode_line({"next": self.next_page}) + "\n"
+
+    def to_dict(self) -> dict:
+        """
+        Serialize the result with its rows as data and its display text.
+        """
+        return {
+            "ok": self.ok,
+            "severity": self.severity,
+            "message": self.message,
+            "rows": [row_to_dict(row) for row in self.rows],
+            "next": self.next_page,
+            "text": str(self),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        """
+        Rebuild a serialized result for display: its rows come already
+        rendered in the text.
+        """
+        return cls(data.get("text"), severity=data.get("severity", cls.SUCCESS))
+
+
+def row_to_dict(row):
+    """
+    Convert a result row to JSON-serializable data.
+    """
+    if hasattr(row, "to_dict"):
+        return row.to_dict()
+    return row
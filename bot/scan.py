@@ -0,0 +1,99 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import islice
+import os
+import re
+
+from bot.constants import REGEX_CACHE_SIZE, SCAN_CHUNKS_PER_WORKER, SCAN_PARALLEL_MIN_NOTES
+
+# Worker processes, started on the first large scan and reused after it
+_pool = None
+
+
+@lru_cache(maxsize=REGEX_CACHE_SIZE)
+def compile_pattern(pattern: str) -> re.Pattern:
+    """
+    Compile a regular expression, reusing recently compiled ones.
+    Raises ValueError for an invalid pattern.
+    """
+    try:
+        return re.compile(pattern)
+    except re.error as e:
+        raise ValueError(f"Invalid regular expression '{pattern}': {e}")
+
+
+def _scan_chunk(pattern: str, chunk: list, limit: int = None) -> list:
+    """
+    Return (user name, note ID) of the notes in a chunk whose text matches,
+    in chunk order, stopping after limit matches.
+    A chunk is a list of (user name, [(note ID, text), ...]).
+    """
+    search = compile_pattern(pattern).search
+    found = []
+    for user_name, texts in chunk:
+        for note_id, text in texts:
+            if search(text):
+                found.append((user_name, note_id))
+                if limit is not None and len(found) >= limit:
+                    return found
+    return found
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor()
+    return _pool
+
+
+def _chunks(users: list, size: int):
+    """
+    Split users into chunks of about size notes, keeping users whole and in order.
+    Texts are read here, since notes (and their blob store) stay in this process.
+    """
+    chunk, count = [], 0
+    for user_name, user_notes in users:
+        chunk.append((user_name, [(note_id, note.text) for note_id, note in user_notes.items()]))
+        count += len(user_notes)
+        if count >= size:
+            yield chunk
+            chunk, count = [], 0
+    if chunk:
+        yield chunk
+
+
+def scan_notes(users: list, pattern: str, limit: int = None) -> list:
+    """
+    Return (user name, note ID) of the notes whose text matches a regular
+    expression, in the order given, at most limit of them.
+    users is a list of (user name, {note ID: Note}) in the order to report.
+    Large corpora are split by user into chunks scanned by a process pool;
+    results are merged in chunk order and no more chunks are sent once limit
+    matches are known. Small ones are scanned here, where the pool would
+    cost more than it saves.
+    """
+    compile_pattern(pattern)
+    total = sum(len(user_notes) for _, user_notes in users)
+    workers = os.cpu_count() or 1
+    if total < SCAN_PARALLEL_MIN_NOTES or workers < 2:
+        texts = ((user_name, ((note_id, note.text) for note_id, note in user_notes.items()))
+                 for user_name, user_notes in users)
+        return _scan_chunk(pattern, texts, limit)
+
+    pool = _get_pool()
+    chunks = _chunks(users, max(total // (workers * SCAN_CHUNKS_PER_WORKER), 1))
+    # Keep every worker busy, but read and send the texts of a chunk only shortly before it is needed
+    running = deque(pool.submit(_scan_chunk, pattern, chunk, limit) for chunk in islice(chunks, workers * 2))
+    found = []
+    try:
+        while running:
+            found.extend(running.popleft().result())
+            if limit is not None and len(found) >= limit:
+                return found[:limit]
+            for chunk in islice(chunks, 1):
+                running.append(pool.submit(_scan_chunk, pattern, chunk, limit))
+        return found
+    finally:
+        for future in running:
+            future.cancel()
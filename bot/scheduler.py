@@ -0,0 +1,135 @@
+from datetime import date, datetime, time, timedelta
+import heapq
+import threading
+
+from bot.constants import DATE_FORMAT, REMINDER_HOUR, REMINDER_MAX_SLEEP
+from bot.models import AddressBook, next_congratulation_date
+
+
+class BirthdayScheduler:
+    """
+    Fires a reminder on the congratulation day of every contact's birthday.
+    Keeps the next congratulation dates in a heap that the AddressBook updates
+    on every record change (as one of its indexes), so waking up costs
+    O(log N) and the book is never rescanned.
+    """
+    def __init__(self, book: AddressBook, notify, hour: int = REMINDER_HOUR):
+        """
+        Schedule all contacts of the book and subscribe to its changes.
+        notify is called with the reminder text, from the scheduler thread.
+        """
+        self.book = book
+        self.notify = notify
+        self.at = time(hour)
+        self.heap = []
+        # Current congratulation date per contact; heap entries that do not
+        # match it are stale and skipped when popped
+        self.dates = {}
+        self.queued = set()
+        self.fired = {}
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopped = False
+
+        for key, record in book.snapshot().items():
+            self.add(key, record)
+        book.indexes.append(self)
+
+    def add(self, key: str, record, today: date = None):
+        """
+        Schedule the next congratulation of a contact, if it has a birthday.
+        A reminder already fired for a date is not scheduled again.
+        """
+        if not record.birthday:
+            return
+        today = today or date.today()
+        birthday = record.birthday.value.date()
+        _, when = next_congratulation_date(birthday, today)
+
+        with self.lock:
+            if self.fired.get(key) == when:
+                _, when = next_congratulation_date(birthday, when + timedelta(days=1))
+            self.dates[key] = when
+            if (when, key) not in self.queued:
+                self.queued.add((when, key))
+                heapq.heappush(self.heap, (when, key))
+                # Wake the thread up if this is now the earliest reminder
+                if self.heap[0] == (when, key):
+                    self.wakeup.set()
+
+    def remove(self, key: str, record):
+        """
+        Cancel the scheduled congratulation of a contact.
+        """
+        with self.lock:
+            self.dates.pop(key, None)
+
+    def _pop_due(self, now: datetime) -> list:
+        """
+        Remove and return (date, key) of all reminders due at the given time.
+        """
+        due = []
+        with self.lock:
+            while self.heap and datetime.combine(self.heap[0][0], self.at) <= now:
+                when, key = heapq.heappop(self.heap)
+                self.queued.discard((when, key))
+                if self.dates.get(key) == when:
+                    del self.dates[key]
+                    self.fired[key] = when
+                    due.append((when, key))
+        return due
+
+    def next_time(self):
+        """
+        Return the time of the earliest reminder, or None if nothing is scheduled.
+        """
+        with self.lock:
+            while self.heap and self.dates.get(self.heap[0][1]) != self.heap[0][0]:
+                self.queued.discard(heapq.heappop(self.heap))
+            if not self.heap:
+                return None
+            return datetime.combine(self.heap[0][0], self.at)
+
+    def fire_due(self, now: datetime = None):
+        """
+        Send reminders that are due and schedule those contacts for next year.
+        """
+        now = now or datetime.now()
+        for when, key in self._pop_due(now):
+            record = self.book.find(key)
+            if record is None or not record.birthday:
+                continue
+            birthday = record.birthday.value.strftime(DATE_FORMAT)
+            self.notify(f"Reminder: congratulate {record.name.value} today, birthday {birthday}")
+            self.add(key, record, when + timedelta(days=1))
+
+    def run(self):
+        """
+        Sleep until the next reminder is due and fire it, until stopped.
+        Sleeps are capped so clock changes are picked up.
+        """
+        while not self.stopped:
+            self.fire_due()
+            next_time = self.next_time()
+            timeout = REMINDER_MAX_SLEEP
+            if next_time is not None:
+                timeout = min(timeout, max(0, (next_time - datetime.now()).total_seconds()))
+            self.wakeup.wait(timeout)
+            self.wakeup.clear()
+
+    def start(self):
+        """
+        Run the scheduler in a background daemon thread.
+        """
+        threading.Thread(target=self.run, name="birthday-scheduler", daemon=True).start()
+
+    def stop(self):
+        """
+        Stop the background thread and unsubscribe from the book's changes,
+        so a book used again after a profile switch gets a single scheduler.
+        """
+        self.stopped = True
+        self.wakeup.set()
+        with self.book.lock.write():
+            if self in self.book.indexes:
+                self.book.indexes.remove(self)
@@ -0,0 +1,538 @@
+from bisect import insort
+from heapq import heappop, heappush
+
+
+def edit_distance(a: str, b: str, max_distance: int = None) -> int:
+    """
+    Compute the optimal string alignment distance between two strings:
+    the Levenshtein distance where swapping two adjacent characters also
+    counts as one edit ("jhon" is one edit from "john").
+    If max_distance is given, stops early and returns max_distance + 1
+    as soon as the distance is known to exceed it.
+    """
+    if a == b:
+        return 0
+    if len(a) < len(b):
+        a, b = b, a
+    if max_distance is not None and len(a) - len(b) > max_distance:
+        return max_distance + 1
+
+    # Equal ends take no edits, so only the differing middle is compared
+    start = 0
+    while start < len(b) and a[start] == b[start]:
+        start += 1
+    end = 0
+    while end < len(b) - start and a[-1 - end] == b[-1 - end]:
+        end += 1
+    a, b = a[start:len(a) - end], b[start:len(b) - end]
+
+    # Cells further than max_distance from the diagonal cannot be within it,
+    # so only the band around it is computed; the rest hold "too far"
+    band = len(a) if max_distance is None else max_distance
+    before = None
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [band + 1] * (len(b) + 1)
+        if i <= band:
+            current[0] = i
+        lowest = current[0]
+        for j in range(max(1, i - band), min(len(b), i + band) + 1):
+            char_b = b[j - 1]
+            # The minimum of the three moves, compared inline as this loop is hot
+            cell = previous[j - 1] + (char_a != char_b)
+            if previous[j] < cell:
+                cell = previous[j] + 1
+            if current[j - 1] < cell:
+                cell = current[j - 1] + 1
+            if before is not None and j > 1 and char_a == b[j - 2] and a[i - 2] == char_b and before[j - 2] < cell:
+                cell = before[j - 2] + 1
+            current[j] = cell
+            if cell < lowest:
+                lowest = cell
+        if max_distance is not None and lowest > max_distance:
+            return max_distance + 1
+        before, previous = previous, current
+    return previous[-1]
+
+
+def deletions(word: str) -> set:
+    """
+    Return the strings made by deleting one character of a word.
+    """
+    return {word[:i] + word[i + 1:] for i in range(len(word))}
+
+
+def soundex(word: str) -> str:
+    """
+    Return the classic 4-character Soundex code of a word.
+    Names that sound alike ("Jon", "John") share the same code.
+    """
+    codes = {
+        **dict.fromkeys("bfpv", "1"),
+        **dict.fromkeys("cgjkqsxz", "2"),
+        **dict.fromkeys("dt", "3"),
+        "l": "4",
+        **dict.fromkeys("mn", "5"),
+        "r": "6",
+    }
+    word = word.lower()
+    if not word:
+        return ""
+
+    result = word[0].upper()
+    last_code = codes.get(word[0], "")
+    for char in word[1:]:
+        code = codes.get(char, "")
+        if code and code != last_code:
+            result += code
+        # 'h' and 'w' do not separate letters with the same code
+        if char not in "hw":
+            last_code = code
+    return (result + "000")[:4]
+
+
+class Trie:
+    """
+    Prefix tree over words.
+    Each node is a dict of child nodes keyed by character; a complete word
+    is marked by storing it under the END key of its last node.
+    """
+    END = ""
+
+    def __init__(self):
+        """
+        Create an empty trie.
+        """
+        self.root = {}
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, word):
+        node = self._node(word)
+        return node is not None and self.END in node
+
+    def _node(self, prefix: str):
+        """
+        Return the node reached by following the prefix, or None.
+        """
+        node = self.root
+        for char in prefix:
+            node = node.get(char)
+            if node is None:
+                return None
+        return node
+
+    def add(self, word: str):
+        """
+        Insert a word into the trie.
+        Does nothing if the word is already present.
+        """
+        node = self.root
+        for char in word:
+            node = node.setdefault(char, {})
+        if self.END not in node:
+            node[self.END] = word
+            self.size += 1
+
+    def remove(self, word: str):
+        """
+        Remove a word from the trie and prune nodes left empty.
+        Returns True if the word was present.
+        """
+        path = [self.root]
+        for char in word:
+            node = path[-1].get(char)
+            if node is None:
+                return False
+            path.append(node)
+        if self.END not in path[-1]:
+            return False
+
+        del path[-1][self.END]
+        self.size -= 1
+        for depth in range(len(word), 0, -1):
+            if path[depth]:
+                break
+            del path[depth - 1][word[depth - 1]]
+        return True
+
+    def starts_with(self, prefix: str, limit: int = None) -> list:
+        """
+        Return words beginning with the prefix in alphabetical order.
+        Stops after limit words, so cost depends on the result size
+        rather than on the number of stored words.
+        """
+        node = self._node(prefix)
+        if node is None:
+            return []
+
+        words = []
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if self.END in node:
+                words.append(node[self.END])
+                if limit is not None and len(words) >= limit:
+                    break
+            stack.extend(node[char] for char in sorted(node, reverse=True)
+                         if char != self.END)
+        return words
+
+    def search(self, query: str, max_distance: int, limit: int = None, rank=None) -> list:
+        """
+        Find words within max_distance edits of the query.
+        Walks the trie once, nearest branches first, carrying the last two rows
+        of the edit_distance() table per node and abandoning a branch as soon
+        as every cell of its row exceeds the radius.
+        With a limit, only the limit best (distance, rank(word), word) matches
+        are kept and, once that many are found, the radius shrinks to the
+        worst of them. Returns (distance, word) pairs, nearest first.
+        """
+        best = []
+        bound = max_distance
+        size = len(query)
+
+        def found(distance, word):
+            nonlocal bound
+            insort(best, (distance, rank(word) if rank else 0, word))
+            if limit is not None and len(best) > limit:
+                best.pop()
+            if limit is not None and len(best) == limit:
+                bound = best[-1][0]
+
+        if self.END in self.root and size <= bound:
+            found(size, self.root[self.END])
+        # Nodes are expanded nearest first: the smallest cell of a row is a lower
+        # bound for every word below the node, so once the nearest pending node
+        # is beyond the radius, nothing left can match.
+        pending = [(0, 0, self.root, self.END, 0, list(range(size + 1)), None)]
+        counter = 1
+        while pending:
+            lowest, _, node, last_char, depth, previous, before = heappop(pending)
+            if lowest > bound:
+                break
+            for char, child in node.items():
+                if char == self.END:
+                    continue
+                depth_below = depth + 1
+                # Cells further than the radius from the diagonal cannot be
+                # within it, so only the band around it is computed; the rest
+                # hold "too far", which is all the pruning needs to know.
+                current = [bound + 1] * (size + 1)
+                if depth_below <= bound:
+                    current[0] = depth_below
+                row_lowest = current[0]
+                for i in range(max(1, depth_below - bound), min(size, depth_below + bound) + 1):
+                    cell = min(previous[i] + 1, current[i - 1] + 1,
+                               previous[i - 1] + (query[i - 1] != char))
+                    # Adjacent characters swapped count as one edit
+                    if before is not None and i > 1 and char == query[i - 2] and last_char == query[i - 1]:
+                        cell = min(cell, before[i - 2] + 1)
+                    current[i] = cell
+                    if cell < row_lowest:
+                        row_lowest = cell
+
+                if self.END in child and current[-1] <= bound:
+                    found(current[-1], child[self.END])
+                if row_lowest <= bound:
+                    heappush(pending, (row_lowest, counter, child, char, depth_below, current, previous))
+                    counter += 1
+        return [(distance, word) for distance, _, word in best]
+
+
+class DeletionIndex:
+    """
+    Deletion-neighbourhood index for searches within two edits, the way
+    SymSpell does it: every word is stored under itself and under each
+    string left by deleting one of its characters. Two words within an edit
+    share such a key, so a search looks up a few dozen keys of the query
+    and checks only the words found there, however many words are stored.
+    Words two edits away are found through keys of the query with one more
+    edit applied, looked up only when closer words cannot fill the limit.
+    """
+    MAX_DISTANCE = 2
+
+    def __init__(self):
+        """
+        Create an empty index.
+        """
+        # Key -> the word stored under it, or a set once there are several
+        self.keys = {}
+        # Character -> number of words using it; edits of the query only
+        # need to try characters that some stored word has
+        self.alphabet = {}
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def add(self, word: str):
+        """
+        Insert a word into the index.
+        Does nothing if the word is already present.
+        """
+        if word in self._words(word):
+            return
+        keys = self.keys
+        for key in deletions(word) | {word}:
+            words = keys.get(key)
+            if words is None:
+                keys[key] = word
+            elif type(words) is str:
+                keys[key] = {words, word}
+            else:
+                words.add(word)
+        for char in set(word):
+            self.alphabet[char] = self.alphabet.get(char, 0) + 1
+        self.size += 1
+
+    def remove(self, word: str):
+        """
+        Remove a word from the index.
+        Returns True if the word was present.
+        """
+        if word not in self._words(word):
+            return False
+        keys = self.keys
+        for key in deletions(word) | {word}:
+            words = keys[key]
+            if type(words) is str:
+                del keys[key]
+            else:
+                words.discard(word)
+                if len(words) == 1:
+                    keys[key] = words.pop()
+        for char in set(word):
+            self.alphabet[char] -= 1
+            if not self.alphabet[char]:
+                del self.alphabet[char]
+        self.size -= 1
+        return True
+
+    def _words(self, key: str):
+        """
+        Return the words stored under a key as a str or a set (both support in).
+        """
+        words = self.keys.get(key, ())
+        return (words,) if type(words) is str else words
+
+    def _collect(self, keys: set, found: set):
+        """
+        Add the words stored under any of the keys to found.
+        """
+        stored = self.keys
+        # Intersecting with the dict's key view looks the keys up in one C loop
+        for key in stored.keys() & keys:
+            words = stored[key]
+            if type(words) is str:
+                found.add(words)
+            else:
+                found.update(words)
+
+    def _second_edit_keys(self, query: str, near: set) -> set:
+        """
+        Return the keys that reach every word two edits from the query.
+        near holds the query and its deletions. A word with one character
+        deleted meets the query with two deleted. Other words are one edit
+        from a substitution, insertion or swap of the query, which is either
+        stored under that key itself or shares a deletion with it; for two
+        substitutions, deleting the first and substituting the second is
+        enough.
+        """
+        keys = set()
+        for key in near:
+            keys |= deletions(key)
+        alphabet = list(self.alphabet)
+        for i in range(len(query) + 1):
+            head, tail = query[:i], query[i:]
+            keys.update([head + char + tail for char in alphabet])
+            if not tail:
+                continue
+            rest = tail[1:]
+            keys.update([head + char + rest for char in alphabet])
+            for j in range(i + 1, len(query)):
+                middle, after = head + query[i + 1:j], query[j + 1:]
+                keys.update([middle + char + after for char in alphabet])
+        for i in range(len(query) - 1):
+            swapped = query[:i] + query[i + 1] + query[i] + query[i + 2:]
+            keys.add(swapped)
+            keys |= deletions(swapped)
+        return keys
+
+    def search(self, query: str, max_distance: int, limit: int = None, rank=None) -> list:
+        """
+        Find words within max_distance (at most MAX_DISTANCE) edits of the
+        query. Returns the limit best (distance, word) pairs, ordered by
+        distance, then rank(word), then word.
+        """
+        if max_distance > self.MAX_DISTANCE:
+            raise ValueError(f"DeletionIndex searches at most {self.MAX_DISTANCE} edits away")
+
+        def rank_of(word):
+            return rank(word) if rank else 0
+
+        near = deletions(query) | {query}
+        found = set()
+        self._collect(near, found)
+        within = min(max_distance, 1)
+        matches = [(distance, rank_of(word), word)
+                   for distance, word in ((edit_distance(query, word, within), word) for word in found)
+                   if distance <= within]
+        matches.sort()
+        closest = [(distance, word) for distance, _, word in matches[:limit]]
+        # Every word within one edit is among those found, so if they fill
+        # the limit, words two edits away cannot make it
+        if max_distance < 2 or (limit is not None and len(closest) >= limit):
+            return closest
+
+        further = set()
+        self._collect(self._second_edit_keys(query, near), further)
+        # The words left are all two edits away or more, so they are checked
+        # in the order they rank and only until the limit is filled
+        further |= found
+        further.difference_update(word for _, word in closest)
+        for _, word in sorted((rank_of(word), word) for word in further):
+            if edit_distance(query, word, 2) <= 2:
+                closest.append((2, word))
+                if len(closest) == limit:
+                    break
+        return closest
+
+
+class NameIndex:
+    """
+    Fuzzy index over contact names.
+    Combines a deletion index for searches within two edits, a trie for
+    prefix lookups and wider searches, and Soundex buckets for names that
+    sound alike but are spelled differently.
+    """
+    def __init__(self):
+        """
+        Create an empty index.
+        """
+        self.trie = Trie()
+        self.deletions = DeletionIndex()
+        self.phonetic = {}
+
+    def add(self, name: str):
+        """
+        Index a contact name.
+        """
+        word = name.lower()
+        self.trie.add(word)
+        self.deletions.add(word)
+        self.phonetic.setdefault(soundex(word), set()).add(word)
+
+    def remove(self, name: str):
+        """
+        Drop a contact name from the index.
+        """
+        word = name.lower()
+        self.trie.remove(word)
+        self.deletions.remove(word)
+        bucket = self.phonetic.get(soundex(word))
+        if bucket is not None:
+            bucket.discard(word)
+            if not bucket:
+                del self.phonetic[soundex(word)]
+
+    def search(self, query: str, max_distance: int, limit: int, phonetic: bool = False) -> list:
+        """
+        Return up to limit (distance, name) pairs closest to the query,
+        all within max_distance edits. With phonetic enabled, names sharing
+        the query's Soundex code come first among names at the same distance.
+        """
+        query = query.lower()
+        rank = None
+        if phonetic:
+            alike = self.phonetic.get(soundex(query), set())
+            rank = lambda word: word not in alike
+        if max_distance <= DeletionIndex.MAX_DISTANCE:
+            return self.deletions.search(query, max_distance, limit, rank)
+        return self.trie.search(query, max_distance, limit, rank)
+
+
+class ContactIndex:
+    """
+    Secondary indexes over contact fields, used by the query planner.
+    Maps phone numbers (through a trie, for prefix lookups), e-mail domains
+    and birth months to the keys of the contacts holding them.
+    """
+    def __init__(self):
+        """
+        Create empty indexes.
+        """
+        self.phones = Trie()
+        self.phone_owners = {}
+        self.email_domains = {}
+        self.birth_months = {}
+
+    @staticmethod
+    def _keys(record) -> tuple:
+        """
+        Return the phone numbers, e-mail domain and birth month of a record.
+        """
+        phones = [phone.value for phone in record.phones]
+        domain = record.email.value.split("@", 1)[1].lower() if record.email else None
+        month = record.birthday.value.month if record.birthday else None
+        return phones, domain, month
+
+    def add(self, key: str, record):
+        """
+        Index a contact record under its book key.
+        """
+        phones, domain, month = self._keys(record)
+        for phone in phones:
+            self.phone_owners.setdefault(phone, set()).add(key)
+            self.phones.add(phone)
+        if domain:
+            self.email_domains.setdefault(domain, set()).add(key)
+        if month:
+            self.birth_months.setdefault(month, set()).add(key)
+
+    def remove(self, key: str, record):
+        """
+        Drop a contact record from the indexes.
+        """
+        phones, domain, month = self._keys(record)
+        for phone in phones:
+            if self._discard(self.phone_owners, phone, key):
+                self.phones.remove(phone)
+        if domain:
+            self._discard(self.email_domains, domain, key)
+        if month:
+            self._discard(self.birth_months, month, key)
+
+    @staticmethod
+    def _discard(index: dict, value, key: str) -> bool:
+        """
+        Remove a key from the set stored under value.
+        Returns True if no keys are left for that value.
+        """
+        keys = index.get(value)
+        if keys is None:
+            return False
+        keys.discard(key)
+        if not keys:
+            del index[value]
+            return True
+        return False
+
+    def phone_prefix(self, prefix: str, limit: int = None):
+        """
+        Return the keys of contacts with a phone starting with prefix,
+        or None if more than limit phone numbers match.
+        """
+        phones = self.phones.starts_with(prefix, None if limit is None else limit + 1)
+        if limit is not None and len(phones) > limit:
+            return None
+        return set().union(*(self.phone_owners[phone] for phone in phones))
+
+    def domain_prefix(self, prefix: str) -> set:
+        """
+        Return the keys of contacts whose e-mail domain starts with prefix.
+        """
+        return set().union(*(keys for domain, keys in self.email_domains.items()
+                             if domain.startswith(prefix)))
@@ -0,0 +1,209 @@
+import asyncio
+import json
+import signal
+
+from bot.commands import handle_command
+from bot.constants import (
+    DEFAULT_PROFILE,
+    HELP_MESSAGES,
+    MAIN_HELP_TEXT,
+    READ_COMMANDS,
+    SERVER_HOST,
+    SERVER_PORT,
+)
+from bot.profiles import Profile
+from bot.result import Result
+from bot.scheduler import BirthdayScheduler
+from bot.sync import SYNC_METHODS, LocalPeer
+from bot.utils import Log, parse_input
+
+
+class ReadWriteLock:
+    """
+    Asyncio lock that lets many readers in at once but writers only alone.
+    Waiting writers block new readers, so writes are not starved.
+    """
+    def __init__(self):
+        """
+        Create an unlocked lock.
+        """
+        self._condition = asyncio.Condition()
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    async def acquire_read(self):
+        async with self._condition:
+            await self._condition.wait_for(
+                lambda: not self._writer and not self._waiting_writers
+            )
+            self._readers += 1
+
+    async def release_read(self):
+        async with self._condition:
+            self._readers -= 1
+            self._condition.notify_all()
+
+    async def acquire_write(self):
+        async with self._condition:
+            self._waiting_writers += 1
+            await self._condition.wait_for(lambda: not self._writer and not self._readers)
+            self._waiting_writers -= 1
+            self._writer = True
+
+    async def release_write(self):
+        async with self._condition:
+            self._writer = False
+            self._condition.notify_all()
+
+
+class BotServer:
+    """
+    Serves handle_command to many clients from one loaded data set.
+    Each request is one JSON line {"command": "..."} and gets one JSON line
+    back. Commands run in worker threads so a slow one never blocks the
+    event loop; read commands share the lock, all others take it exclusively.
+    Another copy of the data syncs with {"sync": method, "args": {...}}
+    requests, answered by a LocalPeer (see bot.sync).
+    """
+    def __init__(self, book, notes):
+        """
+        Create a server for the already loaded AddressBook and Notes.
+        """
+        self.book = book
+        self.notes = notes
+        self.peer = LocalPeer(book, notes)
+        self.lock = ReadWriteLock()
+
+    def _execute(self, user_input: str):
+        """
+        Run one command synchronously and return its Result.
+        """
+        command, *args = parse_input(user_input)
+        # Commands that would prompt on the server's terminal
+        if command == "birthdays" and not args:
+            return Result.warning("Please enter the number of days: birthdays <days>")
+        if command == "edit-note" and len(args) < 3:
+            return Result.warning("Please enter the new text: edit-note <user_name> <note_id> <text>")
+        if command == "help":
+            if not args:
+                return Result.info(MAIN_HELP_TEXT)
+            message = HELP_MESSAGES.get(args[0].lower())
+            if message is None:
+                return Result.warning(f"No help available for '{args[0]}'.")
+            return Result.info(message)
+        return handle_command(user_input, book=self.book, notes=self.notes)
+
+    async def execute(self, user_input: str) -> dict:
+        """
+        Run a command under the proper lock and build the response.
+        """
+        if not user_input.strip():
+            return {"ok": False, "error": "Please enter a command."}
+
+        command = parse_input(user_input)[0]
+        if command in ("close", "exit"):
+            return {"ok": True, "command": command, "result": Result.info("exit").to_dict()}
+
+        is_read = command in READ_COMMANDS
+        if is_read:
+            await self.lock.acquire_read()
+        else:
+            await self.lock.acquire_write()
+        try:
+            result = await asyncio.to_thread(self._execute, user_input)
+        finally:
+            if is_read:
+                await self.lock.release_read()
+            else:
+                await self.lock.release_write()
+
+        return {"ok": True, "command": command, "result": result.to_dict()}
+
+    async def sync(self, method: str, args: dict) -> dict:
+        """
+        Answer one sync request of another copy under the proper lock.
+        """
+        if method not in SYNC_METHODS:
+            return {"ok": False, "error": f"Unknown sync request '{method}'"}
+
+        is_read = method != "apply"
+        if is_read:
+            await self.lock.acquire_read()
+        else:
+            await self.lock.acquire_write()
+        try:
+            result = await asyncio.to_thread(getattr(self.peer, method), **args)
+        except (TypeError, ValueError, IndexError) as e:
+            return {"ok": False, "error": f"Invalid sync request: {e}"}
+        finally:
+            if is_read:
+                await self.lock.release_read()
+            else:
+                await self.lock.release_write()
+
+        return {"ok": True, "result": result}
+
+    async def handle_client(self, reader, writer):
+        """
+        Read JSON requests line by line and answer each of them.
+        """
+        try:
+            while line := await reader.readline():
+                try:
+                    request = json.loads(line)
+                    if "sync" in request:
+                        response = await self.sync(request["sync"], request.get("args", {}))
+                    else:
+                        response = await self.execute(request["command"])
+                except (json.JSONDecodeError, KeyError, TypeError):
+                    response = {"ok": False, "error": "Invalid request, expected {\"command\": \"...\"}"}
+                writer.write(json.dumps(response).encode("utf-8") + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = SERVER_HOST, port: int = SERVER_PORT, socket_path: str = None):
+        """
+        Listen on a Unix socket if a path is given, otherwise on TCP,
+        until the process receives SIGINT or SIGTERM.
+        """
+        if socket_path:
+            server = await asyncio.start_unix_server(self.handle_client, path=socket_path)
+            Log.success(f"Serving on {socket_path}")
+        else:
+            server = await asyncio.start_server(self.handle_client, host, port)
+            Log.success(f"Serving on {host}:{port}")
+
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+
+        async with server:
+            await stop.wait()
+
+        # Let running writes finish before saving
+        await self.lock.acquire_write()
+
+
+def run_server(host: str = SERVER_HOST, port: int = SERVER_PORT, socket_path: str = None,
+               profile_name: str = DEFAULT_PROFILE):
+    """
+    Load the data of a profile once, serve commands until stopped, then save.
+    """
+    # The profile's data is thread-safe: commands run in worker threads
+    # next to the scheduler thread
+    profile = Profile(profile_name)
+    scheduler = BirthdayScheduler(profile.book, notify=Log.info)
+    scheduler.start()
+    try:
+        asyncio.run(BotServer(profile.book, profile.notes).serve(host, port, socket_path))
+    finally:
+        scheduler.stop()
+        conflicts = profile.save()
+        for message in conflicts:
+            Log.warning(message)
+        Log.success("Server stopped, data saved.")
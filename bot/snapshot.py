@@ -0,0 +1,124 @@
+from collections.abc import Mapping
+import threading
+import weakref
+
+
+class GenerationClock:
+    """
+    Generation counter shared by a container and its records.
+    Taking a snapshot closes the current generation; writers copy data
+    lazily, only when it is still visible to a live snapshot.
+    """
+    def __init__(self):
+        """
+        Start at generation 0 with no live snapshots.
+        """
+        self.value = 0
+        self.snapshots = weakref.WeakSet()
+        # Readers in thread-safe mode take snapshots concurrently
+        self.lock = threading.Lock()
+
+    def register(self, snapshot) -> int:
+        """
+        Register a new snapshot and return the generation it sees.
+        """
+        with self.lock:
+            self.snapshots.add(snapshot)
+            self.value += 1
+            return self.value - 1
+
+    def oldest(self):
+        """
+        Return the generation of the oldest live snapshot, or None.
+        """
+        return min((s.generation for s in self.snapshots), default=None)
+
+    def is_shared(self, data) -> bool:
+        """
+        Check whether a dict object is referenced by a live snapshot.
+        """
+        return any(s.data is data for s in self.snapshots)
+
+
+class BookSnapshot(Mapping):
+    """
+    Frozen, read-only view of an AddressBook.
+    Taking it is O(1): it keeps a reference to the book's dict, which the book
+    replaces with a copy before its next structural change, and reads each
+    record as it was when the snapshot was taken.
+    """
+    # Snapshots are tracked by identity in a WeakSet
+    __hash__ = object.__hash__
+
+    def __init__(self, data: dict, clock: GenerationClock):
+        """
+        Create a snapshot of the given contacts dict.
+        """
+        self.data = data
+        self.generation = clock.register(self)
+
+    def _as_of(self, record):
+        """
+        Return the version of a record visible to this snapshot.
+        """
+        while record._generation > self.generation:
+            record = record._previous
+        return record
+
+    def __getitem__(self, key):
+        return self._as_of(self.data[key])
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+    def find(self, name):
+        """
+        Find a contact record by name in a case-insensitive way.
+        """
+        record = self.data.get(name.capitalize())
+        return self._as_of(record) if record else None
+
+    def to_dict(self):
+        """
+        Serialize the snapshot in the same format as AddressBook.to_dict().
+        """
+        return {name: record.to_dict() for name, record in self.items()}
+
+
+class NotesSnapshot(Mapping):
+    """
+    Frozen, read-only view of Notes, mapping user names to their notes.
+    Notes replaces a user's dict (and its own outer dict) with a copy before
+    changing it while a snapshot still refers to it, and never changes a
+    note dict in place, so the view stays consistent.
+    """
+    # Snapshots are tracked by identity in a WeakSet
+    __hash__ = object.__hash__
+
+    def __init__(self, data: dict, clock: GenerationClock):
+        """
+        Create a snapshot of the given notes dict.
+        """
+        self.data = data
+        self.generation = clock.register(self)
+
+    def __getitem__(self, user_name):
+        return self.data[user_name]
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+    def to_dict(self):
+        """
+        Serialize the snapshot in the same format as Notes.to_dict().
+        """
+        return {
+            user_name: {str(note_id): note.to_dict() for note_id, note in notes.items()}
+            for user_name, notes in self.data.items()
+        }
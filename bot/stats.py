@@ -0,0 +1,123 @@
+from collections import deque
+from pathlib import Path
+import sys
+import types
+
+from bot.storage import DATA_DIR, TIMINGS
+
+# Objects that belong to the program, not to the data
+SKIPPED_TYPES = (type, types.ModuleType, types.FunctionType, types.MethodType,
+                 types.BuiltinFunctionType)
+
+
+def deep_size(obj, exclude=()) -> int:
+    """
+    Return the memory size in bytes of an object and everything it references.
+    Objects in exclude (and what is only reachable through them) are not
+    counted, which keeps back-references like Record._owner out of the total.
+    Walks every object once, so it takes a while on very large data.
+    """
+    seen = {id(item) for item in exclude}
+    queue = deque([obj])
+    total = 0
+    while queue:
+        item = queue.popleft()
+        if id(item) in seen or isinstance(item, SKIPPED_TYPES):
+            continue
+        seen.add(id(item))
+        total += sys.getsizeof(item)
+
+        if isinstance(item, dict):
+            queue.extend(item.keys())
+            queue.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset, deque)):
+            queue.extend(item)
+        if hasattr(item, "__dict__"):
+            queue.append(item.__dict__)
+        for cls in type(item).__mro__:
+            for slot in getattr(cls, "__slots__", ()):
+                if slot not in ("__dict__", "__weakref__") and hasattr(item, slot):
+                    queue.append(getattr(item, slot))
+    return total
+
+
+def memory_usage(book, notes) -> dict:
+    """
+    Return the deep memory size of the contacts, notes and each of their indexes.
+    Every part is measured without the containers it points back to.
+    """
+    containers = (book, notes)
+    usage = {
+        "contacts": deep_size(book.data, containers),
+        "name index": deep_size(book.name_index, containers),
+    }
+    for index in book.indexes:
+        if index is book.contact_index:
+            name = "contact index"
+        elif index is book.orders:
+            name = "sorted orders"
+        elif index is book.merkle:
+            name = "sync tree"
+        else:
+            name = type(index).__name__
+        usage[name] = deep_size(index, containers)
+    usage["notes"] = deep_size(notes.data, containers)
+    usage["tag trie"] = deep_size(notes.tag_index, containers)
+    usage["tag bitmaps"] = deep_size((notes.tag_bitmaps, notes.all_notes), containers)
+    usage["note numbers"] = deep_size((notes.note_refs, notes.ref_keys, notes.free_refs), containers)
+    if notes.merkle is not None:
+        usage["note sync tree"] = deep_size(notes.merkle, containers)
+    return usage
+
+
+def file_sizes(directory: Path = DATA_DIR) -> dict:
+    """
+    Return the size in bytes of every data file in a data directory; a
+    directory of shards is reported as one entry with the number of files in it.
+    """
+    sizes = {}
+    for path in sorted(directory.iterdir()):
+        if path.is_dir():
+            files = [child for child in path.iterdir() if child.is_file() and child.suffix == ".json"]
+            # Other directories, like those of other profiles, hold no data files
+            if files:
+                sizes[f"{path.name}/ ({len(files)} files)"] = sum(child.stat().st_size for child in files)
+        elif path.suffix == ".json":
+            sizes[path.name] = path.stat().st_size
+    return sizes
+
+
+def collect_stats(book, notes) -> dict:
+    """
+    Collect what the running bot holds: contact and note counts, memory
+    used by the data and its indexes, data file sizes and the time spent
+    in the last load and save of each file.
+    """
+    per_user = {user_name: len(user_notes) for user_name, user_notes in notes.items() if user_notes}
+    not_loaded = 0
+    if not notes.all_loaded:
+        not_loaded = len(set(notes.store.users()) - notes.loaded_users)
+    # The notes directory lives in the data directory of the profile
+    files = file_sizes(notes.store.directory.parent if notes.store else DATA_DIR)
+    if notes.blobs is not None:
+        files["note texts (mapped)"] = notes.blobs.size
+    return {
+        "contacts": len(book),
+        "notes": sum(per_user.values()),
+        "notes per user": per_user,
+        "users with notes not loaded": not_loaded,
+        "memory": memory_usage(book, notes),
+        "files": files,
+        "timings": dict(TIMINGS),
+    }
+
+
+def format_size(size: int) -> str:
+    """
+    Format a size in bytes as B, KB, MB or GB.
+    """
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
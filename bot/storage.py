@@ -1,31 +1,364 @@
 from collections import UserDict
+from contextlib import contextmanager
+from functools import partial
+import gzip
 import json
+import lzma
+import os
 from pathlib import Path
+import time
 from typing import Union
+from urllib.parse import quote, unquote
 
-from bot.constants import NOTES_DATA, USERS_DATA
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from bot.blobs import BlobStore
+from bot.constants import DATA_CODECS, NOTES_DATA, USERS_DATA
 from bot.models import AddressBook, Notes
 
 DATA_DIR = Path(__file__).parent.parent / 'data'
 DATA_DIR.mkdir(exist_ok=True, parents=True)
+NOTES_DIR = DATA_DIR / 'notes'
+
+# Supported compression codecs and the magic bytes that identify them on load
+CODECS = {
+    "gzip": partial(gzip.open, compresslevel=6),
+    "lzma": lzma.open,
+}
+WRITE_BLOCK_SIZE = 64 * 1024
+CODEC_MAGIC = {
+    b"\x1f\x8b": "gzip",
+    b"\xfd7zXZ\x00": "lzma",
+}
+# Errors raised when reading a corrupted file
+READ_ERRORS = (json.JSONDecodeError, UnicodeDecodeError, EOFError, lzma.LZMAError, gzip.BadGzipFile)
+# Seconds spent in the last load and save, e.g. TIMINGS["save users.json"]
+TIMINGS = {}
 
-def save_to_json(data: Union[AddressBook, Notes], filename: str):
-    """Save pure JSON-serializable dict/list or objects supporting to_dict()"""
-    if hasattr(data, "to_dict"):
-        data = data.to_dict()
+@contextmanager
+def timed(operation: str, accumulate: bool = False):
+    """
+    Record how long the block took in TIMINGS under the operation name.
+    With accumulate, the time is added to the previous value instead.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        TIMINGS[operation] = TIMINGS.get(operation, 0) * accumulate + elapsed
+
+def detect_codec(file_path: Path):
+    """Return the codec a data file is compressed with, or None for plain JSON"""
+    with open(file_path, "rb") as f:
+        head = f.read(6)
+    for magic, codec in CODEC_MAGIC.items():
+        if head.startswith(magic):
+            return codec
+    return None
+
+def open_data(file_path: Path, mode: str, codec: str = None):
+    """
+    Open a data file in text mode ('r' or 'w') through the given codec.
+    Compressed files are (de)compressed while streaming, without
+    holding a second, compressed copy of the data in memory.
+    """
+    if codec is None:
+        return open(file_path, mode, encoding="utf-8")
+    if codec not in CODECS:
+        raise ValueError(f"Unknown compression codec: {codec}")
+    return CODECS[codec](file_path, mode + "t", encoding="utf-8")
 
+def read_json(file_path: Path):
+    """Read JSON data from a file, detecting its compression codec"""
+    with open_data(file_path, "r", detect_codec(file_path)) as f:
+        return json.load(f)
+
+@contextmanager
+def file_lock(file_path: Path):
+    """
+    Hold an exclusive advisory lock for the given data file or directory.
+    The lock lives in a separate '<file>.lock' file, so the data file itself
+    can be replaced atomically while other processes wait for the lock.
+    """
+    lock_path = file_path.with_name(file_path.name + ".lock")
+    with open(lock_path, "a+") as lock_file:
+        if fcntl:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        else:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+def read_stored(file_path: Path) -> dict:
+    """Return the data currently stored in a file, or an empty dict if it is missing or corrupted"""
+    try:
+        return read_json(file_path)
+    except (FileNotFoundError, *READ_ERRORS):
+        return {}
+
+def read_for_merge(file_path: Path):
+    """
+    Return the data stored in a file for merging before a save: an empty dict
+    if the file is missing, so deletions are real, or None if it is corrupted.
+    A corrupted file is moved aside to '<name>.unreadable' so the save that
+    follows does not destroy what is left of it.
+    """
+    try:
+        return read_json(file_path)
+    except FileNotFoundError:
+        return {}
+    except READ_ERRORS:
+        os.replace(file_path, file_path.with_name(file_path.name + '.unreadable'))
+        return None
+
+def unreadable_warning(file_path: Path) -> str:
+    """Describe a save that skipped merging with a corrupted file"""
+    return (f"Warning: '{file_path.name}' could not be read, so it was not merged. The loaded data "
+            f"was saved and the unreadable file kept as '{file_path.name}.unreadable'.")
+
+def save_to_json(data: Union[AddressBook, Notes], filename: str, directory: Path = DATA_DIR) -> list:
+    """
+    Save pure JSON-serializable dict/list or objects supporting to_dict().
+    Models supporting merge() are first merged with the data stored on disk
+    by other sessions, under a file lock; a corrupted file is not merged, as
+    that would drop every contact not changed here, and a warning is returned
+    instead. Returns the list of merge conflicts.
+    """
+    file_path = directory / filename
+    with timed(f"save {filename}"), file_lock(file_path):
+        conflicts = []
+        if hasattr(data, "merge"):
+            stored = read_for_merge(file_path)
+            if stored is None:
+                conflicts.append(unreadable_warning(file_path))
+            else:
+                conflicts = data.merge(stored)
+
+        codec = DATA_CODECS.get(filename)
+        if hasattr(data, "encoded_items"):
+            # Only contacts changed since their last save are encoded again
+            write_fragments(data.encoded_items(fragment_encoder(codec)), file_path, codec)
+            return conflicts
+
+        if hasattr(data, "to_dict"):
+            data = data.to_dict()
+
+        write_json(data, file_path, codec)
+
+    return conflicts
+
+def write_json(data: Union[dict, list], file_path: Path, codec: str = None):
+    """
+    Write JSON data to a file atomically, optionally compressed.
+    Plain files stay indented for reading by hand, compressed ones are compact.
+    """
     if not isinstance(data, (dict, list, UserDict)):
         raise TypeError("Data persistence error: Data for JSON must be a dictionary or a list.")
 
-    file_path = DATA_DIR / filename
+    if codec is None:
+        encoder = json.JSONEncoder(indent=4)
+    else:
+        encoder = json.JSONEncoder(separators=(",", ":"))
     try:
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=4)
+        write_chunks(encoder.iterencode(data), file_path, codec)
     except TypeError as e:
         raise TypeError(f"Data serialization error in JSON: {e}")
+
+def encode_indented(data) -> str:
+    """Encode a value of a top-level JSON object in the indented format of plain files"""
+    return json.dumps(data, indent=4).replace("\n", "\n    ")
+
+def encode_compact(data) -> str:
+    """Encode a value of a top-level JSON object in the compact format of compressed files"""
+    return json.dumps(data, separators=(",", ":"))
+
+def fragment_encoder(codec: str = None):
+    """Return the value encoder matching the format write_json uses for the codec"""
+    return encode_indented if codec is None else encode_compact
+
+def write_fragments(items, file_path: Path, codec: str = None):
+    """
+    Write a JSON object from (key, encoded value) pairs atomically, optionally compressed.
+    Values must come from fragment_encoder(codec); the file is the same as
+    write_json would produce, but values are not encoded again.
+    """
+    def chunks():
+        separator = "\n    " if codec is None else ""
+        colon = ": " if codec is None else ":"
+        yield "{"
+        empty = True
+        for key, fragment in items:
+            yield ("" if empty else ",") + separator + json.dumps(key) + colon + fragment
+            empty = False
+        yield "}" if empty or codec else "\n}"
+
+    write_chunks(chunks(), file_path, codec)
+
+def write_chunks(chunks, file_path: Path, codec: str = None):
+    """
+    Write text chunks to a file atomically, optionally compressed.
+    Writes to a temporary file first so readers never see a half-written file.
+    """
+    temp_path = file_path.with_name(file_path.name + ".tmp")
+    try:
+        with open_data(temp_path, 'w', codec) as f:
+            # Join encoded pieces into blocks: fewer, larger writes into the codec
+            block, block_size = [], 0
+            for chunk in chunks:
+                block.append(chunk)
+                block_size += len(chunk)
+                if block_size >= WRITE_BLOCK_SIZE:
+                    f.write("".join(block))
+                    block, block_size = [], 0
+            f.write("".join(block))
+        os.replace(temp_path, file_path)
     except IOError as e:
         raise IOError(f"Error writing to file {file_path}: {e}")
+
+
+class NotesShardStore:
+    """
+    Notes stored as one '<user>.json' file per user in a directory.
+    Lets Notes load only the users it touches and save only changed users.
+    Saves hold a single lock for the whole directory.
+    """
+    def __init__(self, directory: Path, codec: str = None):
+        """
+        Use the given directory, creating it if needed.
+        Shards are written with the given compression codec.
+        """
+        self.directory = directory
+        self.codec = codec
+        self.directory.mkdir(exist_ok=True, parents=True)
+
+    def path(self, user_name: str) -> Path:
+        """
+        Return the shard file of a user. The name is percent-encoded with
+        capital letters escaped as well, so users whose names differ only in
+        case never share a file on a case-insensitive file system.
+        """
+        name = "".join(f"%{ord(char):02X}" if "A" <= char <= "Z" else quote(char, safe="")
+                       for char in user_name)
+        return self.directory / (name + ".json")
+
+    def user_of(self, path: Path) -> str:
+        """Return the user a shard file belongs to"""
+        return unquote(path.name[:-len(".json")])
+
+    def users(self) -> list:
+        """Return the names of all users with a shard file"""
+        return [self.user_of(path) for path in self.directory.glob("*.json")]
+
+    def load(self, user_name: str) -> dict:
+        """Return the stored notes of a user, or an empty dict"""
+        # Shards load lazily, so the load time adds up over the session
+        with timed("load notes", accumulate=True):
+            return read_stored(self.path(user_name))
+
+    def migrate_file_names(self):
+        """
+        Rename shards written under the earlier case-sensitive file names
+        and remove the per-shard lock files used before the directory lock.
+        """
+        with file_lock(self.directory):
+            for path in self.directory.glob("*.json"):
+                target = self.path(self.user_of(path))
+                if path.name != target.name and not target.exists():
+                    os.replace(path, target)
+            for path in self.directory.glob("*.json.lock"):
+                path.unlink(missing_ok=True)
+
+    def save(self, notes: Notes, user_names) -> list:
+        """
+        Merge and write the shards of the given users under the directory lock.
+        Shards left without notes are removed; a corrupted shard is written
+        over without merging, with a warning. Returns the list of merge conflicts.
+        """
+        conflicts = []
+        with file_lock(self.directory):
+            for user_name in sorted(user_names):
+                file_path = self.path(user_name)
+                stored = read_for_merge(file_path)
+                if stored is None:
+                    conflicts.append(unreadable_warning(file_path))
+                else:
+                    conflicts += notes.merge({user_name: stored} if stored else {}, users={user_name})
+                if notes.get_all_user_notes(user_name):
+                    items = notes.encoded_user_items(user_name, fragment_encoder(self.codec))
+                    write_fragments(items, file_path, self.codec)
+                elif file_path.exists():
+                    file_path.unlink()
+        return conflicts
+
+
+def load_notes(directory: Path = DATA_DIR) -> Notes:
+    """
+    Return Notes backed by per-user shards in the 'notes' directory of
+    the data directory (NOTES_DIR by default), with long texts in a BlobStore.
+    A legacy single 'notes.json' is split into shards once and renamed,
+    and shards with file names of the earlier scheme are renamed.
+    """
+    store = NotesShardStore(directory / NOTES_DIR.name, DATA_CODECS.get("notes"))
+    store.migrate_file_names()
+    legacy_path = directory / 'notes.json'
+    if legacy_path.exists():
+        with file_lock(legacy_path):
+            for user_name, user_notes in read_stored(legacy_path).items():
+                if not store.path(user_name).exists():
+                    write_json(user_notes, store.path(user_name), store.codec)
+            os.replace(legacy_path, legacy_path.with_name('notes.json.migrated'))
+    return Notes(store=store, blobs=BlobStore())
+
+def save_notes(notes: Notes) -> list:
+    """
+    Save only the notes of users changed since the last save.
+    Returns the list of merge conflicts.
+    """
+    with timed("save notes"):
+        return notes.store.save(notes, notes.changed_users())
     
+def reload_changed(book: AddressBook, notes: Notes, paths, directory: Path = DATA_DIR) -> list:
+    """
+    Apply data files changed by another process to the loaded book and notes.
+    Only the changed contacts and notes are replaced. A users file that is
+    missing or unreadable is ignored rather than emptying the book.
+    Returns messages describing what was reloaded.
+    """
+    messages = []
+    for path in sorted(paths):
+        if path == directory / 'users.json':
+            try:
+                stored = read_json(path)
+            except (FileNotFoundError, *READ_ERRORS):
+                continue
+            changed = book.reload(stored)
+            if changed:
+                messages.append(f"Reloaded {len(changed)} contact(s) changed on disk: {', '.join(changed)}")
+        elif notes.store is not None and path.parent == notes.store.directory:
+            try:
+                stored = read_json(path)
+            except FileNotFoundError:
+                stored = {}
+            except READ_ERRORS:
+                continue
+            user_name = notes.store.user_of(path)
+            changed = notes.reload({user_name: stored})
+            if changed:
+                messages.append(f"Reloaded {len(changed)} note(s) of '{user_name}' changed on disk")
+    return messages
+
 def create_empty_data(data_type: str):
     """Return an empty model instance based on data type constant"""
     if data_type == USERS_DATA:
@@ -35,26 +368,26 @@ def create_empty_data(data_type: str):
     raise ValueError(f"Unknown data type: {data_type}")
 
 
-def load_from_json(filename: str, data_type: str):
+def load_from_json(filename: str, data_type: str, directory: Path = DATA_DIR):
     """
-    Load data from a JSON file and convert it into the proper model.
+    Load data from a (possibly compressed) JSON file and convert it into the proper model.
     Returns an AddressBook or Notes instance depending on data_type, or
     a fresh empty object if the file is missing or corrupted.
     """
-    file_path = DATA_DIR / filename
+    file_path = directory / filename
 
-    try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            raw = json.load(f)
-    except FileNotFoundError:
-        return create_empty_data(data_type)
-    except json.JSONDecodeError:
-        print(f"Warning: '{filename}' is corrupted. Loading empty data.")
-        return create_empty_data(data_type)
+    with timed(f"load {filename}"):
+        try:
+            raw = read_json(file_path)
+        except FileNotFoundError:
+            return create_empty_data(data_type)
+        except READ_ERRORS:
+            print(f"Warning: '{filename}' is corrupted. Loading empty data.")
+            return create_empty_data(data_type)
 
-    if data_type == USERS_DATA:
-        return AddressBook.from_dict(raw)
-    if data_type == NOTES_DATA:
-        return Notes.from_dict(raw)
+        if data_type == USERS_DATA:
+            return AddressBook.from_dict(raw)
+        if data_type == NOTES_DATA:
+            return Notes.from_dict(raw)
 
-    return raw
\ No newline at end of file
+        return raw
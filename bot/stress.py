@@ -0,0 +1,178 @@
+"""
+Concurrency stress test.
+Runs reader and writer threads against one book and its notes, guarded by
+the reader-writer lock the server uses, then checks that writers were
+exclusive and that the contact orders, the field indexes and the name
+indexes still agree with the contacts.
+
+    python -m bot.stress
+    python -m bot.stress --threads 16 --operations 1000
+"""
+
+import argparse
+import random
+import sys
+import threading
+import time
+
+from bot.commands import handle_command
+from bot.locking import ThreadReadWriteLock, make_thread_safe
+from bot.models import AddressBook, Notes
+from bot.search import ContactIndex, DeletionIndex
+
+READ_COMMANDS = [
+    "all", "all --sort birthday --limit 5", "all --sort modified --limit 5", "find a", "find ~abcd",
+    "find name:ab bday:05", "find-notes text", "find-tag t1 OR t2", "sort-notes", "tag-stats", "birthdays 30",
+]
+
+
+def stress_lock(threads: int, operations: int) -> list:
+    """
+    Let writers change two counters in separate steps while readers check
+    that they never see them differ. Returns the problems found.
+    """
+    lock = ThreadReadWriteLock()
+    counters = [0, 0]
+    problems = []
+
+    def writer():
+        for _ in range(operations):
+            with lock.write():
+                counters[0] += 1
+                time.sleep(0)
+                counters[1] += 1
+
+    def reader():
+        for _ in range(operations):
+            with lock.read():
+                first = counters[0]
+                time.sleep(0)
+                if counters != [first, first]:
+                    problems.append(f"lock: a reader saw {counters} while a write was running")
+
+    run_threads([writer] * (threads // 2) + [reader] * (threads - threads // 2))
+    if counters != [operations * (threads // 2)] * 2:
+        problems.append(f"lock: writes were lost, counters are {counters}")
+    return problems
+
+
+def stress_commands(threads: int, operations: int, seed: int):
+    """
+    Run half the threads changing contacts and notes and half reading them
+    through handle_command. Returns (book, notes, problems).
+    """
+    book, notes = AddressBook(), Notes()
+    make_thread_safe(book, notes)
+    rng = random.Random(seed)
+    names = sorted({"".join(rng.choices("abcdefgh", k=4)).capitalize() for _ in range(300)})
+    problems = []
+
+    def run(command: str):
+        try:
+            result = handle_command(command, book, notes)
+            str(result)
+        except Exception as e:
+            problems.append(f"'{command}' raised {e!r}")
+
+    def writer(thread_seed: int):
+        rng = random.Random(thread_seed)
+        for i in range(operations):
+            name = rng.choice(names)
+            run(rng.choice([
+                f"add {name} 380{rng.randrange(10**8, 10**9)}",
+                f"add {name} email {name.lower()}@{rng.choice(['gmail.com', 'ukr.net'])}",
+                f"add {name} birthday {rng.randint(1, 28):02}.{rng.randint(1, 12):02}.1990",
+                f"add-note {name} tag=t{rng.randint(1, 5)} text {i}",
+                f"delete {name}",
+            ]))
+
+    def reader(thread_seed: int):
+        rng = random.Random(thread_seed)
+        for _ in range(operations):
+            run(rng.choice(READ_COMMANDS + [f"show {rng.choice(names)}"]))
+
+    writers = [lambda number=number: writer(seed + number) for number in range(threads // 2)]
+    readers = [lambda number=number: reader(seed + threads + number) for number in range(threads - threads // 2)]
+    run_threads(writers + readers)
+    return book, notes, problems
+
+
+def check_indexes(book: AddressBook, notes: Notes) -> list:
+    """
+    Compare every maintained index with one rebuilt from the data.
+    Returns the problems found.
+    """
+    problems = []
+    orders = book.orders
+    if orders.names() != sorted(book.data):
+        problems.append("orders: the name order differs from the contacts")
+    birthdays = sorted((record.birthday.value.month, record.birthday.value.day, key)
+                       for key, record in book.data.items() if record.birthday)
+    if orders.by_birthday != birthdays:
+        problems.append("orders: the birthday order differs from the contacts")
+    if orders.by_change != sorted(orders.by_change) or sorted(key for _, key in orders.by_change) != sorted(book.data):
+        problems.append("orders: the change order differs from the contacts")
+
+    rebuilt = ContactIndex()
+    for key, record in book.data.items():
+        rebuilt.add(key, record)
+    index = book.contact_index
+    for field in ("phone_owners", "email_domains", "birth_months"):
+        if getattr(index, field) != getattr(rebuilt, field):
+            problems.append(f"contact index: {field} differs from the contacts")
+    if set(index.phones.starts_with("")) != set(index.phone_owners):
+        problems.append("contact index: the phone trie differs from the phone numbers")
+
+    trie = book.name_index.trie
+    if set(trie.starts_with("")) != {key.lower() for key in book.data} or len(trie) != len(book.data):
+        problems.append("name trie: the names differ from the contacts")
+    rebuilt_names = DeletionIndex()
+    for key in book.data:
+        rebuilt_names.add(key.lower())
+    if book.name_index.deletions.keys != rebuilt_names.keys:
+        problems.append("name index: the deletion keys differ from the contacts")
+
+    if sum(len(user_notes) for user_notes in notes.data.values()) != len(notes.all_notes):
+        problems.append("notes: the note list differs from the notes of the users")
+    return problems
+
+
+def run_threads(targets: list):
+    """
+    Start a thread per target at once and wait for all of them.
+    """
+    threads = [threading.Thread(target=target) for target in targets]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def main():
+    """
+    Run the stress test and exit with status 1 if anything went wrong.
+    """
+    parser = argparse.ArgumentParser(description="Stress the locks and indexes with parallel threads")
+    parser.add_argument("--threads", type=int, default=16, help="number of threads, half of them writing")
+    parser.add_argument("--operations", type=int, default=400, help="operations per thread")
+    parser.add_argument("--seed", type=int, default=42, help="seed of the generated commands")
+    options = parser.parse_args()
+
+    # Switch threads as often as possible to provoke interleavings
+    sys.setswitchinterval(1e-5)
+    start = time.perf_counter()
+    problems = stress_lock(options.threads, options.operations)
+    book, notes, command_problems = stress_commands(options.threads, options.operations, options.seed)
+    problems += command_problems + check_indexes(book, notes)
+
+    print(f"{options.threads} threads, {options.operations} operations each: {len(book)} contacts, "
+          f"{len(notes.all_notes)} notes in {time.perf_counter() - start:.1f} s")
+    for problem in problems:
+        print(problem)
+    if problems:
+        sys.exit(1)
+    print("No problems found.")
+
+
+if __name__ == "__main__":
+    main()
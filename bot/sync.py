@@ -0,0 +1,268 @@
+import json
+from pathlib import Path
+
+from bot.client import connect
+from bot.constants import SERVER_HOST, SERVER_PORT, USERS_DATA
+from bot.models import AddressBook, Notes, synced_floor
+from bot.storage import load_from_json, load_notes, save_notes, save_to_json
+
+KINDS = ("contacts", "notes")
+# Requests a server answers for a remote copy; all but "apply" only read
+SYNC_METHODS = {"shape", "digests", "entries", "records", "apply"}
+
+
+def _key(kind: str, key):
+    """
+    Return a key as the models use it; note keys arrive from JSON as lists.
+    """
+    return tuple(key) if kind == "notes" else key
+
+
+def _describe(kind: str, key) -> str:
+    """
+    Name a contact or note in messages.
+    """
+    if kind == "contacts":
+        return f"Contact '{key}'"
+    user_name, note_id = key
+    return f"Note #{note_id} for '{user_name}'"
+
+
+class LocalPeer:
+    """
+    One copy of the data taking part in a sync: a loaded AddressBook and Notes.
+    A bot server answers the requests of a remote copy with one of these.
+    Every method takes and returns only JSON-serializable values.
+    """
+    def __init__(self, book: AddressBook, notes: Notes):
+        """
+        Use the given book and notes, building their hash trees on first use.
+        """
+        self.book = book
+        self.notes = notes
+
+    def _tree(self, kind: str):
+        """
+        Return the hash tree of the contacts or the notes.
+        """
+        if kind == "contacts":
+            return self.book.merkle_tree()
+        if kind == "notes":
+            return self.notes.merkle_tree()
+        raise ValueError(f"Unknown kind of data '{kind}'")
+
+    def shape(self) -> list:
+        """
+        Return [fanout, depth] of the hash trees, which must match on both sides.
+        """
+        tree = self._tree("contacts")
+        return [tree.fanout, tree.depth]
+
+    def digests(self, kind: str, level: int, positions: list) -> list:
+        """
+        Return the digests of the nodes at the given positions of a tree level.
+        """
+        tree = self._tree(kind)
+        with self.book.lock.read():
+            return tree.digests(level, positions)
+
+    def entries(self, kind: str, positions: list) -> list:
+        """
+        Return [key, digest] of every contact or note in the given leaves.
+        """
+        tree = self._tree(kind)
+        with self.book.lock.read():
+            return [[key, digest] for key, digest in tree.entries(positions).items()]
+
+    def records(self, kind: str, keys: list) -> list:
+        """
+        Return the stored form of the given contacts or notes (None if missing).
+        The version is the one the item is saved with next, so a change not
+        saved yet, or made since the item was last synced, already counts as newer.
+        """
+        found = []
+        with self.book.lock.read():
+            for key in keys:
+                key = _key(kind, key)
+                if kind == "contacts":
+                    item = self.book.data.get(key)
+                    dirty = item is not None and item.dirty
+                    synced = self.book.synced_versions
+                else:
+                    item = self.notes.data.get(key[0], {}).get(key[1])
+                    dirty = key in self.notes.dirty
+                    synced = self.notes.synced_versions
+                if item is None:
+                    found.append(None)
+                    continue
+                data = item.to_dict()
+                data["version"] = max(item.version + dirty, synced_floor(synced, key, item))
+                found.append(data)
+        return found
+
+    def apply(self, kind: str, items: list) -> list:
+        """
+        Take [key, expected digest, stored form] items from the other copy.
+        An item whose digest here is no longer the expected one (None for a
+        missing item) changed during the sync and is skipped.
+        Returns the keys of the skipped items.
+        """
+        tree = self._tree(kind)
+        skipped = []
+        with self.book.lock.write():
+            for key, expected, data in items:
+                key = _key(kind, key)
+                if tree.get(key) != expected:
+                    skipped.append(key)
+                elif kind == "contacts":
+                    self.book.take_synced(key, data)
+                else:
+                    self.notes.take_synced(key[0], key[1], data)
+        return skipped
+
+    def sent(self, kind: str, items: list):
+        """
+        Remember [key, digest, version] of items the other copy took, so a
+        change made here later is newer than what it holds.
+        """
+        synced = self.book.synced_versions if kind == "contacts" else self.notes.synced_versions
+        with self.book.lock.write():
+            for key, digest, version in items:
+                synced[_key(kind, key)] = (version, digest)
+
+
+class RemotePeer:
+    """
+    The copy of the data held by a running bot server, asked over one
+    connection with {"sync": method, "args": {...}} requests.
+    """
+    def __init__(self, host: str = SERVER_HOST, port: int = SERVER_PORT, socket_path: str = None):
+        """
+        Connect to the server. Raises OSError if it cannot be reached.
+        """
+        self.connection = connect(host, port, socket_path)
+        self.stream = self.connection.makefile("rwb")
+
+    def _request(self, method: str, **args):
+        """
+        Send one sync request and return its result.
+        """
+        self.stream.write(json.dumps({"sync": method, "args": args}).encode("utf-8") + b"\n")
+        self.stream.flush()
+        line = self.stream.readline()
+        if not line:
+            raise ConnectionError("The bot server closed the connection")
+        response = json.loads(line)
+        if not response.get("ok"):
+            raise ValueError(f"The bot server refused to sync: {response.get('error')}")
+        return response["result"]
+
+    def shape(self) -> list:
+        return self._request("shape")
+
+    def digests(self, kind: str, level: int, positions: list) -> list:
+        return self._request("digests", kind=kind, level=level, positions=positions)
+
+    def entries(self, kind: str, positions: list) -> list:
+        return [[_key(kind, key), digest]
+                for key, digest in self._request("entries", kind=kind, positions=positions)]
+
+    def records(self, kind: str, keys: list) -> list:
+        return self._request("records", kind=kind, keys=keys)
+
+    def apply(self, kind: str, items: list) -> list:
+        return [_key(kind, key) for key in self._request("apply", kind=kind, items=items)]
+
+    def close(self):
+        self.stream.close()
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _differing_entries(local, remote, kind: str, fanout: int, depth: int) -> tuple:
+    """
+    Walk down both hash trees level by level, only into nodes whose digests
+    differ, and return the ({key: digest}, {key: digest}) entries of the
+    leaves that differ on the local and the remote side.
+    """
+    positions = [0]
+    for level in range(depth + 1):
+        mine = local.digests(kind, level, positions)
+        theirs = remote.digests(kind, level, positions)
+        positions = [position for position, a, b in zip(positions, mine, theirs) if a != b]
+        if not positions:
+            return {}, {}
+        if level < depth:
+            positions = [position * fanout + child for position in positions for child in range(fanout)]
+    return dict(local.entries(kind, positions)), dict(remote.entries(kind, positions))
+
+
+def sync_copies(local, remote) -> tuple:
+    """
+    Make two copies of the data hold the same contacts and notes, exchanging
+    only the items that differ. An item missing on one side is copied there;
+    otherwise the side with the higher version wins. Items changed on both
+    sides to the same version are conflicts: each side keeps its own.
+    Both sides remember the version of every item exchanged, so a later
+    change on either side counts as newer on the next sync.
+    Deleting is not synced: an item deleted in one copy only comes back.
+    Returns (messages, conflicts).
+    """
+    fanout, depth = local.shape()
+    if remote.shape() != [fanout, depth]:
+        raise ValueError("The other copy uses a different sync tree shape (SYNC_TREE_FANOUT, SYNC_TREE_DEPTH)")
+
+    messages, conflicts = [], []
+    for kind in KINDS:
+        mine, theirs = _differing_entries(local, remote, kind, fanout, depth)
+        keys = sorted(key for key in mine.keys() | theirs.keys() if mine.get(key) != theirs.get(key))
+        if not keys:
+            continue
+        local_records = local.records(kind, keys)
+        remote_records = remote.records(kind, keys)
+
+        taken, sent = [], []
+        for key, ours, other in zip(keys, local_records, remote_records):
+            if other is None and ours is None:
+                continue
+            if ours is None or (other is not None and other["version"] > ours["version"]):
+                taken.append([key, mine.get(key), other])
+            elif other is None or ours["version"] > other["version"]:
+                sent.append([key, theirs.get(key), ours])
+            else:
+                conflicts.append(f"{_describe(kind, key)} was changed in both copies, each kept its version.")
+
+        not_taken = local.apply(kind, taken) if taken else []
+        not_sent = remote.apply(kind, sent) if sent else []
+        conflicts += [f"{_describe(kind, key)} changed during the sync, it was not updated."
+                      for key in not_taken + not_sent]
+        local.sent(kind, [[key, mine.get(key), data["version"]] for key, _, data in sent if key not in not_sent])
+        messages.append(f"{kind.capitalize()}: {len(taken)} taken, {len(sent)} sent.")
+    return messages, conflicts
+
+
+def sync_with_directory(book: AddressBook, notes: Notes, directory: Path) -> tuple:
+    """
+    Sync the loaded data with the data directory of another copy, then
+    save that copy. Returns (messages, conflicts) like sync_copies.
+    """
+    other_book = load_from_json('users.json', USERS_DATA, directory)
+    other_notes = load_notes(directory)
+    messages, conflicts = sync_copies(LocalPeer(book, notes), LocalPeer(other_book, other_notes))
+    conflicts += save_to_json(other_book, 'users.json', directory) + save_notes(other_notes)
+    return messages, conflicts
+
+
+def sync_with_server(book: AddressBook, notes: Notes, host: str = SERVER_HOST, port: int = SERVER_PORT,
+                     socket_path: str = None) -> tuple:
+    """
+    Sync the loaded data with the data of a running bot server.
+    Returns (messages, conflicts) like sync_copies.
+    """
+    with RemotePeer(host, port, socket_path) as remote:
+        return sync_copies(LocalPeer(book, notes), remote)
@@ -1,5 +1,8 @@
+import sys
+
 from colorama import Fore, init
 from bot.constants import HELP_MESSAGES, MAIN_HELP_TEXT
+from bot.result import Result
 
 def parse_input(user_input: str):
     """
@@ -10,21 +13,29 @@ def parse_input(user_input: str):
     cmd = cmd.strip().lower()
     return cmd, *args
 
+def help_result(args) -> Result:
+    """
+    Return the main help menu, or the help of the command named in args.
+    The text is shown as it is written; for JSON output every command is
+    a row holding its name and help.
+    """
+    if not args:
+        rows = [{"command": name, "help": text.strip()} for name, text in HELP_MESSAGES.items()]
+        return Result.info(MAIN_HELP_TEXT, rows=rows, formatter=None)
+    cmd = args[0].lower()
+    message = HELP_MESSAGES.get(cmd)
+    if message is None:
+        return Result.warning(f"No help available for '{cmd}'.")
+    return Result.info(message, rows=[{"command": cmd, "help": message.strip()}], formatter=None)
+
+
 def print_help(args):
     """
     Print help text for a specific command or show full help.
     If no args are provided, prints the main help menu; otherwise prints
     command-specific help if available.
     """
-    if not args:
-        print(MAIN_HELP_TEXT)
-        return
-    cmd = args[0].lower()
-    message = HELP_MESSAGES.get(cmd)
-    if message:
-        print(message)
-    else:
-        print(f"No help available for '{cmd}'.")
+    print(help_result(args))
 
 
 init(autoreset=True)
@@ -70,18 +81,13 @@ class Log:
     def error(cls, message):
         cls._print(message, "error")
 
-def log_result(result: str):
-    text = result.lower()
-
-    error_keywords = ["error"]
-    warning_keywords = ["not found", "unknown", "please", "invalid", "not exist"]
-    info_keywords = ["sorry"]
-
-    if any(word in text for word in error_keywords):
-        Log.error(result)
-    elif any(word in text for word in warning_keywords):
-        Log.warning(result)
-    elif any(word in text for word in info_keywords):
-        Log.info(result)
-    else:
-        Log.success(result)
\ No newline at end of file
+def log_result(result, json_output: bool = False):
+    """
+    Print a command result in the color of its severity,
+    or as JSON lines (one per row) in JSON output mode.
+    """
+    if json_output:
+        sys.stdout.writelines(result.ndjson_lines())
+        sys.stdout.flush()
+        return
+    getattr(Log, result.severity)(str(result))
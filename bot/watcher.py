@@ -0,0 +1,142 @@
+import ctypes
+import ctypes.util
+import os
+from pathlib import Path
+import select
+import struct
+import threading
+
+from bot.constants import WATCH_DEBOUNCE, WATCH_POLL_INTERVAL
+
+# inotify(7) flags
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+IN_DELETE = 0x200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+INOTIFY_EVENT = struct.Struct("iIII")
+
+
+def load_inotify():
+    """
+    Return libc if it provides inotify (Linux), otherwise None.
+    """
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError, TypeError):
+        return None
+    return libc
+
+
+class DataWatcher:
+    """
+    Watches data directories for JSON files changed by other processes.
+    Uses inotify where available and compares file modification times
+    otherwise. Changes are collected for a short moment, so one save that
+    touches several files results in a single callback.
+    """
+    def __init__(self, directories, on_change, interval: float = WATCH_POLL_INTERVAL):
+        """
+        Watch the given directories; on_change is called from the watcher
+        thread with the set of changed or deleted '*.json' paths.
+        """
+        self.directories = [Path(directory) for directory in directories]
+        self.on_change = on_change
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def _is_data_file(self, path: Path) -> bool:
+        # Temporary and lock files come and go with every save
+        return path.suffix == ".json"
+
+    def _scan(self) -> dict:
+        """
+        Return (modification time, size) of every data file.
+        """
+        state = {}
+        for directory in self.directories:
+            if not directory.is_dir():
+                continue
+            for path in directory.iterdir():
+                if self._is_data_file(path):
+                    try:
+                        stat = path.stat()
+                    except FileNotFoundError:
+                        continue
+                    state[path] = (stat.st_mtime_ns, stat.st_size)
+        return state
+
+    def _poll(self):
+        """
+        Detect changes by comparing file times and sizes every interval.
+        """
+        state = self._scan()
+        while not self.stopped.wait(self.interval):
+            current = self._scan()
+            changed = {path for path in state.keys() | current.keys() if state.get(path) != current.get(path)}
+            state = current
+            if changed:
+                self.on_change(changed)
+
+    def _watch(self, libc):
+        """
+        Wait for inotify events and report the changed files.
+        """
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            return self._poll()
+        try:
+            watches = {}
+            for directory in self.directories:
+                directory.mkdir(exist_ok=True, parents=True)
+                wd = libc.inotify_add_watch(fd, str(directory).encode(),
+                                            IN_CLOSE_WRITE | IN_MOVED_TO | IN_DELETE)
+                if wd >= 0:
+                    watches[wd] = directory
+
+            changed = set()
+            while not self.stopped.is_set():
+                # Wait for the first event, then a moment more to collect the rest
+                timeout = WATCH_DEBOUNCE if changed else self.interval
+                if not select.select([fd], [], [], timeout)[0]:
+                    if changed:
+                        self.on_change(changed)
+                        changed = set()
+                    continue
+                data = os.read(fd, 64 * 1024)
+                offset = 0
+                while offset < len(data):
+                    wd, _, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+                    offset += INOTIFY_EVENT.size
+                    name = data[offset:offset + length].rstrip(b"\0").decode()
+                    offset += length
+                    if wd in watches and name:
+                        path = watches[wd] / name
+                        if self._is_data_file(path):
+                            changed.add(path)
+        finally:
+            os.close(fd)
+
+    def run(self):
+        """
+        Watch until stopped.
+        """
+        libc = load_inotify()
+        if libc is None:
+            self._poll()
+        else:
+            self._watch(libc)
+
+    def start(self):
+        """
+        Run the watcher in a background daemon thread.
+        """
+        threading.Thread(target=self.run, name="data-watcher", daemon=True).start()
+
+    def stop(self):
+        """
+        Stop the background thread.
+        """
+        self.stopped.set()
@@ -1,9 +1,48 @@
 """
 App entry point.
 Loads and starts the interactive Personal Assistant bot when executed directly.
+Use `serve` to run the bot as a server and `client` to send it a command.
+With `--json` (or `--ndjson`) results are printed as one JSON object per line,
+and `--profile` selects the address book to start with.
 """
 
-from bot import run_bot
+import argparse
+
+from bot import run_bot, run_client, run_server
+from bot.constants import DEFAULT_PROFILE, SERVER_HOST, SERVER_PORT
+
+
+def parse_args():
+    """
+    Parse command line options for the interactive, server and client modes.
+    """
+    parser = argparse.ArgumentParser(description="Personal Assistant bot")
+    json_help = "print results as JSON lines, one object per contact or note"
+    parser.add_argument("--json", "--ndjson", dest="json_output", action="store_true", help=json_help)
+    parser.add_argument("--profile", default=DEFAULT_PROFILE, type=str.lower,
+                        help="address book (profile) to use, see the 'use' command")
+    subparsers = parser.add_subparsers(dest="mode")
+
+    for name in ("serve", "client"):
+        subparser = subparsers.add_parser(name)
+        subparser.add_argument("--host", default=SERVER_HOST)
+        subparser.add_argument("--port", type=int, default=SERVER_PORT)
+        subparser.add_argument("--socket", help="Unix socket path instead of TCP")
+        if name == "client":
+            # Also accepted after 'client'; SUPPRESS keeps a flag given before it
+            subparser.add_argument("--json", "--ndjson", dest="json_output", action="store_true",
+                                   default=argparse.SUPPRESS, help=json_help)
+            subparser.add_argument("command", nargs=argparse.REMAINDER)
+
+    return parser.parse_args()
+
 
 if __name__ == "__main__":
-    run_bot()
+    options = parse_args()
+    if options.mode == "serve":
+        run_server(options.host, options.port, options.socket, options.profile)
+    elif options.mode == "client":
+        run_client(" ".join(options.command), options.host, options.port, options.socket,
+                   options.json_output)
+    else:
+        run_bot(options.json_output, options.profile)